@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import random, timeit
+
+NB_ROWS  = 50000
+NB_ITERS = 3
+
+# Rows look like the ones of the tracklist: (number, title, artist, album, length)
+(ROW_NUM, ROW_TIT, ROW_ART, ROW_ALB, ROW_LEN) = range(5)
+
+ROWS     = []
+CRITERIA = (ROW_ART, ROW_ALB, ROW_NUM, ROW_TIT)   # Sorting by artist
+
+random.seed(0)
+for i in xrange(NB_ROWS):
+    artist = 'Artist %u' % random.randint(0, NB_ROWS / 100)
+    album  = 'Album %u'  % random.randint(0, 10)
+    ROWS.append((random.randint(1, 20), 'Title %u' % random.randint(0, NB_ROWS), artist, album, random.randint(60, 600)))
+
+# ---
+
+def cmpRows(row1, row2, criteria, ascending):
+    criterion = criteria[0]
+    result    = cmp(row1[criterion], row2[criterion])
+
+    if result != 0:
+        if ascending: return result
+        else:         return -result
+
+    for criterion in criteria[1:]:
+        result = cmp(row1[criterion], row2[criterion])
+
+        if result != 0:
+            return result
+
+    return 0
+
+
+def withCmp(ascending):
+    rows = [r + (i,) for i, r in enumerate(ROWS)]
+    rows.sort(lambda r1, r2: cmpRows(r1, r2, CRITERIA, ascending))
+    return [r[-1] for r in rows]
+
+# ---
+
+def withKeys(ascending):
+    keys  = [[row[criterion] for row in ROWS] for criterion in CRITERIA]
+    order = range(len(ROWS))
+
+    if len(keys) == 2:  order.sort(key = keys[1].__getitem__)
+    elif len(keys) > 2: order.sort(key = zip(*keys[1:]).__getitem__)
+
+    order.sort(key = keys[0].__getitem__, reverse = not ascending)
+    return order
+
+# ---
+
+assert withCmp(True)  == withKeys(True)
+assert withCmp(False) == withKeys(False)
+
+t1 = timeit.Timer('withCmp(True)',   'from __main__ import withCmp')
+t2 = timeit.Timer('withKeys(True)',  'from __main__ import withKeys')
+t3 = timeit.Timer('withCmp(False)',  'from __main__ import withCmp')
+t4 = timeit.Timer('withKeys(False)', 'from __main__ import withKeys')
+
+print
+print 'Sorting %u rows on four criteria (ascending)' % NB_ROWS
+print ' * with a comparison function:', t1.timeit(NB_ITERS)
+print ' * with keys:                 ', t2.timeit(NB_ITERS)
+
+print
+print 'Sorting %u rows on four criteria (descending)' % NB_ROWS
+print ' * with a comparison function:', t3.timeit(NB_ITERS)
+print ' * with keys:                 ', t4.timeit(NB_ITERS)
@@ -123,6 +123,10 @@ def getAuthInfo(id, reason, defaultLogin=None, force=False, parent=None):
         if authInfo is not None:
             return authInfo
 
+    # No way to ask the user without a GUI
+    if prefs.isHeadless():
+        return None
+
     if mAuthDlg is None:
         wTree      = tools.loadGladeFile('Authentication.ui')
         mBtnOk     = wTree.get_object('btn-ok')
@@ -16,7 +16,19 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 #
-# ExtListView v1.8
+# ExtListView v1.9
+#
+# v1.9:
+#   * Added ExtList, a list without any view providing the same content API (e.g., for an application without any display)
+#   * Rows have a stable identifier, the mark is found again with an identifier to index map instead of a linear search
+#   * Lists may be given a key function, rows can then be found by key (e.g., the URI of a track) without any linear search
+#   * Added the 'extlistview-reordered' signal, and the reorderRows() and getSelectedRowsIndexes() methods
+#   * Lists may be given a tokens function, rows can then be filtered by words using an index of the tokens (see setFilter())
+#   * Integers given to methods are always indexes in the list, while tuples and strings are paths of the view (they differ when filtering)
+#   * Rows are stored in a virtual model (ExtListModel) instead of a gtk.ListStore
+#   * Lists may be given getters, in which case rows are objects (e.g., tracks) and column values are computed only when needed
+#   * Much faster sorting: keys are extracted only once, no more comparison function
+#   * Inserting a lot of rows detaches the model, the selection and the visible rows are then restored
 #
 # v1.8:
 #   * Added an __iter__ method
@@ -57,10 +69,10 @@
 #   * Added a call to set_cursor() when unselecting all rows upon clicking on the empty area
 #   * Sort indicators are now displayed whenever needed
 
-import random
+import bisect, collections, itertools, random
 import gtk
 from gtk     import gdk
-from gobject import signal_new, TYPE_INT, TYPE_STRING, TYPE_BOOLEAN, \
+from gobject import GObject, signal_new, TYPE_INT, TYPE_STRING, TYPE_BOOLEAN, \
     TYPE_PYOBJECT, TYPE_NONE, SIGNAL_RUN_LAST
 
 
@@ -70,6 +82,21 @@ DND_INTERNAL_TARGET = (
     'extListview-internal', gtk.TARGET_SAME_WIDGET, DND_REORDERING_ID)
 
 
+# A record of the model
+(
+    REC_DATA,       # The row itself, or the object given to getters for virtual lists
+    REC_MARK,       # True if this is the marked row
+    REC_VALUES,     # Cached column values (virtual lists only)
+    REC_OVERRIDES,  # Values set with setValue(), that getters must not override (virtual lists only)
+    REC_ID,         # Stable identifier of the row, never reused
+) = range(5)
+
+
+# Constants
+CACHE_SIZE            = 512    # How many rows of a virtual list have their values cached (about as many as the visible ones)
+BULK_INSERT_THRESHOLD = 1000   # Above this number of rows, the model is detached while inserting them instead of notifying the view of each row
+
+
 # Custom signals
 signal_new('extlistview-dnd', gtk.TreeView, SIGNAL_RUN_LAST, TYPE_NONE, (gdk.DragContext, TYPE_INT, TYPE_INT, gtk.SelectionData, TYPE_INT, TYPE_PYOBJECT))
 signal_new('extlistview-modified', gtk.TreeView, SIGNAL_RUN_LAST, TYPE_NONE, ())
@@ -77,6 +104,7 @@ signal_new('extlistview-button-pressed', gtk.TreeView, SIGNAL_RUN_LAST, TYPE_NON
 signal_new('extlistview-column-visibility-changed', gtk.TreeView, SIGNAL_RUN_LAST, TYPE_NONE, (TYPE_STRING, TYPE_BOOLEAN))
 signal_new('button-press-event', gtk.TreeViewColumn, SIGNAL_RUN_LAST, TYPE_NONE, (gdk.Event, ))
 signal_new('extlistview-selection-changed', gtk.TreeView, SIGNAL_RUN_LAST, TYPE_NONE, (TYPE_PYOBJECT, ))
+signal_new('extlistview-reordered', gtk.TreeView, SIGNAL_RUN_LAST, TYPE_NONE, (TYPE_PYOBJECT, ))
 
 
 class ExtListViewColumn(gtk.TreeViewColumn):
@@ -108,10 +136,637 @@ class ExtListViewColumn(gtk.TreeViewColumn):
         self.emit('button-press-event', event)
 
 
+class ExtListModel(gtk.GenericTreeModel):
+    """
+        A list model storing rows in a Python list, referenced by their index
+
+        If getters is None, rows are lists of values as with a gtk.ListStore
+        Otherwise, rows are arbitrary objects, and getters[i](object) gives the value of the i-th column
+        Values are then computed only when needed, and cached for the most recently displayed rows
+
+        Each row has a stable identifier, mapped to its current index (the map is rebuilt only when needed after a structural change)
+        If key is not None, key(object) is the key of a row (e.g., a URI), and rows can be found by key
+        If tokens is not None, tokens(object) is the list of the lower case tokens of a row, and rows can be searched with words
+    """
+
+    def __init__(self, dataTypes, getters=None, key=None, tokens=None):
+        """ Constructor, the last data type is the one of the mark """
+        gtk.GenericTreeModel.__init__(self)
+
+        self.key        = key
+        self.words      = None   # The words of the current query, None if there is none
+        self.tokens     = tokens
+        self.matches    = None   # The identifiers of the rows matching the current query
+        self.tokenIndex = {}     # For each token, the identifiers of the rows with this token
+        self.tokenList  = []     # All the tokens, sorted to find those starting with a given word
+        self.cache      = collections.deque()
+        self.nextId     = itertools.count()
+        self.getters    = getters
+        self.records    = []
+        self.markedId   = None
+        self.keyIndex   = {}     # For each key, the identifiers of the rows with this key
+        self.positions  = {}     # For each identifier, the index of the row (None when it must be rebuilt)
+        self.dataTypes  = dataTypes
+        self.markColumn = len(dataTypes) - 1
+
+
+    def __computeValues(self, record):
+        """ Return the values of the given record of a virtual list """
+        values = [getter(record[REC_DATA]) for getter in self.getters]
+
+        if record[REC_OVERRIDES] is not None:
+            for (column, value) in record[REC_OVERRIDES].iteritems():
+                values[column] = value
+
+        return values
+
+
+    def __getValues(self, record, cache):
+        """ Return the values of the given record, cache them if needed """
+        if self.getters is None:
+            return record[REC_DATA]
+
+        if record[REC_VALUES] is not None:
+            return record[REC_VALUES]
+
+        values = self.__computeValues(record)
+
+        if cache:
+            record[REC_VALUES] = values
+            self.cache.append(record)
+
+            if len(self.cache) > CACHE_SIZE:
+                self.cache.popleft()[REC_VALUES] = None
+
+        return values
+
+
+    def __getKey(self, record):
+        """ Return the key of the given record """
+        if self.getters is None: return self.key(tuple(record[REC_DATA]))
+        else:                    return self.key(record[REC_DATA])
+
+
+    def __getTokens(self, record):
+        """ Return the distinct tokens of the given record """
+        if self.getters is None: return set(self.tokens(tuple(record[REC_DATA])))
+        else:                    return set(self.tokens(record[REC_DATA]))
+
+
+    def __indexRecords(self, records):
+        """ Add the given records to the key and token indexes """
+        for record in records:
+            if self.key is not None:
+                self.keyIndex.setdefault(self.__getKey(record), set()).add(record[REC_ID])
+
+            if self.tokens is not None:
+                for token in self.__getTokens(record):
+                    if token not in self.tokenIndex:
+                        self.tokenIndex[token] = set()
+                        bisect.insort(self.tokenList, token)
+
+                    self.tokenIndex[token].add(record[REC_ID])
+
+
+    def __unindexRecords(self, records):
+        """ Remove the given records from the key and token indexes """
+        for record in records:
+            if self.key is not None:
+                key = self.__getKey(record)
+                ids = self.keyIndex[key]
+
+                ids.discard(record[REC_ID])
+                if len(ids) == 0:
+                    del self.keyIndex[key]
+
+            if self.tokens is not None:
+                for token in self.__getTokens(record):
+                    ids = self.tokenIndex[token]
+
+                    ids.discard(record[REC_ID])
+                    if len(ids) == 0:
+                        del self.tokenIndex[token]
+                        del self.tokenList[bisect.bisect_left(self.tokenList, token)]
+
+
+    def __isMatching(self, record, words):
+        """ Return whether each of the given words starts a token of the given record """
+        tokens = self.__getTokens(record)
+
+        for word in words:
+            for token in tokens:
+                if token.startswith(word):
+                    break
+            else:
+                return False
+
+        return True
+
+
+    # --== Row identifiers ==--
+
+
+    def getId(self, index):
+        """ Return the identifier of the given row """
+        return self.records[index][REC_ID]
+
+
+    def getIndexOf(self, rowId):
+        """ Return the index of the row with the given identifier, None if there is no such row """
+        if self.positions is None:
+            self.positions = dict([(record[REC_ID], index) for (index, record) in enumerate(self.records)])
+
+        return self.positions.get(rowId)
+
+
+    def findByKey(self, key):
+        """ Return the sorted indexes of the rows with the given key """
+        return sorted([self.getIndexOf(rowId) for rowId in self.keyIndex.get(key, ())])
+
+
+    # --== Searching ==--
+
+
+    def search(self, words):
+        """ Return the identifiers of the rows such that each of the given words starts one of their tokens """
+        matches = None
+
+        for word in words:
+            ids   = set()
+            index = bisect.bisect_left(self.tokenList, word)
+
+            # Tokens starting with word follow each other in the sorted list
+            while index < len(self.tokenList) and self.tokenList[index].startswith(word):
+                ids   |= self.tokenIndex[self.tokenList[index]]
+                index += 1
+
+            if matches is None: matches = ids
+            else:               matches = matches & ids
+
+        return matches
+
+
+    def hasQuery(self):
+        """ Return whether there is a current query (some rows may then be hidden) """
+        return self.words is not None
+
+
+    def setQuery(self, words):
+        """ Set the words that rows must match to be visible, all rows are visible if words is None """
+        self.words = words
+
+        if words is None: self.matches = None
+        else:             self.matches = self.search(words)
+
+
+    def isVisible(self, index):
+        """ Return whether the given row matches the current query """
+        return self.matches is None or self.records[index][REC_ID] in self.matches
+
+
+    # --== Content ==--
+
+
+    def __len__(self):
+        """ Return the number of rows """
+        return len(self.records)
+
+
+    def getRow(self, index):
+        """ Return the values of the given row, without the mark """
+        return tuple(self.__getValues(self.records[index], False))
+
+
+    def iterRows(self):
+        """ Iterate on the values of all rows, without the mark """
+        for record in self.records:
+            yield tuple(self.__getValues(record, False))
+
+
+    def getData(self, index):
+        """ Return the object stored for the given row (the row itself if the list is not virtual) """
+        return self.records[index][REC_DATA]
+
+
+    def getColumn(self, column):
+        """ Return the values of the given column for all rows """
+        if self.getters is None:
+            return [record[REC_DATA][column] for record in self.records]
+
+        getter = self.getters[column]
+        values = [getter(record[REC_DATA]) for record in self.records]
+
+        for (index, record) in enumerate(self.records):
+            if record[REC_OVERRIDES] is not None and column in record[REC_OVERRIDES]:
+                values[index] = record[REC_OVERRIDES][column]
+
+        return values
+
+
+    def getValue(self, index, column):
+        """ Return the value of the given item """
+        record = self.records[index]
+
+        if   column == self.markColumn:         return record[REC_MARK]
+        elif self.getters is None:              return record[REC_DATA][column]
+        elif record[REC_VALUES]    is not None: return record[REC_VALUES][column]
+        elif record[REC_OVERRIDES] is not None: return self.__computeValues(record)[column]
+        else:                                   return self.getters[column](record[REC_DATA])
+
+
+    def setValue(self, index, column, value):
+        """ Change the value of the given item """
+        record = self.records[index]
+
+        if column == self.markColumn:
+            record[REC_MARK] = value
+
+            if value:                             self.markedId = record[REC_ID]
+            elif self.markedId == record[REC_ID]: self.markedId = None
+        elif self.getters is None:
+            record[REC_DATA][column] = value
+        else:
+            if record[REC_OVERRIDES] is None: record[REC_OVERRIDES] = {column: value}
+            else:                             record[REC_OVERRIDES][column] = value
+
+            if record[REC_VALUES] is not None:
+                record[REC_VALUES][column] = value
+
+        self.row_changed((index,), self.get_iter((index,)))
+
+
+    def getMarkedIndex(self):
+        """ Return the index of the marked row, None if there is none """
+        if self.markedId is None: return None
+        else:                     return self.getIndexOf(self.markedId)
+
+
+    # --== Structure ==--
+
+
+    def clear(self, notify):
+        """ Remove all rows, notify is False when the model is not attached to a view """
+        nbRows          = len(self.records)
+        self.records    = []
+        self.markedId   = None
+        self.keyIndex   = {}
+        self.positions  = {}
+        self.tokenList  = []
+        self.tokenIndex = {}
+        self.cache.clear()
+
+        if self.matches is not None:
+            self.matches = set()
+        self.invalidate_iters()
+
+        if notify:
+            for index in xrange(nbRows-1, -1, -1):
+                self.row_deleted((index,))
+
+
+    def insert(self, position, rows, notify):
+        """ Insert the given rows before position (append them if position is None) """
+        if position is None:
+            position = len(self.records)
+
+        if self.getters is None: records = [[list(row), False, None, None, self.nextId.next()] for row in rows]
+        else:                    records = [[row,       False, None, None, self.nextId.next()] for row in rows]
+
+        # Appended rows don't move the other ones, so the map of identifiers can be kept
+        if self.positions is not None and position == len(self.records):
+            for (index, record) in enumerate(records):
+                self.positions[record[REC_ID]] = position + index
+        else:
+            self.positions = None
+
+        if self.key is not None or self.tokens is not None:
+            self.__indexRecords(records)
+
+        # New rows must be visible if they match the current query
+        if self.matches is not None:
+            self.matches.update([record[REC_ID] for record in records if self.__isMatching(record, self.words)])
+
+        self.records[position:position] = records
+        self.invalidate_iters()
+
+        if notify:
+            for index in xrange(position, position + len(rows)):
+                self.row_inserted((index,), self.get_iter((index,)))
+
+
+    def remove(self, indexes, notify):
+        """ Remove the rows at the given indexes """
+        removed = set(indexes)
+
+        if self.key is not None or self.tokens is not None:
+            self.__unindexRecords([self.records[index] for index in removed])
+
+        if self.markedId is not None and self.getIndexOf(self.markedId) in removed:
+            self.markedId = None
+
+        self.records   = [record for (index, record) in enumerate(self.records) if index not in removed]
+        self.positions = None
+        self.invalidate_iters()
+
+        if notify:
+            for index in sorted(removed, reverse=True):
+                self.row_deleted((index,))
+
+
+    def reorder(self, newOrder):
+        """ Reorder the rows, newOrder[i] being the previous index of the row that is now at index i """
+        self.records   = [self.records[index] for index in newOrder]
+        self.positions = None
+        self.invalidate_iters()
+        self.rows_reordered(None, None, newOrder)
+
+
+    # --== gtk.GenericTreeModel interface ==--
+
+
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY
+
+
+    def on_get_n_columns(self):
+        return len(self.dataTypes)
+
+
+    def on_get_column_type(self, column):
+        return self.dataTypes[column]
+
+
+    def on_get_iter(self, path):
+        if path[0] < len(self.records): return path[0]
+        else:                           return None
+
+
+    def on_get_path(self, rowref):
+        return (rowref, )
+
+
+    def on_get_value(self, rowref, column):
+        record = self.records[rowref]
+
+        if column == self.markColumn: return record[REC_MARK]
+        else:                         return self.__getValues(record, True)[column]
+
+
+    def on_iter_next(self, rowref):
+        if rowref + 1 < len(self.records): return rowref + 1
+        else:                              return None
+
+
+    def on_iter_children(self, parent):
+        if parent is None and len(self.records) != 0: return 0
+        else:                                         return None
+
+
+    def on_iter_has_child(self, rowref):
+        return False
+
+
+    def on_iter_n_children(self, rowref):
+        if rowref is None: return len(self.records)
+        else:              return 0
+
+
+    def on_iter_nth_child(self, parent, n):
+        if parent is None and n < len(self.records): return n
+        else:                                        return None
+
+
+    def on_iter_parent(self, child):
+        return None
+
+
+class ExtList(GObject):
+    """
+        A list without any view, providing the same content API as ExtListView (e.g., for an application without any display)
+        Nothing can be selected, sorted, or filtered, and rows are always designated by their index
+    """
+
+    __gsignals__ = {
+        'extlistview-modified':  (SIGNAL_RUN_LAST, TYPE_NONE, ()),
+        'extlistview-reordered': (SIGNAL_RUN_LAST, TYPE_NONE, (TYPE_PYOBJECT, )),
+    }
+
+
+    def __init__(self, dataTypes, getters=None, key=None, tokens=None):
+        """ The parameters getters, key and tokens have the same meaning as for ExtListView, dataTypes are the types of the columns """
+        GObject.__init__(self)
+
+        self.markedRow  = None
+        self.markColumn = len(dataTypes)
+        self.store      = ExtListModel(list(dataTypes) + [TYPE_BOOLEAN], getters, key, tokens)
+
+
+    # --== Mark management ==--
+
+
+    def hasMark(self):
+        """ True if a mark has been set """
+        return self.markedRow is not None
+
+
+    def hasMarkAbove(self, index):
+        """ True if a mark is set and is above the given index """
+        return self.markedRow is not None and self.markedRow > index
+
+
+    def hasMarkUnder(self, index):
+        """ True if a mark is set and is undex the given index """
+        return self.markedRow is not None and self.markedRow < index
+
+
+    def clearMark(self):
+        """ Remove the mark """
+        if self.markedRow is not None:
+            self.setItem(self.markedRow, self.markColumn, False)
+            self.markedRow = None
+
+
+    def getMark(self):
+        """ Return the index of the marked row """
+        return self.markedRow
+
+
+    def setMark(self, rowIndex):
+        """ Put the mark on the given row, it will move with the row itself """
+        self.clearMark()
+        self.markedRow = rowIndex
+        self.setItem(rowIndex, self.markColumn, True)
+
+
+    # --== Selection, there is none without a view ==--
+
+
+    def unselectAll(self):
+        """ Unselect all rows """
+        pass
+
+
+    def selectAll(self):
+        """ Select all rows """
+        pass
+
+
+    def getSelectedRowsCount(self):
+        """ Return how many rows are currently selected """
+        return 0
+
+
+    def getSelectedRowsIndexes(self):
+        """ Return the sorted indexes of the selected rows """
+        return []
+
+
+    def scrollToRow(self, rowIndex, alignTop=False):
+        """ Scroll to the given row """
+        pass
+
+
+    # --== Retrieving content / Iterating on content ==--
+
+
+    def __len__(self):
+        """ Return how many rows are stored in the list """
+        return len(self.store)
+
+
+    def getCount(self):
+        """ Return how many rows are stored in the list """
+        return len(self.store)
+
+
+    def __iter__(self):
+        """ Iterate on all rows """
+        return self.store.iterRows()
+
+
+    def iterAllRows(self):
+        """ Iterate on all rows """
+        return self.store.iterRows()
+
+
+    def getRow(self, rowIndex):
+        """ Return the given row """
+        return self.store.getRow(rowIndex)
+
+
+    def getAllRows(self):
+        """ Return all rows """
+        return list(self.store.iterRows())
+
+
+    def getItem(self, rowIndex, colIndex):
+        """ Return the value of the given item """
+        return self.store.getValue(rowIndex, colIndex)
+
+
+    def getData(self, rowIndex):
+        """ Return the object stored for the given row of a virtual list """
+        return self.store.getData(rowIndex)
+
+
+    def getAllData(self):
+        """ Return the objects stored in a virtual list """
+        return [self.store.getData(index) for index in xrange(len(self.store))]
+
+
+    def iterAllData(self):
+        """ Iterate on the objects stored in a virtual list """
+        for index in xrange(len(self.store)):
+            yield self.store.getData(index)
+
+
+    def getRowId(self, rowIndex):
+        """ Return the identifier of the given row, it does not change when rows are moved and is never reused """
+        return self.store.getId(rowIndex)
+
+
+    def getRowIndex(self, rowId):
+        """ Return the current index of the row with the given identifier, None if it has been removed """
+        return self.store.getIndexOf(rowId)
+
+
+    def findRows(self, key):
+        """ Return the sorted indexes of the rows with the given key (the list must have been given a key function) """
+        return self.store.findByKey(key)
+
+
+    # --== Adding/removing/modifying content ==--
+
+
+    def clear(self):
+        """ Remove all rows from the list """
+        self.clearMark()
+        self.store.clear(False)
+        self.emit('extlistview-modified')
+
+
+    def setItem(self, rowIndex, colIndex, value):
+        """ Change the value of the given item """
+        self.store.setValue(rowIndex, colIndex, value)
+
+
+    def removeRows(self, indexes):
+        """ Remove the rows at the given indexes """
+        indexes = sorted(set(indexes))
+
+        if len(indexes) == 0:
+            return
+
+        # Move the mark if needed
+        if self.markedRow is not None:
+            if self.markedRow in indexes: self.markedRow  = None
+            else:                         self.markedRow -= len([index for index in indexes if index < self.markedRow])
+
+        self.store.remove(indexes, False)
+        self.emit('extlistview-modified')
+
+
+    def insertRows(self, rows, position=None):
+        """ Insert or append (if position is None) some rows to the list, rows are objects if the list is virtual """
+        if len(rows) == 0:
+            return
+
+        # Move the mark if needed
+        if self.markedRow is not None and position is not None and position <= self.markedRow:
+            self.markedRow += len(rows)
+
+        self.store.insert(position, rows, False)
+        self.emit('extlistview-modified')
+
+
+    def appendRows(self, rows):
+        """ Helper function, equivalent to insertRows(rows, None) """
+        self.insertRows(rows, None)
+
+
+    def reorderRows(self, newOrder):
+        """ Reorder the rows, newOrder[i] being the current index of the row that must be moved to index i """
+        self.store.reorder(newOrder)
+
+        # Move the mark if needed
+        if self.markedRow is not None:
+            self.markedRow = self.store.getMarkedIndex()
+
+        self.emit('extlistview-reordered', newOrder)
+        self.emit('extlistview-modified')
+
+
+    def shuffle(self):
+        """ Shuffle the content of the list """
+        order = range(len(self.store))
+        random.shuffle(order)
+        self.reorderRows(order)
+
+
 class ExtListView(gtk.TreeView):
 
 
-    def __init__(self, columns, sortable=True, dndTargets=[], useMarkup=False, canShowHideColumns=True):
+    def __init__(self, columns, sortable=True, dndTargets=[], useMarkup=False, canShowHideColumns=True, getters=None, key=None, tokens=None):
         """
             If sortable is True, the user can click on headers to sort the contents of the list
 
@@ -119,6 +774,12 @@ class ExtListView(gtk.TreeView):
             Note that for the latter, the identifier 1024 must not be used (internally used for reordering)
 
             If useMarkup is True, the 'markup' attributes is used instead of 'text' for CellRendererTexts
+
+            If getters is not None, the list is virtual: rows given to insertRows() are objects, and getters[i](object) is the value of the i-th column
+
+            If key is not None, key(row) is the key of a row (key(object) for a virtual list), and findRows() gives the rows with a given key
+
+            If tokens is not None, tokens(row) is the list of the lower case tokens of a row (tokens(object) for a virtual list), used by setFilter()
         """
         gtk.TreeView.__init__(self)
 
@@ -170,8 +831,9 @@ class ExtListView(gtk.TreeView):
         self.markColumn = len(dataTypes)
         dataTypes.append(TYPE_BOOLEAN)     # When there's no other solution, this additional entry helps in finding the marked row
 
-        # Create the ListStore associated with this tree
-        self.store = gtk.ListStore(*dataTypes)
+        # Create the model associated with this tree
+        self.store  = ExtListModel(dataTypes, getters, key, tokens)
+        self.filter = None   # A gtk.TreeModelFilter over the store, None when all rows are visible
         self.set_model(self.store)
 
         # Drag'n'drop management
@@ -201,9 +863,81 @@ class ExtListView(gtk.TreeView):
     # --== Miscellaneous ==--
 
 
-    def __getIterOnSelectedRows(self):
-        """ Return a list of iterators pointing to the selected rows """
-        return [self.store.get_iter(path) for path in self.selection.get_selected_rows()[1]]
+    def __getIndex(self, path):
+        """ Return the index of the row designated by path (an index, or a path of the view given as a tuple or a string) """
+        if isinstance(path, int):
+            return path
+
+        if isinstance(path, str):
+            path = (int(path.split(':')[0]), )
+
+        if self.filter is None: return path[0]
+        else:                   return self.filter.convert_path_to_child_path(path)[0]
+
+
+    def __getPath(self, index):
+        """ Return the path in the view of the row at the given index, None if the row is filtered out """
+        if self.filter is None: return (index, )
+        else:                   return self.filter.convert_child_path_to_path((index, ))
+
+
+    def __getViewModel(self):
+        """ Return the model to be attached to the view: the store, or a filter over it if some rows are filtered out """
+        if not self.store.hasQuery():
+            self.filter = None
+            return self.store
+
+        # The filter must be created again, because the store may have been modified without notifying it
+        self.filter = self.store.filter_new()
+        self.filter.set_visible_func(self.__isRowVisible)
+
+        return self.filter
+
+
+    def __isRowVisible(self, model, iter):
+        """ Visibility function of the filter """
+        return self.store.isVisible(self.store.get_user_data(iter))
+
+
+    def __getSelectedIndexes(self):
+        """ Return the sorted list of the indexes of the selected rows """
+        return [self.__getIndex(path) for path in self.selection.get_selected_rows()[1]]
+
+
+    def __isAttached(self):
+        """ Return whether the model is currently attached to the view (it is not, e.g., while replacing the content) """
+        return self.get_model() is not None
+
+
+    def __detachModel(self):
+        """ Detach the model from the view, return the state (selection, first visible row) needed by __attachModel() """
+        visibleRange = self.get_visible_range()
+
+        if visibleRange is None: firstVisible = None
+        else:                    firstVisible = self.__getIndex(visibleRange[0])
+
+        state = (self.__getSelectedIndexes(), firstVisible)
+
+        self.set_model(None)
+
+        return state
+
+
+    def __attachModel(self, state, shift):
+        """ Attach the model to the view again, shift(index) gives the new index of a row that was at the given index when detaching """
+        (selected, firstVisible) = state
+
+        self.set_model(self.__getViewModel())
+
+        self.selection.handler_block_by_func(self.onSelectionChanged)
+        for index in selected:
+            path = self.__getPath(shift(index))
+            if path is not None:
+                self.selection.select_path(path)
+        self.selection.handler_unblock_by_func(self.onSelectionChanged)
+
+        if firstVisible is not None:
+            self.scrollToRow(shift(firstVisible), True)
 
 
     def __resizeColumns(self):
@@ -217,6 +951,39 @@ class ExtListView(gtk.TreeView):
         self.get_column(colIndex).add_attribute(renderer, attribute, value)
 
 
+    def getIndexFromPath(self, path):
+        """ Return the index of the row designated by the given path of the view """
+        return self.__getIndex(path)
+
+
+    def scrollToRow(self, rowIndex, alignTop=False):
+        """ Scroll to the given row, if it is visible """
+        path = self.__getPath(rowIndex)
+
+        if path is None: return
+        elif alignTop:   self.scroll_to_cell(path, None, True, 0.0, 0.0)
+        else:            self.scroll_to_cell(path)
+
+
+    # --== Filtering ==--
+
+
+    def setFilter(self, text):
+        """ Show only the rows such that each word of text starts one of their tokens, show all rows if text is empty """
+        words = text.lower().split()
+
+        if len(words) == 0:
+            words = None
+
+        # Keep the selection, at least the visible part of it
+        if self.__isAttached():
+            state = self.__detachModel()
+            self.store.setQuery(words)
+            self.__attachModel(state, lambda index: index)
+        else:
+            self.store.setQuery(words)
+
+
     # --== Mark management ==--
 
 
@@ -255,14 +1022,8 @@ class ExtListView(gtk.TreeView):
 
 
     def __findMark(self):
-        """ Linear search for the marked row -- To be used only when there's no other solution """
-        iter = self.store.get_iter_first()
-
-        while iter is not None:
-            if self.store.get_value(iter, self.markColumn) == True:
-                self.markedRow = self.store.get_path(iter)[0]
-                break
-            iter = self.store.iter_next(iter)
+        """ Find the marked row again after the rows have been reordered """
+        self.markedRow = self.store.getMarkedIndex()
 
 
     # --== Sorting content ==--
@@ -275,26 +1036,6 @@ class ExtListView(gtk.TreeView):
             self.sortLastCol = None
 
 
-    def __cmpRows(self, row1, row2, criteria, ascending):
-        """ Compare two rows based on the given criteria, the latter being a tuple of the indexes to use for the comparison """
-        # Sorting on the first criterion may be done either ascending or descending
-        criterion = criteria[0]
-        result    = cmp(row1[criterion], row2[criterion])
-
-        if result != 0:
-            if ascending: return result
-            else:         return -result
-
-        # For subsequent criteria, the order is always ascending
-        for criterion in criteria[1:]:
-            result = cmp(row1[criterion], row2[criterion])
-
-            if result != 0:
-                return result
-
-        return 0
-
-
     def __sortRows(self, column):
         """ Sort the rows """
         if len(self.store) == 0:
@@ -310,11 +1051,17 @@ class ExtListView(gtk.TreeView):
             self.sortLastCol   = column
             self.sortAscending = True
 
-        # Dump the rows, sort them, and reorder the list
-        rows     = [tuple(r) + (i,) for i, r in enumerate(self.store)]
+        # Extract the keys only once, and sort the indexes of the rows
+        # Sorting is stable, so we first sort on subsequent criteria (always ascending), then on the first one (either ascending or descending)
         criteria = self.sortColCriteria[column]
-        rows.sort(lambda r1, r2: self.__cmpRows(r1, r2, criteria, self.sortAscending))
-        self.store.reorder([r[-1] for r in rows])
+        keys     = [self.store.getColumn(criterion) for criterion in criteria]
+        order    = range(len(self.store))
+
+        if len(keys) == 2:  order.sort(key = keys[1].__getitem__)
+        elif len(keys) > 2: order.sort(key = zip(*keys[1:]).__getitem__)
+
+        order.sort(key = keys[0].__getitem__, reverse = not self.sortAscending)
+        self.store.reorder(order)
 
         # Move the mark if needed
         if self.markedRow is not None:
@@ -324,6 +1071,7 @@ class ExtListView(gtk.TreeView):
         if self.sortAscending: column.set_sort_order(gtk.SORT_ASCENDING)
         else:                  column.set_sort_order(gtk.SORT_DESCENDING)
 
+        self.emit('extlistview-reordered', order)
         self.emit('extlistview-modified')
 
 
@@ -354,23 +1102,28 @@ class ExtListView(gtk.TreeView):
 
     def getSelectedRows(self):
         """ Return all selected row(s) """
-        return [tuple(self.store[path])[:-1] for path in self.selection.get_selected_rows()[1]]
+        return [self.store.getRow(index) for index in self.__getSelectedIndexes()]
 
 
     def getFirstSelectedRow(self):
         """ Return only the first selected row """
-        return tuple(self.store[self.selection.get_selected_rows()[1][0]])[:-1]
+        return self.store.getRow(self.getFirstSelectedRowIndex())
+
+
+    def getSelectedRowsIndexes(self):
+        """ Return the sorted indexes of the selected rows """
+        return self.__getSelectedIndexes()
 
 
     def getFirstSelectedRowIndex(self):
         """ Return the index of the first selected row """
-        return self.selection.get_selected_rows()[1][0][0]
+        return self.__getIndex(self.selection.get_selected_rows()[1][0])
 
 
     def iterSelectedRows(self):
         """ Iterate on all selected row(s) """
-        for path in self.selection.get_selected_rows()[1]:
-            yield tuple(self.store[path])[:-1]
+        for index in self.__getSelectedIndexes():
+            yield self.store.getRow(index)
 
 
     # --== Retrieving content / Iterating on content ==--
@@ -388,29 +1141,58 @@ class ExtListView(gtk.TreeView):
 
     def __iter__(self):
         """ Iterate on all rows """
-        for row in self.store:
-            yield tuple(row)[:-1]
+        return self.store.iterRows()
 
 
     def iterAllRows(self):
         """ Iterate on all rows """
-        for row in self.store:
-            yield tuple(row)[:-1]
+        return self.store.iterRows()
 
 
     def getRow(self, rowIndex):
         """ Return the given row """
-        return tuple(self.store[rowIndex])[:-1]
+        return self.store.getRow(self.__getIndex(rowIndex))
 
 
     def getAllRows(self):
         """ Return all rows """
-        return [tuple(row)[:-1] for row in self.store]
+        return list(self.store.iterRows())
 
 
     def getItem(self, rowIndex, colIndex):
         """ Return the value of the given item """
-        return self.store.get_value(self.store.get_iter(rowIndex), colIndex)
+        return self.store.getValue(self.__getIndex(rowIndex), colIndex)
+
+
+    def getData(self, rowIndex):
+        """ Return the object stored for the given row of a virtual list """
+        return self.store.getData(self.__getIndex(rowIndex))
+
+
+    def getAllData(self):
+        """ Return the objects stored in a virtual list """
+        return [self.store.getData(index) for index in xrange(len(self.store))]
+
+
+    def iterAllData(self):
+        """ Iterate on the objects stored in a virtual list """
+        for index in xrange(len(self.store)):
+            yield self.store.getData(index)
+
+
+    def getRowId(self, rowIndex):
+        """ Return the identifier of the given row, it does not change when rows are moved and is never reused """
+        return self.store.getId(self.__getIndex(rowIndex))
+
+
+    def getRowIndex(self, rowId):
+        """ Return the current index of the row with the given identifier, None if it has been removed """
+        return self.store.getIndexOf(rowId)
+
+
+    def findRows(self, key):
+        """ Return the sorted indexes of the rows with the given key (the list must have been given a key function) """
+        return self.store.findByKey(key)
 
 
     # --== Adding/removing/modifying content ==--
@@ -420,7 +1202,15 @@ class ExtListView(gtk.TreeView):
         """ Remove all rows from the list """
         self.__resetSorting()
         self.clearMark()
-        self.store.clear()
+
+        # Detaching the model is much faster than notifying the view of each removed row
+        if self.__isAttached():
+            self.set_model(None)
+            self.store.clear(False)
+            self.set_model(self.__getViewModel())
+        else:
+            self.store.clear(False)
+
         self.__resizeColumns()
         self.emit('extlistview-modified')
 
@@ -430,23 +1220,34 @@ class ExtListView(gtk.TreeView):
         # Check if changing that item may change the sorting: if so, reset sorting
         if self.sortLastCol is not None and colIndex in self.sortColCriteria[self.sortLastCol]:
             self.__resetSorting()
-        self.store.set_value(self.store.get_iter(rowIndex), colIndex, value)
+        self.store.setValue(self.__getIndex(rowIndex), colIndex, value)
 
 
     def removeRows(self, paths):
         """ Remove the given rows """
+        indexes = sorted(set([self.__getIndex(path) for path in paths]))
+
+        if len(indexes) == 0:
+            return
+
+        # Move the mark if needed
+        if self.markedRow is not None:
+            if self.markedRow in indexes: self.markedRow  = None
+            else:                         self.markedRow -= len([index for index in indexes if index < self.markedRow])
+
         self.freeze_child_notify()
-        # We must work with iters because paths become meaningless once we start removing rows
-        for iter in [self.store.get_iter(path) for path in paths]:
-            path = self.store.get_path(iter)[0]
-            # Move the mark if needed
-            if self.markedRow is not None:
-                if   path < self.markedRow:  self.markedRow -= 1
-                elif path == self.markedRow: self.markedRow  = None
-            # Remove the current row
-            if   self.store.remove(self.store.get_iter(path)): self.set_cursor(path)
-            elif len(self.store) != 0:                         self.set_cursor(len(self.store)-1)
+        self.store.remove(indexes, self.__isAttached())
         self.thaw_child_notify()
+
+        # Put the cursor where the last removed row was
+        cursor = indexes[-1] - len(indexes) + 1
+        if   cursor < len(self.store): cursor = self.__getPath(cursor)
+        elif len(self.store) != 0:     cursor = self.__getPath(len(self.store)-1)
+        else:                          cursor = None
+
+        if cursor is not None:
+            self.set_cursor(cursor)
+
         if len(self.store) == 0:
             self.set_cursor(0)
             self.__resetSorting()
@@ -477,27 +1278,25 @@ class ExtListView(gtk.TreeView):
 
 
     def insertRows(self, rows, position=None):
-        """ Insert or append (if position is None) some rows to the list """
+        """ Insert or append (if position is None) some rows to the list, rows are objects if the list is virtual """
         if len(rows) == 0:
             return
 
-        # Insert the additional column used for the mark management
-        if type(rows[0]) is tuple: rows[:] = [row + (False,) for row in rows]
-        else:                      rows[:] = [row + [False] for row in rows]
-
         # Move the mark if needed
         if self.markedRow is not None and position is not None and position <= self.markedRow:
             self.markedRow += len(rows)
 
-        # Insert rows
+        # Insert rows, notifying the view of each new row is too slow when there are a lot of them
         self.freeze_child_notify()
-        if position is None:
-            for row in rows:
-                self.store.append(row)
+        if self.__isAttached() and len(rows) >= BULK_INSERT_THRESHOLD:
+            if position is None: shift = lambda index: index
+            else:                shift = lambda index: index + len(rows) * int(index >= position)
+
+            state = self.__detachModel()
+            self.store.insert(position, rows, False)
+            self.__attachModel(state, shift)
         else:
-            for row in rows:
-                self.store.insert(position, row)
-                position += 1
+            self.store.insert(position, rows, self.__isAttached())
         self.thaw_child_notify()
         self.__resetSorting()
         self.emit('extlistview-modified')
@@ -514,24 +1313,32 @@ class ExtListView(gtk.TreeView):
         self.set_model(None)
         self.clear()
         self.appendRows(rows)
-        self.set_model(self.store)
+        self.set_model(self.__getViewModel())
         self.thaw_child_notify()
 
 
-    def shuffle(self):
-        """ Shuffle the content of the list """
-        order = range(len(self.store))
-        random.shuffle(order)
-        self.store.reorder(order)
+    def reorderRows(self, newOrder):
+        """ Reorder the rows, newOrder[i] being the current index of the row that must be moved to index i """
+        self.freeze_child_notify()
+        self.store.reorder(newOrder)
+        self.thaw_child_notify()
 
         # Move the mark if needed
         if self.markedRow is not None:
             self.__findMark()
 
         self.__resetSorting()
+        self.emit('extlistview-reordered', newOrder)
         self.emit('extlistview-modified')
 
 
+    def shuffle(self):
+        """ Shuffle the content of the list """
+        order = range(len(self.store))
+        random.shuffle(order)
+        self.reorderRows(order)
+
+
     # --== D'n'D management ==--
 
 
@@ -549,41 +1356,19 @@ class ExtListView(gtk.TreeView):
 
     def __moveSelectedRows(self, x, y):
         """ Internal function used for drag'n'drop """
-        iterList = self.__getIterOnSelectedRows()
+        selected = self.__getSelectedIndexes()
         dropInfo = self.get_dest_row_at_pos(int(x), int(y))
 
-        if dropInfo is None:
-            pos, path = gtk.TREE_VIEW_DROP_INTO_OR_AFTER, len(self.store) - 1
-        else:
-            pos, path = dropInfo[1], dropInfo[0][0]
-            if self.__isDropAfter(pos) and path < len(self.store)-1:
-                pos   = gtk.TREE_VIEW_DROP_INTO_OR_BEFORE
-                path += 1
-
-        self.freeze_child_notify()
-        for srcIter in iterList:
-            srcPath = self.store.get_path(srcIter)[0]
-
-            if self.__isDropAfter(pos):
-                dstIter = self.store.insert_after(self.store.get_iter(path),  self.store[srcIter])
-            else:
-                dstIter = self.store.insert_before(self.store.get_iter(path), self.store[srcIter])
-                if path == srcPath:
-                    path += 1
-
-            self.store.remove(srcIter)
-            dstPath = self.store.get_path(dstIter)[0]
+        # Rows are moved before the row at index dest
+        if dropInfo is None:                    dest = len(self.store)
+        elif self.__isDropAfter(dropInfo[1]):   dest = self.__getIndex(dropInfo[0]) + 1
+        else:                                   dest = self.__getIndex(dropInfo[0])
 
-            if srcPath > dstPath:
-                path += 1
+        isSelected = set(selected)
+        others     = [index for index in xrange(len(self.store)) if index not in isSelected]
+        dest      -= len([index for index in selected if index < dest])
 
-            if self.markedRow is not None:
-                if   srcPath == self.markedRow:                              self.markedRow  = dstPath
-                elif srcPath < self.markedRow and dstPath >= self.markedRow: self.markedRow -= 1
-                elif srcPath > self.markedRow and dstPath <= self.markedRow: self.markedRow += 1
-        self.thaw_child_notify()
-        self.__resetSorting()
-        self.emit('extlistview-modified')
+        self.reorderRows(others[:dest] + selected + others[dest:])
 
 
     # --== GTK Handlers ==--
@@ -187,6 +187,7 @@ class MainWindow:
         self.wtree.get_object('statusbar').show()
         self.wtree.get_object('box-btn-tracklist').show()
         self.wtree.get_object('scrolled-tracklist').show()
+        self.wtree.get_object('entry-tracklistFilter').show()
 
         (winWidth, winHeight) = requestedSize
 
@@ -199,6 +200,7 @@ class MainWindow:
         self.wtree.get_object('statusbar').hide()
         self.wtree.get_object('box-btn-tracklist').hide()
         self.wtree.get_object('scrolled-tracklist').hide()
+        self.wtree.get_object('entry-tracklistFilter').hide()
 
         (winWidth, winHeight) = requestedSize
 
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+from __future__ import absolute_import
+
+from gettext import gettext as _
+import gtk
+from .. import gui, tools
+from ..media import query
+
+
+class SmartPlaylist:
+
+    def __init__(self, title, parent, forbiddenNames=[]):
+        """ Constructor """
+        wTree               = tools.loadGladeFile('SmartPlaylist.ui')
+        self.btnOk          = wTree.get_object('btn-ok')
+        self.dialog         = wTree.get_object('dlg')
+        self.txtName        = wTree.get_object('txt-name')
+        self.txtQuery       = wTree.get_object('txt-query')
+        self.forbiddenNames = forbiddenNames
+
+        self.dialog.set_title(title)
+        self.dialog.set_transient_for(parent)
+
+        # Handlers
+        self.txtName.connect('changed', self.onTxtFieldChanged)
+        self.txtQuery.connect('changed', self.onTxtFieldChanged)
+        self.dialog.connect('response', self.onCheckDlgResponse)
+
+
+    def run(self, defaultName='', defaultQuery=''):
+        """ Return a tuple (name, query) or None if the user cancelled the dialog """
+        self.btnOk.set_sensitive(False)
+        self.txtName.set_text(defaultName)
+        self.txtQuery.set_text(defaultQuery)
+        self.txtName.grab_focus()
+        self.dialog.show_all()
+
+        result = None
+        if self.dialog.run() == gtk.RESPONSE_OK:
+            result = (self.txtName.get_text(), self.txtQuery.get_text())
+
+        self.dialog.hide()
+        return result
+
+
+    # --== GTK handlers ==--
+
+
+    def onTxtFieldChanged(self, txtEntry):
+        """ Enable/disable the OK button based on the content of the text fields """
+        self.btnOk.set_sensitive(self.txtName.get_text() != '' and self.txtQuery.get_text() != '')
+
+
+    def onCheckDlgResponse(self, dialog, response, *args):
+        """ Prevent clicking on the OK button if values are not correct """
+        if response == gtk.RESPONSE_OK:
+            if self.txtName.get_text() in self.forbiddenNames:
+                gui.errorMsgBox(dialog, _('The name is incorrect'), _('This name is not allowed.\nPlease use another one.'))
+                dialog.stop_emission('response')
+            else:
+                try:
+                    query.parse(self.txtQuery.get_text())
+                except query.QueryError, err:
+                    gui.errorMsgBox(dialog, _('The query is incorrect'), tools.htmlEscape(str(err)))
+                    dialog.stop_emission('response')
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+from __future__ import absolute_import
+
+import optparse, sys
+
+from .media import library, libraryService
+
+def main():
+
+    # Command line
+    optparser = optparse.OptionParser(usage='Usage: %prog [options]')
+    optparser.add_option('--socket', default=libraryService.SOCKET_PATH, help='the Unix socket to listen on (default: %default)')
+    optparser.add_option('--root', default=library.ROOT_PATH, help='the directory where libraries are stored (default: %default)')
+
+    (optOptions, optArgs) = optparser.parse_args()
+
+
+    # Let's go
+    if not libraryService.serve(optOptions.socket, optOptions.root):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,7 @@ from os.path import splitext
 from . import playlist
 from .format import monkeysaudio, asf, flac, mp3, mp4, mpc, ogg, wav, wavpack
 from .track.fileTrack import FileTrack
+from ..tools     import metrics
 from ..tools.log import logger
 
 
@@ -64,6 +65,7 @@ def getTrackFromFile(file):
     try:
         return mFormats[splitext(file.lower())[1]].getTrack(file)
     except:
+        metrics.incCounter('tag_parse_failures')
         logger.error('Unable to extract information from %s\n\n%s' % (file, traceback.format_exc()))
         return FileTrack(file)
 
@@ -21,14 +21,15 @@ import gst
 
 class AudioPlayer:
 
-    def __init__(self, callbackEnded, usePlaybin2=True):
-        """ Constructor """
+    def __init__(self, callbackEnded, usePlaybin2=True, audioSink='autoaudiosink'):
+        """ Constructor, audioSink is the name of the GStreamer element used for the output """
         self.player        = None
         self.volume        = 1
         self.rgEnabled     = False
         self.eqzLevels     = None
         self.equalizer     = None
         self.eqzEnabled    = False
+        self.audioSink     = audioSink
         self.usePlaybin2   = usePlaybin2
         self.cdReadSpeed   = 1
         self.callbackEnded = callbackEnded
@@ -63,7 +64,7 @@ class AudioPlayer:
 
         # Change the audio sink to our own bin, so that an equalizer/replay gain element can be added later on if needed
         self.audiobin  = gst.Bin('audiobin')
-        self.audiosink = gst.element_factory_make('autoaudiosink', 'audiosink')
+        self.audiosink = gst.element_factory_make(self.audioSink, 'audiosink')
 
         # Callback when the source of the playbin is changed
         self.player.connect('notify::source', self.__onNewPlaybinSource)
@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# Storage of libraries on the disk
+#
+# Each library is a directory containing:
+#     files               The file structure of the root path, used to avoid reading tags of unmodified files
+#     artists             The list of all artists with the name of their directory
+#     genres              Nested dictionaries genres -> artists -> albums
+#     index               The index used to run queries (see media.query)
+#     favorites           Nested dictionaries artists -> albums marked as favorites by the user
+#     <artist>/albums     The list of all albums of an artist with the name of their file
+#     <artist>/<album>    The tracks of an album
+#
+# This is used by the Library module, and by the library service that can be shared by several instances
+
+from __future__ import absolute_import
+
+import collections, os, shutil, threading, time
+from os.path import isdir, isfile
+
+from .                import getTrackFromFile, isSupported, query
+from .track.fileTrack import FileTrack
+from ..tools          import consts, listDir, pickleLoad, pickleSave, touch
+from ..tools.log      import logger
+
+
+# Information associated with artists
+(
+    ART_NAME,       # Its name
+    ART_INDEX,      # Name of the directory: avoid the use of the artist name as a filename (may contain invalid characters)
+    ART_NB_ALBUMS   # How many albums
+) = range(3)
+
+
+# Information associated with albums
+(
+    ALB_NAME,       # Its name
+    ALB_INDEX,      # Name of the file: avoid the use of the artist name as a filename (may contain invalid characters)
+    ALB_NB_TRACKS,  # Number of tracks
+    ALB_LENGTH      # Complete duration (include all tracks)
+) = range(4)
+
+
+# Constants
+VERSION                = 4                                      # Used to check compatibility
+LOG_NAME               = 'Library'                              # Used as a prefix for log messages
+ROOT_PATH              = os.path.join(consts.dirCfg, 'Library') # Path where libraries are stored
+SCAN_REPORT_FILE       = 'scan-report.json'                     # Statistics about the last refresh of a library
+SCAN_REPORT_NB_SLOWEST = 10                                     # How many slow files/directories are reported
+
+
+# Phases of a library refresh, used to report where time is spent
+SCAN_PHASES = (
+    'walk',      # Listing directories
+    'stat',      # Checking modification times of media files
+    'tags',      # Reading tags of new/modified files
+    'database',  # Building the artists/albums/genres database
+    'write',     # Writing the library to the disk
+)
+
+
+class ScanReport:
+    """ Collect timings and statistics while a library is being refreshed """
+
+    def __init__(self, libName, path):
+        """ Constructor """
+        self.path       = path
+        self.libName    = libName
+        self.started    = time.time()
+        self.phases     = dict([(phase, 0.0) for phase in SCAN_PHASES])
+        self.nbDirs     = 0
+        self.nbFiles    = 0
+        self.nbParsed   = 0
+        self.slowDirs   = []   # Heap of (duration, path) limited to SCAN_REPORT_NB_SLOWEST entries
+        self.slowFiles  = []   # Heap of (duration, path) limited to SCAN_REPORT_NB_SLOWEST entries
+        self.dirsReused = 0
+
+
+    def __keepSlowest(self, heap, duration, path):
+        """ Add (duration, path) to the given heap if it is one of the slowest entries """
+        import heapq
+
+        if len(heap) < SCAN_REPORT_NB_SLOWEST: heapq.heappush(heap, (duration, path))
+        elif duration > heap[0][0]:            heapq.heapreplace(heap, (duration, path))
+
+
+    def addPhaseTime(self, phase, duration):
+        """ Add the given duration to the time spent in the given phase """
+        self.phases[phase] += duration
+
+
+    def addDirectory(self, path, nbFiles, reused, duration):
+        """ A directory has been scanned, reused is True if its content comes from the previous scan """
+        self.nbDirs  += 1
+        self.nbFiles += nbFiles
+        if reused:
+            self.dirsReused += 1
+        self.__keepSlowest(self.slowDirs, duration, path)
+
+
+    def addParsedFile(self, path, duration):
+        """ Tags of the given file had to be (re)read """
+        self.nbParsed += 1
+        self.phases['tags'] += duration
+        self.__keepSlowest(self.slowFiles, duration, path)
+
+
+    def getReport(self):
+        """ Return a dictionary summarizing the refresh """
+        elapsed  = time.time() - self.started
+        scanTime = self.phases['walk'] + self.phases['stat'] + self.phases['tags']
+
+        if self.nbFiles == 0: hitRatio = 1.0
+        else:                 hitRatio = (self.nbFiles - self.nbParsed) / float(self.nbFiles)
+
+        if scanTime == 0: throughput = 0.0
+        else:             throughput = self.nbFiles / scanTime
+
+        return {
+                    'library':         self.libName,
+                    'path':            self.path,
+                    'date':            int(self.started),
+                    'elapsed':         elapsed,
+                    'phases':          self.phases,
+                    'nbDirectories':   self.nbDirs,
+                    'nbReusedDirs':    self.dirsReused,
+                    'nbFiles':         self.nbFiles,
+                    'nbParsedFiles':   self.nbParsed,
+                    'cacheHitRatio':   hitRatio,
+                    'filesPerSecond':  throughput,
+                    'slowestFiles':    [{'path': path, 'seconds': duration} for (duration, path) in sorted(self.slowFiles, reverse=True)],
+                    'slowestDirs':     [{'path': path, 'seconds': duration} for (duration, path) in sorted(self.slowDirs,  reverse=True)],
+               }
+
+
+    def save(self, libPath):
+        """ Write the report to the log and to the given library directory """
+        import json
+
+        report = self.getReport()
+        phases = ', '.join(['%s %.2fs' % (phase, report['phases'][phase]) for phase in SCAN_PHASES])
+
+        logger.info('[%s] Library "%s" refreshed in %.2fs (%s)' % (LOG_NAME, self.libName, report['elapsed'], phases))
+        logger.info('[%s] %u files in %u directories, %u tags read, cache hit ratio %.1f%%, %.1f files/s' % (LOG_NAME,
+                        report['nbFiles'], report['nbDirectories'], report['nbParsedFiles'], report['cacheHitRatio'] * 100, report['filesPerSecond']))
+
+        for item in report['slowestFiles']:
+            logger.debug('[%s] Slow file: %.3fs %s' % (LOG_NAME, item['seconds'], item['path']))
+
+        try:
+            output = open(os.path.join(libPath, SCAN_REPORT_FILE), 'w')
+            json.dump(report, output, indent=2)
+            output.close()
+        except:
+            logger.error('[%s] Unable to save the scan report of library "%s"' % (LOG_NAME, self.libName))
+
+
+
+
+def remapPath(path, oldPrefix, newPrefix):
+    """ Replace oldPrefix by newPrefix if path starts with oldPrefix """
+    if path == oldPrefix or path.startswith(oldPrefix + os.sep):
+        return newPrefix + path[len(oldPrefix):]
+
+    return path
+
+
+def createEmpty(libPath):
+    """ Create bootstrap files for a new library """
+    # Make sure that the root directory of all libraries exists
+    if not isdir(os.path.dirname(libPath)):
+        os.makedirs(os.path.dirname(libPath))
+    # Start from an empty library
+    if isdir(libPath):
+        shutil.rmtree(libPath)
+    os.mkdir(libPath)
+    pickleSave(os.path.join(libPath, 'files'), {})
+
+
+class Scanner:
+    """
+        Refresh a library in two steps, both being generators so that the caller can keep the user interface alive:
+            * scan() looks for media files and reads their tags, it can be stopped at any time
+            * write() creates the database and re-creates the library on the disk
+    """
+
+    def __init__(self, libPath, path, prefixes):
+        """ Constructor """
+        self.db         = {}                                          # The dictionnary used to create the library
+        self.path       = path                                        # Root path of the media files
+        self.report     = ScanReport(os.path.basename(libPath), path) # Timings and statistics
+        self.libPath    = libPath                                     # Location of the library
+        self.prefixes   = prefixes                                    # Prefixes put at the end of artists' names
+        self.nbAlbums   = 0
+        self.nbTracks   = 0
+        self.nbArtists  = 0
+        self.mediaFiles = []                                          # All media files found
+        self.newLibrary = {}                                          # Reflect the current file structure of the library
+
+
+    def scan(self):
+        """ Scan the root path, yield the number of media files found so far after each directory """
+        # If the version number has changed or does not exist, don't reuse any existing file and start from scratch
+        if not os.path.exists(os.path.join(self.libPath, 'VERSION_%u' % VERSION)):
+            createEmpty(self.libPath)
+
+        queue      = collections.deque((self.path,))                       # Faster structure for appending/removing elements
+        oldLibrary = pickleLoad(os.path.join(self.libPath, 'files'))       # Previous file structure of the same library
+
+        # Make sure the root directory still exists
+        if not os.path.exists(self.path):
+            queue.pop()
+
+        while len(queue) != 0:
+            dirStart     = time.time()
+            currDir      = queue.pop()
+            currDirMTime = os.stat(currDir).st_mtime
+
+            # Retrieve previous information on the current directory, if any
+            if currDir in oldLibrary: oldDirMTime, oldDirectories, oldFiles = oldLibrary[currDir]
+            else:                     oldDirMTime, oldDirectories, oldFiles = -1, [], {}
+
+            # If the directory has not been modified, keep old information
+            if currDirMTime == oldDirMTime:
+                files, directories = oldFiles, oldDirectories
+            else:
+                files, directories = {}, []
+                for (filename, fullPath) in listDir(currDir):
+                    if isdir(fullPath):
+                        directories.append(fullPath)
+                    elif isfile(fullPath) and isSupported(filename):
+                        if filename in oldFiles: files[filename] = oldFiles[filename]
+                        else:                    files[filename] = [-1, FileTrack(fullPath)]
+
+            statStart = time.time()
+            self.report.addPhaseTime('walk', statStart - dirStart)
+
+            # Determine which files need to be updated, the time spent reading tags is not part of the 'stat' phase
+            parseTime = 0
+            for filename, (oldMTime, track) in files.iteritems():
+                mTime = os.stat(track.getFilePath()).st_mtime
+                if mTime != oldMTime:
+                    parseStart      = time.time()
+                    files[filename] = [mTime, getTrackFromFile(track.getFilePath())]
+                    parseDuration   = time.time() - parseStart
+                    parseTime      += parseDuration
+                    self.report.addParsedFile(track.getFilePath(), parseDuration)
+
+            dirEnd = time.time()
+            self.report.addPhaseTime('stat', dirEnd - statStart - parseTime)
+            self.report.addDirectory(currDir, len(files), currDirMTime == oldDirMTime, dirEnd - dirStart)
+
+            self.newLibrary[currDir] = (currDirMTime, directories, files)
+            self.mediaFiles.extend([track for mTime, track in files.itervalues()])
+            queue.extend(directories)
+
+            yield len(self.mediaFiles)
+
+
+    def write(self):
+        """ Create the database and write the library to the disk, yield regularly to let the caller do something else """
+        db         = self.db
+        libPath    = self.libPath
+        phaseStart = time.time()
+
+        # Create the database
+        for track in self.mediaFiles:
+            album = track.getExtendedAlbum()
+            genre = track.getGenre().lower()
+
+            if track.hasAlbumArtist(): artist = track.getAlbumArtist()
+            else:                      artist = track.getArtist()
+
+            if artist in db:
+                allAlbums = db[artist]
+
+                try:
+                    albumNfo = allAlbums[album]
+                    albumNfo[0][genre] = None
+                    albumNfo[1].append(track)
+                except:
+                    allAlbums[album] = ({genre: None}, [track])
+            else:
+                db[artist] = {album: ({genre: None}, [track])}
+
+        yield None
+
+        # If an artist name begins with a known prefix, put it at the end (e.g., Future Sound of London (The))
+        for artist in db.keys():
+            artistLower = artist.lower()
+            for prefix in self.prefixes:
+                if artistLower.startswith(prefix):
+                    db[artist[len(prefix):] + ' (%s)' % artist[:len(prefix)-1]] = db[artist]
+                    del db[artist]
+
+        self.report.addPhaseTime('database', time.time() - phaseStart)
+        yield None
+        phaseStart = time.time()
+
+        # Re-create the library structure on the disk
+        if isdir(libPath):
+            shutil.rmtree(libPath)
+            os.mkdir(libPath)
+
+        # Put a version number
+        touch(os.path.join(libPath, 'VERSION_%u' % VERSION))
+
+        self.nbAlbums  = 0
+        self.nbTracks  = 0
+        self.nbArtists = len(db)
+
+        # The 'artists' file contains all known artists with their index, the 'files' file contains the file structure of the root path
+        allArtists = sorted([(artist, str(indexArtist), len(albums)) for indexArtist, (artist, albums) in enumerate(db.iteritems())], key = lambda a: a[0].lower())
+        pickleSave(os.path.join(libPath, 'files'),   self.newLibrary)
+        pickleSave(os.path.join(libPath, 'artists'), allArtists)
+
+        # Keep track of genre through nested dictionaries genres -> artists -> albums
+        allGenres = {}
+
+        # The index is used to run queries without loading all albums
+        libIndex = []
+
+        for (artist, indexArtist, nbAlbums) in allArtists:
+            artistPath     = os.path.join(libPath, indexArtist)
+            self.nbAlbums += nbAlbums
+            os.mkdir(artistPath)
+
+            albums      = []
+            albumTracks = {}
+            for index, (name, (albumGenres, tracks)) in enumerate(db[artist].iteritems()):
+                length            = sum([track.getLength() for track in tracks])
+                albumTracks[name] = sorted(tracks, key = lambda track: track.getNumber())
+                self.nbTracks    += len(tracks)
+
+                albums.append((name, str(index), len(tracks), length))
+                pickleSave(os.path.join(artistPath, str(index)), albumTracks[name])
+
+                # Update the dictionary with the genres
+                for genre in albumGenres:
+                    try:
+                        allGenres[genre][artist][name] = None
+                    except:
+                        try:
+                            allGenres[genre][artist] = {name: None}
+                        except:
+                            allGenres[genre] = {artist: {name: None}}
+
+            albums.sort()
+            pickleSave(os.path.join(artistPath, 'albums'), albums)
+
+            for (name, indexAlbum, nbTracks, length) in albums:
+                libIndex.extend([query.getIndexEntry(artist, name, track) for track in albumTracks[name]])
+
+            self.report.addPhaseTime('write', time.time() - phaseStart)
+            yield None
+            phaseStart = time.time()
+
+        pickleSave(os.path.join(libPath, 'genres'), allGenres)
+        pickleSave(os.path.join(libPath, 'index'),  libIndex)
+        self.report.addPhaseTime('write', time.time() - phaseStart)
+        self.report.save(libPath)
+
+
+    def run(self):
+        """ Refresh the library at once """
+        for nbTracks in self.scan():
+            pass
+
+        for step in self.write():
+            pass
+
+
+class LocalStore:
+    """ Access to the libraries stored in a given directory, indexes are kept in memory once loaded """
+
+    def __init__(self, rootPath=ROOT_PATH):
+        """ Constructor """
+        self.lock     = threading.Lock()
+        self.indexes  = {}
+        self.rootPath = rootPath
+
+
+    def getLibPath(self, libName):
+        """ Return the directory where the given library is stored """
+        return os.path.join(self.rootPath, libName)
+
+
+    def isValid(self, libName):
+        """ Return whether the given library exists, and has been created by a compatible version """
+        return os.path.exists(os.path.join(self.getLibPath(libName), 'VERSION_%u' % VERSION))
+
+
+    def getArtists(self, libName):
+        """ Return the list of artists of the given library """
+        return pickleLoad(os.path.join(self.getLibPath(libName), 'artists'))
+
+
+    def getGenres(self, libName):
+        """ Return the nested dictionaries genres -> artists -> albums of the given library """
+        return pickleLoad(os.path.join(self.getLibPath(libName), 'genres'))
+
+
+    def getAlbums(self, libName, artistIndex):
+        """ Return the list of albums of the given artist """
+        return pickleLoad(os.path.join(self.getLibPath(libName), artistIndex, 'albums'))
+
+
+    def getTracks(self, libName, artistIndex, albumIndex):
+        """ Return the list of tracks of the given album """
+        return pickleLoad(os.path.join(self.getLibPath(libName), artistIndex, albumIndex))
+
+
+    def getIndex(self, libName):
+        """ Return the index of the given library, build it if it does not exist yet (e.g., old library) """
+        self.lock.acquire()
+
+        try:
+            if libName not in self.indexes:
+                libPath   = self.getLibPath(libName)
+                indexPath = os.path.join(libPath, 'index')
+
+                if isfile(indexPath):
+                    libIndex = pickleLoad(indexPath)
+                else:
+                    libIndex = []
+                    for (artist, indexArtist, nbAlbums) in self.getArtists(libName):
+                        for album in self.getAlbums(libName, indexArtist):
+                            libIndex.extend([query.getIndexEntry(artist, album[ALB_NAME], track) for track in self.getTracks(libName, indexArtist, album[ALB_INDEX])])
+                    pickleSave(indexPath, libIndex)
+
+                self.indexes[libName] = libIndex
+
+            return self.indexes[libName]
+        finally:
+            self.lock.release()
+
+
+    def invalidate(self, libName):
+        """ The given library has been modified, make sure that it will be reloaded when needed """
+        self.lock.acquire()
+
+        if libName in self.indexes:
+            del self.indexes[libName]
+
+        self.lock.release()
+
+
+    def search(self, libName, text, favorites):
+        """
+            Return the tracks of the given library matching the given query, may raise query.QueryError
+            Favorites are given as nested dictionaries artists -> albums
+        """
+        isFavorite = lambda artist, album: artist in favorites and album in favorites[artist]
+
+        return query.run(text, self.getIndex(libName), isFavorite)
+
+
+    def refresh(self, libName, path, prefixes):
+        """ Refresh the given library at once, return a tuple (nbArtists, nbAlbums, nbTracks) """
+        scanner = Scanner(self.getLibPath(libName), path, prefixes)
+        scanner.run()
+        self.invalidate(libName)
+
+        return (scanner.nbArtists, scanner.nbAlbums, scanner.nbTracks)
+
+
+    def sampleFiles(self, libName, nbSamples):
+        """ Return the paths of at most nbSamples media files of the given library, picked at random """
+        import random
+
+        allFiles = []
+        for (dirMTime, directories, files) in pickleLoad(os.path.join(self.getLibPath(libName), 'files')).itervalues():
+            allFiles.extend([track.getFilePath() for (mTime, track) in files.itervalues()])
+
+        return random.sample(allFiles, min(nbSamples, len(allFiles)))
+
+
+    def relocate(self, libName, oldPrefix, newPrefix):
+        """
+            Rewrite all paths stored in the given library at once, replacing oldPrefix by newPrefix
+            This is much faster than a refresh, since media files are neither listed nor parsed
+        """
+        libPath   = self.getLibPath(libName)
+        oldPrefix = oldPrefix.rstrip(os.sep)
+        newPrefix = newPrefix.rstrip(os.sep)
+
+        # The file structure of the library
+        newLibrary = {}
+        for (directory, (dirMTime, directories, files)) in pickleLoad(os.path.join(libPath, 'files')).iteritems():
+            for (mTime, track) in files.itervalues():
+                track.setFilePath(remapPath(track.getFilePath(), oldPrefix, newPrefix))
+
+            directories = [remapPath(subdir, oldPrefix, newPrefix) for subdir in directories]
+            newLibrary[remapPath(directory, oldPrefix, newPrefix)] = (dirMTime, directories, files)
+
+        pickleSave(os.path.join(libPath, 'files'), newLibrary)
+
+        # Tracks of all albums
+        for (artist, indexArtist, nbAlbums) in pickleLoad(os.path.join(libPath, 'artists')):
+            artistPath = os.path.join(libPath, indexArtist)
+
+            for album in pickleLoad(os.path.join(artistPath, 'albums')):
+                albumPath = os.path.join(artistPath, album[ALB_INDEX])
+                tracks    = pickleLoad(albumPath)
+
+                for track in tracks:
+                    track.setFilePath(remapPath(track.getFilePath(), oldPrefix, newPrefix))
+
+                pickleSave(albumPath, tracks)
+
+        # The index is rebuilt from the albums the next time it is needed
+        if isfile(os.path.join(libPath, 'index')):
+            os.remove(os.path.join(libPath, 'index'))
+        self.invalidate(libName)
+
+
+    def rename(self, oldName, newName):
+        """ Rename the given library """
+        if isdir(self.getLibPath(oldName)):
+            shutil.move(self.getLibPath(oldName), self.getLibPath(newName))
+
+        self.invalidate(oldName)
+
+
+    def remove(self, libName):
+        """ Remove the given library from the disk """
+        if isdir(self.getLibPath(libName)):
+            shutil.rmtree(self.getLibPath(libName))
+
+        self.invalidate(libName)
+
+
+    def loadFavorites(self, libName):
+        """ Return the favorites of the given library as nested dictionaries artists -> albums """
+        try:    return pickleLoad(os.path.join(self.getLibPath(libName), 'favorites'))
+        except: return {}
+
+
+    def saveFavorites(self, libName, favorites):
+        """ Save the favorites of the given library """
+        if not isdir(self.getLibPath(libName)):
+            os.makedirs(self.getLibPath(libName))
+
+        pickleSave(os.path.join(self.getLibPath(libName), 'favorites'), favorites)
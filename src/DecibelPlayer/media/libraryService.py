@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# The library service owns libraries stored on the disk (scan, tags cache, index), and answers the queries of player instances
+#
+# Clients send requests as JSON objects on a single line: {"cmd": "getAlbums", "args": ["My Library", "12"]}
+# The service answers with a pickled tuple (True, result) or (False, (error type, error message)), preceded by its length
+# Clients fall back to an in-process store when the service is not running
+
+from __future__ import absolute_import
+
+import cPickle, json, os, socket, struct, threading, SocketServer
+
+from .           import library, query
+from ..tools     import consts
+from ..tools.log import logger
+
+
+# Constants
+LOG_NAME    = 'Library service'
+SOCKET_PATH = os.environ.get('DECIBEL_LIBRARY_SOCKET', os.path.join(consts.dirCfg, 'library.sock'))
+HEADER_SIZE = struct.calcsize('!I')
+
+# Methods of library.LocalStore that can be called by clients
+COMMANDS = ('isValid', 'getArtists', 'getGenres', 'getAlbums', 'getTracks', 'search', 'refresh', 'invalidate',
+            'sampleFiles', 'relocate', 'rename', 'remove', 'loadFavorites', 'saveFavorites')
+
+# The first arguments of a command are names of files or directories stored in the library, only the name of the library by default
+NB_NAME_ARGS = {'getAlbums': 2, 'getTracks': 3, 'rename': 2}
+
+
+class ServiceError(Exception):
+    """ Raised when the service cannot answer a request """
+
+    def __init__(self, errMsg):
+        """ Constructor """
+        self.errMsg = errMsg
+
+    def __str__(self):
+        """ String representation """
+        return self.errMsg
+
+
+# --== Service ==--
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    """ Answer the requests of a client until it disconnects """
+
+    def __toStr(self, data):
+        """ JSON gives unicode strings, while libraries use UTF-8 encoded strings """
+        if isinstance(data, unicode): return data.encode('utf-8')
+        if isinstance(data, list):    return [self.__toStr(item) for item in data]
+        if isinstance(data, dict):    return dict([(self.__toStr(key), self.__toStr(value)) for (key, value) in data.iteritems()])
+
+        return data
+
+
+    def handle(self):
+        """ Handle all requests sent through the connection """
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+
+            try:
+                request = json.loads(line)
+                cmd     = request['cmd']
+                args    = self.__toStr(request['args'])
+
+                if cmd not in COMMANDS:
+                    raise ServiceError('Unknown command: %s' % cmd)
+
+                response = (True, self.server.execute(cmd, args))
+            except query.QueryError, err:
+                response = (False, ('query', str(err)))
+            except Exception, err:
+                logger.error('[%s] Request failed: %s' % (LOG_NAME, err))
+                response = (False, ('service', str(err)))
+
+            data = cPickle.dumps(response, cPickle.HIGHEST_PROTOCOL)
+            self.wfile.write(struct.pack('!I', len(data)) + data)
+
+
+class LibraryServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """ Serve the libraries of a store over a Unix socket, each client being handled by its own thread """
+
+    daemon_threads = True
+
+
+    def __init__(self, socketPath, store):
+        """ Constructor """
+        SocketServer.UnixStreamServer.__init__(self, socketPath, RequestHandler)
+
+        self.store     = store
+        self.locks     = {}
+        self.locksLock = threading.Lock()
+
+
+    def __getLock(self, libName):
+        """ Return the lock associated to the given library """
+        self.locksLock.acquire()
+
+        if libName not in self.locks:
+            self.locks[libName] = threading.Lock()
+
+        lock = self.locks[libName]
+        self.locksLock.release()
+
+        return lock
+
+
+    def __checkNames(self, cmd, args):
+        """ Raise ServiceError if the names given to the command may designate a file outside of the library """
+        nbNames = NB_NAME_ARGS.get(cmd, 1)
+
+        if len(args) < nbNames:
+            raise ServiceError('Missing arguments for %s' % cmd)
+
+        for name in args[:nbNames]:
+            if not isinstance(name, str) or name in ('', os.curdir, os.pardir) or os.sep in name or os.path.isabs(name):
+                raise ServiceError('Invalid name: %s' % repr(name))
+
+        # The library itself, as well as its files, must be located under the root path (e.g., no symbolic link pointing outside of it)
+        rootPath = os.path.realpath(self.store.rootPath)
+
+        if cmd == 'rename': paths = [self.store.getLibPath(name) for name in args[:2]]
+        else:               paths = [os.path.join(self.store.getLibPath(args[0]), *args[1:nbNames])]
+
+        for path in paths:
+            if not os.path.realpath(path).startswith(rootPath + os.sep):
+                raise ServiceError('Invalid name: %s' % repr(path))
+
+
+    def execute(self, cmd, args):
+        """ Execute the given command, a library cannot be read while it is being refreshed """
+        self.__checkNames(cmd, args)
+
+        lock = self.__getLock(args[0])
+        lock.acquire()
+
+        try:     return getattr(self.store, cmd)(*args)
+        finally: lock.release()
+
+
+def serve(socketPath, rootPath):
+    """ Run the service until it is interrupted """
+    # A left-over socket may be there if a previous service has crashed
+    if os.path.exists(socketPath):
+        if isRunning(socketPath):
+            logger.error('[%s] Already running on %s' % (LOG_NAME, socketPath))
+            return False
+
+        os.remove(socketPath)
+
+    server = LibraryServer(socketPath, library.LocalStore(rootPath))
+    logger.info('[%s] Serving libraries of %s on %s' % (LOG_NAME, rootPath, socketPath))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
+    os.remove(socketPath)
+    logger.info('[%s] Stopped' % LOG_NAME)
+
+    return True
+
+
+# --== Client ==--
+
+
+def isRunning(socketPath=SOCKET_PATH):
+    """ Return whether the service is listening on the given socket """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(socketPath)
+        sock.close()
+        return True
+    except socket.error:
+        return False
+
+
+class RemoteStore:
+    """
+        Access to the libraries owned by the service, with the same interface as library.LocalStore
+        If the service stops, requests are handled by an in-process store
+    """
+
+    def __init__(self, socketPath, fallback):
+        """ Constructor """
+        self.sock       = None
+        self.lock       = threading.Lock()
+        self.fallback   = fallback
+        self.socketPath = socketPath
+
+
+    def __connect(self, timeout):
+        """ Return a new connection to the service """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(self.socketPath)
+
+        return sock
+
+
+    def __receive(self, sock, size):
+        """ Return exactly size bytes read from the given connection """
+        chunks = []
+
+        while size != 0:
+            chunk = sock.recv(min(size, 65536))
+            if len(chunk) == 0:
+                raise socket.error('Connection closed by the service')
+
+            size -= len(chunk)
+            chunks.append(chunk)
+
+        return ''.join(chunks)
+
+
+    def __send(self, sock, cmd, args):
+        """ Send a request through the given connection and return the result """
+        sock.sendall(json.dumps({'cmd': cmd, 'args': args}) + '\n')
+
+        size             = struct.unpack('!I', self.__receive(sock, HEADER_SIZE))[0]
+        (success, value) = cPickle.loads(self.__receive(sock, size))
+
+        if success:
+            return value
+
+        (errType, errMsg) = value
+
+        if errType == 'query': raise query.QueryError(errMsg)
+        else:                  raise ServiceError(errMsg)
+
+
+    def __request(self, cmd, *args):
+        """ Send a request through the shared connection, use the in-process store if the service is gone """
+        self.lock.acquire()
+
+        try:
+            if self.sock is None:
+                try:
+                    self.sock = self.__connect(consts.socketTimeout)
+                except socket.error:
+                    return getattr(self.fallback, cmd)(*args)
+
+            try:
+                return self.__send(self.sock, cmd, list(args))
+            except socket.error, err:
+                logger.error('[%s] Connection lost (%s), using the in-process library instead' % (LOG_NAME, err))
+                self.sock.close()
+                self.sock = None
+                return getattr(self.fallback, cmd)(*args)
+        finally:
+            self.lock.release()
+
+
+    def isValid(self, libName):                             return self.__request('isValid',    libName)
+    def getArtists(self, libName):                          return self.__request('getArtists', libName)
+    def getGenres(self, libName):                           return self.__request('getGenres',  libName)
+    def getAlbums(self, libName, artistIndex):              return self.__request('getAlbums',  libName, artistIndex)
+    def getTracks(self, libName, artistIndex, albumIndex):  return self.__request('getTracks',  libName, artistIndex, albumIndex)
+    def search(self, libName, text, favorites):             return self.__request('search',     libName, text, favorites)
+    def invalidate(self, libName):                          return self.__request('invalidate', libName)
+    def sampleFiles(self, libName, nbSamples):              return self.__request('sampleFiles', libName, nbSamples)
+    def rename(self, oldName, newName):                     return self.__request('rename', oldName, newName)
+    def remove(self, libName):                              return self.__request('remove', libName)
+    def loadFavorites(self, libName):                       return self.__request('loadFavorites', libName)
+    def saveFavorites(self, libName, favorites):            return self.__request('saveFavorites', libName, favorites)
+
+
+    def __longRequest(self, cmd, *args):
+        """ A request that may take a long time uses a dedicated connection, so that other requests are not blocked """
+        try:
+            sock = self.__connect(None)
+        except socket.error:
+            return getattr(self.fallback, cmd)(*args)
+
+        try:     return self.__send(sock, cmd, list(args))
+        finally: sock.close()
+
+
+    def refresh(self, libName, path, prefixes):             return self.__longRequest('refresh', libName, path, list(prefixes))
+    def relocate(self, libName, oldPrefix, newPrefix):      return self.__longRequest('relocate', libName, oldPrefix, newPrefix)
+
+
+def getStore(socketPath=SOCKET_PATH):
+    """ Return a RemoteStore if the service is running, a library.LocalStore otherwise """
+    local = library.LocalStore()
+
+    if isRunning(socketPath):
+        logger.info('[%s] Using the service listening on %s' % (LOG_NAME, socketPath))
+        return RemoteStore(socketPath, local)
+
+    return local
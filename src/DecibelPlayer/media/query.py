@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# Queries over an index of tracks (e.g., smart playlists of the library)
+#
+# A query is a string made of terms, terms separated by spaces must all match:
+#     genre:rock          Genre (case insensitive)
+#     artist:beatles      Artist, the given text must be part of the artist name
+#     album:live          Album, the given text must be part of the album name
+#     format:flac         Format, given as the extension of the file
+#     year:1990-1999      Year, within the given (inclusive) range
+#     bitrate:>=192       Bit rate in kbps
+#     length:<300         Length in seconds
+#     favorites           Albums in the favorites
+#
+# Numerical fields accept a single value, a range (min-max), or a comparison (<, <=, >, >=)
+# Text values containing spaces must be quoted (e.g., genre:"hard rock")
+# Terms may be negated with a leading '-', combined with 'or', and grouped with parentheses
+
+from __future__ import absolute_import
+
+import re
+
+from .track import TAG_BTR
+
+
+# An entry of the index
+(
+    IDX_ARTIST,   # Artist, as used by the library (album artist if any)
+    IDX_ALBUM,    # Album, as used by the library (extended album name)
+    IDX_GENRE,    # Genre, lower case
+    IDX_YEAR,     # Year
+    IDX_BITRATE,  # Bit rate in kbps
+    IDX_LENGTH,   # Length in seconds
+    IDX_FORMAT,   # Format (e.g., mp3)
+    IDX_TRACK,    # The Track object
+) = range(8)
+
+
+# Fields that can be used in a query
+TEXT_FIELDS    = {'artist': IDX_ARTIST, 'album': IDX_ALBUM, 'genre': IDX_GENRE, 'format': IDX_FORMAT}
+NUMERIC_FIELDS = {'year': IDX_YEAR, 'bitrate': IDX_BITRATE, 'length': IDX_LENGTH}
+
+# Text fields that match when the value is part of the field (instead of being equal to it)
+SUBSTRING_FIELDS = ('artist', 'album')
+
+mTokenRE = re.compile(r'\(|\)|-?[^\s()"]+"[^"]*"|"[^"]*"|[^\s()]+')
+
+
+class QueryError(Exception):
+    """ Raised when a query cannot be parsed """
+
+    def __init__(self, errMsg):
+        """ Constructor """
+        self.errMsg = errMsg
+
+    def __str__(self):
+        """ String representation """
+        return self.errMsg
+
+
+def getIndexEntry(artist, album, track):
+    """ Return the index entry corresponding to the given track, artist and album being those used by the library """
+    bitrate = track.getTags().get(TAG_BTR, 0)
+    if bitrate < 0:
+        bitrate = 0
+
+    return (artist, album, track.getGenre().lower(), track.getDate(), bitrate / 1000, track.getLength(), track.getType(), track)
+
+
+# --== Parsing ==--
+
+
+def __parseNumber(field, value):
+    """ Return the integer value of the given string """
+    try:    return int(value)
+    except: raise QueryError('Invalid value for %s: %s' % (field, value))
+
+
+def __parseRange(field, value):
+    """ Return the inclusive range (min, max) described by the given string, None meaning unbounded """
+    if value.startswith('>='): return (__parseNumber(field, value[2:]),     None)
+    if value.startswith('<='): return (None,                                __parseNumber(field, value[2:]))
+    if value.startswith('>'):  return (__parseNumber(field, value[1:]) + 1, None)
+    if value.startswith('<'):  return (None,                                __parseNumber(field, value[1:]) - 1)
+
+    if '-' in value[1:]:
+        idx = value.index('-', 1)
+        return (__parseNumber(field, value[:idx]), __parseNumber(field, value[idx+1:]))
+
+    number = __parseNumber(field, value)
+    return (number, number)
+
+
+def __parseTerm(token):
+    """ Return the query corresponding to a single term """
+    if token.startswith('-'):
+        return ('not', __parseTerm(token[1:]))
+
+    if token.lower() in ('favorites', 'favourites'):
+        return ('favorites',)
+
+    if ':' not in token:
+        raise QueryError('Unknown term: %s' % token)
+
+    field, value = token.split(':', 1)
+    field        = field.lower()
+    value        = value.strip('"')
+
+    if field in TEXT_FIELDS:
+        return (field, value.lower())
+
+    if field in NUMERIC_FIELDS:
+        min, max = __parseRange(field, value)
+        return (field, min, max)
+
+    raise QueryError('Unknown field: %s' % field)
+
+
+def __parseOr(tokens):
+    """ Parse a list of alternatives, tokens are consumed from the given list """
+    alternatives = [__parseAnd(tokens)]
+
+    while len(tokens) != 0 and tokens[0].lower() == 'or':
+        tokens.pop(0)
+        alternatives.append(__parseAnd(tokens))
+
+    if len(alternatives) == 1: return alternatives[0]
+    else:                      return ('or', alternatives)
+
+
+def __parseAnd(tokens):
+    """ Parse a list of terms that must all match, tokens are consumed from the given list """
+    terms = []
+
+    while len(tokens) != 0 and tokens[0] != ')' and tokens[0].lower() != 'or':
+        token = tokens.pop(0)
+
+        if token in ('(', '-('):
+            subQuery = __parseOr(tokens)
+
+            if len(tokens) == 0 or tokens.pop(0) != ')':
+                raise QueryError('Missing closing parenthesis')
+
+            if token == '(': terms.append(subQuery)
+            else:            terms.append(('not', subQuery))
+        else:
+            terms.append(__parseTerm(token))
+
+    if len(terms) == 0: raise QueryError('Empty query')
+    if len(terms) == 1: return terms[0]
+    else:               return ('and', terms)
+
+
+def parse(text):
+    """ Return the query described by the given string, may raise QueryError """
+    tokens = mTokenRE.findall(text)
+
+    # A negated group is written -( ... ), merge the two tokens
+    for i in xrange(len(tokens)-2, -1, -1):
+        if tokens[i] == '-' and tokens[i+1] == '(':
+            tokens[i:i+2] = ['-(']
+
+    query = __parseOr(tokens)
+
+    if len(tokens) != 0:
+        raise QueryError('Unexpected token: %s' % tokens[0])
+
+    return query
+
+
+# --== Evaluation ==--
+
+
+def compile(query, isFavorite):
+    """
+        Return a function that takes an index entry and returns whether it matches the given query
+        isFavorite(artist, album) must return whether the given album is in the favorites
+    """
+    kind = query[0]
+
+    if kind == 'and':
+        predicates = [compile(subQuery, isFavorite) for subQuery in query[1]]
+        return lambda entry: all(predicate(entry) for predicate in predicates)
+
+    if kind == 'or':
+        predicates = [compile(subQuery, isFavorite) for subQuery in query[1]]
+        return lambda entry: any(predicate(entry) for predicate in predicates)
+
+    if kind == 'not':
+        predicate = compile(query[1], isFavorite)
+        return lambda entry: not predicate(entry)
+
+    if kind == 'favorites':
+        return lambda entry: isFavorite(entry[IDX_ARTIST], entry[IDX_ALBUM])
+
+    if kind in TEXT_FIELDS:
+        field, value = TEXT_FIELDS[kind], query[1]
+
+        if kind in SUBSTRING_FIELDS: return lambda entry: value in entry[field].lower()
+        else:                        return lambda entry: value == entry[field].lower()
+
+    field, min, max = NUMERIC_FIELDS[kind], query[1], query[2]
+    return lambda entry: (min is None or entry[field] >= min) and (max is None or entry[field] <= max)
+
+
+def run(text, index, isFavorite):
+    """ Return the tracks of the given index matching the given query string, may raise QueryError """
+    predicate = compile(parse(text), isFavorite)
+
+    return [entry[IDX_TRACK] for entry in index if predicate(entry)]
@@ -85,6 +85,7 @@ class Track:
         if resource is not None: self.tags[TAG_RES] = resource
 
 
+    def setFilePath(self, path):           self.tags[TAG_RES] = path
     def setNumber(self, nb):               self.tags[TAG_NUM] = nb
     def setTitle(self, title):             self.tags[TAG_TIT] = title
     def setArtist(self, artist):           self.tags[TAG_ART] = artist
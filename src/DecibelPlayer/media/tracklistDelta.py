@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# Modifications of the tracklist, sent to modules with MSG_EVT_TRACKLIST_DELTA
+#
+# Modules that need the tracks keep their own copy of the tracklist and apply each delta to it,
+# so that the cost of a modification is proportional to the number of modified tracks, not to the size of the tracklist
+#
+# A delta is a tuple, its first item gives its kind:
+#     (DELTA_INSERTED,  position, tracks)        Tracks have been inserted, the first one is now at the given position
+#     (DELTA_REMOVED,   start, end)              Tracks located at [start, end) have been removed
+#     (DELTA_MOVED,     start, end, position)    Tracks located at [start, end) have been moved, the first one is now at the given position
+#     (DELTA_REORDERED, newOrder)                Tracks have been reordered, newOrder[i] being the previous position of the track now at i
+
+(
+    DELTA_INSERTED,    # Some tracks have been inserted
+    DELTA_REMOVED,     # A range of tracks has been removed
+    DELTA_MOVED,       # A range of tracks has been moved
+    DELTA_REORDERED,   # The whole tracklist has been reordered (e.g., sorted)
+) = range(4)
+
+
+def apply(tracks, delta):
+    """ Apply the given delta to the given list of tracks """
+    kind = delta[0]
+
+    if kind == DELTA_INSERTED:
+        (position, inserted) = delta[1:]
+        tracks[position:position] = inserted
+
+    elif kind == DELTA_REMOVED:
+        (start, end) = delta[1:]
+        del tracks[start:end]
+
+    elif kind == DELTA_MOVED:
+        (start, end, position) = delta[1:]
+        moved = tracks[start:end]
+        del tracks[start:end]
+        tracks[position:position] = moved
+
+    else:
+        tracks[:] = [tracks[previousIdx] for previousIdx in delta[1]]
+
+
+def getReorderDelta(newOrder):
+    """
+        Return the delta corresponding to the given new order, None if nothing has moved
+        A single block of tracks that has been moved (e.g., using DND) is described by a DELTA_MOVED
+    """
+    first, last = 0, len(newOrder) - 1
+
+    while first <= last and newOrder[first] == first:
+        first += 1
+
+    if first > last:
+        return None
+
+    while newOrder[last] == last:
+        last -= 1
+
+    # Tracks before first and after last didn't move, a block move is a rotation of the others
+    split = newOrder[first]
+
+    if newOrder[first:last+1] != range(split, last+1) + range(first, split):
+        return (DELTA_REORDERED, newOrder)
+
+    # The rotation is described by moving the smallest of the two blocks
+    if last + 1 - split <= split - first: return (DELTA_MOVED, split, last + 1, first)
+    else:                                 return (DELTA_MOVED, first, split, first + last + 1 - split)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+
+# Aggregates over the tracks of the tracklist (count, length, formats, errors)
+#
+# They are updated with each modification of the tracklist, proportionally to the number of modified tracks
+# Consumers receive a copy with MSG_EVT_TRACKLIST_DELTA, so they never have to go through the tracks themselves
+
+
+class TracklistStats:
+
+    def __init__(self):
+        """ Constructor """
+        self.clear()
+
+
+    def clear(self):
+        """ There is no track anymore """
+        self.count   = 0
+        self.length  = 0
+        self.errors  = 0
+        self.formats = {}
+
+
+    def copy(self):
+        """ Return a copy of these aggregates, which won't change when the tracklist is modified """
+        stats         = TracklistStats()
+        stats.count   = self.count
+        stats.length  = self.length
+        stats.errors  = self.errors
+        stats.formats = self.formats.copy()
+
+        return stats
+
+
+    # --== Updates ==--
+
+
+    def add(self, tracks):
+        """ Some tracks have been added """
+        for track in tracks:
+            format               = track.getType()
+            self.length         += track.getLength()
+            self.formats[format] = self.formats.get(format, 0) + 1
+
+        self.count += len(tracks)
+
+
+    def remove(self, tracks, nbErrors):
+        """ Some tracks have been removed, nbErrors of them having been flagged because of an error """
+        for track in tracks:
+            format               = track.getType()
+            self.length         -= track.getLength()
+            self.formats[format] -= 1
+
+            if self.formats[format] == 0:
+                del self.formats[format]
+
+        self.count  -= len(tracks)
+        self.errors -= nbErrors
+
+
+    def addError(self):
+        """ A track has been flagged because of an error """
+        self.errors += 1
+
+
+    # --== Queries ==--
+
+
+    def getCount(self):
+        """ Return the number of tracks """
+        return self.count
+
+
+    def getLength(self):
+        """ Return the total length of the tracks, in seconds """
+        return self.length
+
+
+    def getErrorCount(self):
+        """ Return the number of tracks flagged because of an error """
+        return self.errors
+
+
+    def getFormatCount(self, format):
+        """ Return the number of tracks in the given format (e.g., mp3) """
+        return self.formats.get(format, 0)
+
+
+    def getFormats(self):
+        """ Return the formats of the tracks """
+        return self.formats.keys()
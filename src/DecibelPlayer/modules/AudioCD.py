@@ -87,7 +87,7 @@ class AudioCD(modules.ThreadedModule):
                         consts.MSG_EVT_EXPLORER_CHANGED: self.onExplorerChanged,
                    }
 
-        modules.ThreadedModule.__init__(self, handlers)
+        modules.ThreadedModule.__init__(self, handlers, dedicatedThread=True)
 
 
     def __drawAlbumLenCell(self, column, cell, model, iter):
@@ -258,12 +258,12 @@ class AudioCD(modules.ThreadedModule):
             return
 
         # Create a temporary tree, download CDDB information if needed, and update the tree
-        gobject.idle_add(self.createTree, discInfo[DISC_NB_TRACKS])
+        self.gtkSubmit(self.createTree, discInfo[DISC_NB_TRACKS])
         if not self.isDiscInCache(discInfo) and prefs.get(__name__, 'use-cddb', PREFS_DFT_USE_CDDB):
             cddb = self.cddbRequest(discInfo)
             if cddb is not None:
                 self.addDiscToCache(discInfo, cddb)
-        gobject.idle_add(self.updateTree, discInfo)
+        self.gtkSubmit(self.updateTree, discInfo)
 
 
     def reloadDisc(self):
@@ -22,10 +22,11 @@ import os.path, traceback
 from time      import time
 from gettext   import gettext as _
 from .. import modules, tools
-from ..tools     import consts
+from ..tools     import consts, metrics
 from ..tools.log import logger
 
-MOD_INFO = ('AudioScrobbler', 'AudioScrobbler', _('Keep your Last.fm profile up to date'), [], False, False, consts.MODCAT_INTERNET)
+MOD_INFO     = ('AudioScrobbler', 'AudioScrobbler', _('Keep your Last.fm profile up to date'), [], False, False, consts.MODCAT_INTERNET)
+MOD_HEADLESS = True
 
 CLI_ID         = 'dbl'
 CLI_VER        = '0.5'
@@ -69,7 +70,7 @@ class AudioScrobbler(modules.ThreadedModule):
                         consts.MSG_EVT_MOD_UNLOADED: self.onModUnloaded,
                    }
 
-        modules.ThreadedModule.__init__(self, handlers)
+        modules.ThreadedModule.__init__(self, handlers, dedicatedThread=True)
 
 
     def getAuthInfo(self):
@@ -318,6 +319,8 @@ class AudioScrobbler(modules.ThreadedModule):
         except:
             self.cache = []
 
+        metrics.setGauge('scrobbler_queue_depth', self.getCacheSize)
+
 
     def onNewTrack(self, track):
         """ A new track has started """
@@ -349,6 +352,8 @@ class AudioScrobbler(modules.ThreadedModule):
 
     def onModUnloaded(self):
         """ The module has been unloaded """
+        metrics.removeGauge('scrobbler_queue_depth')
+
         if self.paused:
             self.currTrack[TRK_UNPAUSED_TIMESTAMP] = int(time())
         self.paused = False
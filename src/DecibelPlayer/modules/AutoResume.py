@@ -21,11 +21,13 @@ from __future__ import absolute_import
 import time
 
 from .. import modules
+from ..media.tracklistDelta import DELTA_INSERTED
 
 from ..tools import consts, prefs
 from gettext import gettext as _
 
-MOD_INFO = ('Automatic Resume', _('Automatic Resume'), _('Automatically resume playback on startup'), [], False, False, consts.MODCAT_DECIBEL)
+MOD_INFO     = ('Automatic Resume', _('Automatic Resume'), _('Automatically resume playback on startup'), [], False, False, consts.MODCAT_DECIBEL)
+MOD_HEADLESS = True
 
 # Maximum time between the startup and the restoration of the last playlist
 MAX_TRACKLIST_RESTORATION_DELAY = 1.5
@@ -35,16 +37,16 @@ class AutoResume(modules.Module):
     def __init__(self):
         """ Constructor """
         handlers = {
-                        consts.MSG_EVT_PAUSED:         self.onPaused,
-                        consts.MSG_EVT_STOPPED:        self.onStop,
-                        consts.MSG_EVT_UNPAUSED:       self.onUnpaused,
-                        consts.MSG_EVT_APP_QUIT:       self.onModUnloaded,
-                        consts.MSG_EVT_NEW_TRACK:      self.onNewTrack,
-                        consts.MSG_EVT_APP_STARTED:    self.onAppStarted,
-                        consts.MSG_EVT_MOD_LOADED:     self.onModLoaded,
-                        consts.MSG_EVT_MOD_UNLOADED:   self.onModUnloaded,
-                        consts.MSG_EVT_NEW_TRACKLIST:  self.onNewTracklist,
-                        consts.MSG_EVT_TRACK_POSITION: self.onNewTrackPosition,
+                        consts.MSG_EVT_PAUSED:          self.onPaused,
+                        consts.MSG_EVT_STOPPED:         self.onStop,
+                        consts.MSG_EVT_UNPAUSED:        self.onUnpaused,
+                        consts.MSG_EVT_APP_QUIT:        self.onModUnloaded,
+                        consts.MSG_EVT_NEW_TRACK:       self.onNewTrack,
+                        consts.MSG_EVT_APP_STARTED:     self.onAppStarted,
+                        consts.MSG_EVT_MOD_LOADED:      self.onModLoaded,
+                        consts.MSG_EVT_MOD_UNLOADED:    self.onModUnloaded,
+                        consts.MSG_EVT_TRACK_POSITION:  self.onNewTrackPosition,
+                        consts.MSG_EVT_TRACKLIST_DELTA: self.onTracklistDelta,
                    }
 
         modules.Module.__init__(self, handlers)
@@ -62,20 +64,14 @@ class AutoResume(modules.Module):
         if not self.playing or self.currTrack is None:
             return
 
-        # Make sure the playlist is the same one
-        if len(tracklist) != len(self.currTracklist):
+        # Make sure the playlist is the same one, only its length and the position of the track are saved (not the whole playlist)
+        if len(tracklist) != self.tracklistLen:
             return
 
-        trackIdx = -1
-        for i in xrange(len(tracklist)):
-            if tracklist[i] != self.currTracklist[i]:
-                return
-
-            if tracklist[i] == self.currTrack:
-                trackIdx = i
+        trackIdx = self.currTrack.getPlaylistPos() - 1
 
         # Once here, we know playback can be resumed
-        if trackIdx != -1:
+        if 0 <= trackIdx < len(tracklist) and tracklist[trackIdx] == self.currTrack:
             if self.paused: modules.postMsg(consts.MSG_CMD_TRACKLIST_PLAY_PAUSE, {'idx': trackIdx, 'seconds': self.currPos})
             else:           modules.postMsg(consts.MSG_CMD_TRACKLIST_PLAY,       {'idx': trackIdx, 'seconds': self.currPos})
 
@@ -94,11 +90,12 @@ class AutoResume(modules.Module):
         """ The module has been loaded """
         self.startTime = 0
 
-        self.paused        = prefs.get(__name__, 'was-paused', False)
-        self.playing       = prefs.get(__name__, 'was-playing', False)
-        self.currPos       = prefs.get(__name__, 'position', 0)
-        self.currTrack     = prefs.get(__name__, 'track', None)
-        self.currTracklist = prefs.get(__name__, 'tracklist', [])
+        self.paused         = prefs.get(__name__, 'was-paused', False)
+        self.playing        = prefs.get(__name__, 'was-playing', False)
+        self.currPos        = prefs.get(__name__, 'position', 0)
+        self.currTrack      = prefs.get(__name__, 'track', None)
+        self.tracklistLen   = prefs.get(__name__, 'tracklist-length', 0)
+        self.currTrackCount = 0
 
 
     def onModUnloaded(self):
@@ -107,7 +104,7 @@ class AutoResume(modules.Module):
         prefs.set(__name__, 'was-playing', self.playing)
         prefs.set(__name__, 'position', self.currPos)
         prefs.set(__name__, 'track', self.currTrack)
-        prefs.set(__name__, 'tracklist', self.currTracklist)
+        prefs.set(__name__, 'tracklist-length', self.currTrackCount)
 
 
     def onPaused(self):
@@ -138,14 +135,11 @@ class AutoResume(modules.Module):
         self.currPos = seconds
 
 
-    def onNewTracklist(self, tracks, playtime):
-        """ A new tracklist has been set """
-        if time.time() - self.startTime <= MAX_TRACKLIST_RESTORATION_DELAY:
-            # Ignore the very first (empty) tracklist
-            if len(tracks) != 0:
-                self.tryToRestore(tracks)
+    def onTracklistDelta(self, delta, stats):
+        """ The tracklist has been modified """
+        self.currTrackCount = stats.getCount()
 
-                self.startTime     = 0
-                self.currTracklist = tracks
-        else:
-            self.currTracklist = tracks
+        # The restored tracklist is inserted as a whole, shortly after the startup
+        if delta[0] == DELTA_INSERTED and time.time() - self.startTime <= MAX_TRACKLIST_RESTORATION_DELAY:
+            self.tryToRestore(delta[2])
+            self.startTime = 0
@@ -23,7 +23,8 @@ import gobject
 from .. import modules
 from ..tools   import consts, prefs
 
-MOD_INFO = ('Automatic Shuffle', _('Automatic Shuffle'), _('Periodically shuffle the playlist'), [], False, True, consts.MODCAT_DECIBEL)
+MOD_INFO     = ('Automatic Shuffle', _('Automatic Shuffle'), _('Periodically shuffle the playlist'), [], False, True, consts.MODCAT_DECIBEL)
+MOD_HEADLESS = True
 
 PREFS_DFT_ENABLED     = False
 PREFS_DFT_PERIODICITY = 15
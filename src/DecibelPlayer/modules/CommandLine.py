@@ -20,9 +20,13 @@ from __future__ import absolute_import
 
 import os.path, traceback
 from .. import media, modules
-from ..tools import consts, log, pickleSave, pickleLoad, prefs
+from ..tools import consts, log, pickleLoad, prefs
+from ..tools.journal import ListJournal
+from ..media import tracklistDelta
+from ..media.tracklistDelta import DELTA_INSERTED, DELTA_REMOVED, DELTA_MOVED
 
-MOD_INFO = ('Command Line Support', 'Command Line Support', '', [], True, False, consts.MODCAT_NONE)
+MOD_INFO     = ('Command Line Support', 'Command Line Support', '', [], True, False, consts.MODCAT_NONE)
+MOD_HEADLESS = True
 
 
 class CommandLine(modules.ThreadedModule):
@@ -30,8 +34,8 @@ class CommandLine(modules.ThreadedModule):
     def __init__(self):
         """ Constructor """
         handlers = {
-                        consts.MSG_EVT_APP_STARTED:   self.onAppStarted,
-                        consts.MSG_EVT_NEW_TRACKLIST: self.onNewTracklist,
+                        consts.MSG_EVT_APP_STARTED:     self.onAppStarted,
+                        consts.MSG_EVT_TRACKLIST_DELTA: self.onTracklistDelta,
                    }
 
         modules.ThreadedModule.__init__(self, handlers)
@@ -42,22 +46,55 @@ class CommandLine(modules.ThreadedModule):
 
     def onAppStarted(self):
         """ Try to fill the playlist by using the files given on the command line or by restoring the last playlist """
-        # The file 'saved-playlist.txt' uses an old format, we now use 'saved-playlist-2.txt'
-        (options, args)    = prefs.getCmdLine()
-        self.savedPlaylist = os.path.join(consts.dirCfg, 'saved-playlist-2.txt')
+        # The files 'saved-playlist.txt' and 'saved-playlist-2.txt' use old formats, we now use 'saved-playlist.journal'
+        (options, args) = prefs.getCmdLine()
+        oldPlaylist     = os.path.join(consts.dirCfg, 'saved-playlist-2.txt')
+        self.tracks     = []      # The tracklist, rebuilt from the deltas
+        self.synced     = False   # False if the journal must be entirely rewritten
+        self.journal    = ListJournal(os.path.join(consts.dirCfg, 'saved-playlist.journal'))
+        self.restored   = None    # Number of restored tracks, not yet inserted in the tracklist
 
         if len(args) != 0:
             log.logger.info('[%s] Filling playlist with files given on command line' % MOD_INFO[modules.MODINFO_NAME])
             modules.postMsg(consts.MSG_CMD_TRACKLIST_SET, {'tracks': media.getTracks(args), 'playNow': True})
-        else:
+        elif self.journal.exists() or os.path.exists(oldPlaylist):
             try:
-                tracks = [media.track.unserialize(serialTrack) for serialTrack in pickleLoad(self.savedPlaylist)]
-                modules.postMsg(consts.MSG_CMD_TRACKLIST_SET, {'tracks': tracks, 'playNow': False})
+                if self.journal.exists():
+                    serialTracks = self.journal.load()
+                else:
+                    serialTracks = pickleLoad(oldPlaylist)
+                    self.journal.set(serialTracks)
+
+                # The journal already contains the tracks that are given to the tracklist
+                self.restored = len(serialTracks)
+                modules.postMsg(consts.MSG_CMD_TRACKLIST_SET, {'tracks': [media.track.unserialize(serialTrack) for serialTrack in serialTracks], 'playNow': False})
                 log.logger.info('[%s] Restored playlist' % MOD_INFO[modules.MODINFO_NAME])
             except:
-                log.logger.error('[%s] Unable to restore playlist from %s\n\n%s' % (MOD_INFO[modules.MODINFO_NAME], self.savedPlaylist, traceback.format_exc()))
+                log.logger.error('[%s] Unable to restore playlist from %s\n\n%s' % (MOD_INFO[modules.MODINFO_NAME], self.journal.filename, traceback.format_exc()))
+
 
+    def onTracklistDelta(self, delta, stats):
+        """ The tracklist has been modified, journal the modification """
+        tracklistDelta.apply(self.tracks, delta)
 
-    def onNewTracklist(self, tracks, playtime):
-        """ A new tracklist has been set """
-        pickleSave(self.savedPlaylist, [track.serialize() for track in tracks])
+        # There's nothing to save when the restored tracks are inserted
+        if self.restored is not None:
+            self.synced   = (delta[0] == DELTA_INSERTED and len(self.tracks) == self.restored)
+            self.restored = None
+
+            if self.synced:
+                return
+
+        if not self.synced:
+            self.synced = True
+            self.journal.set([track.serialize() for track in self.tracks])
+        elif delta[0] == DELTA_INSERTED:
+            self.journal.splice(delta[1], delta[1], [track.serialize() for track in delta[2]])
+        elif delta[0] == DELTA_REMOVED:
+            self.journal.splice(delta[1], delta[2], [])
+        elif delta[0] == DELTA_MOVED:
+            (start, end, position) = delta[1:]
+            self.journal.splice(start, end, [])
+            self.journal.splice(position, position, [track.serialize() for track in self.tracks[position:position + end - start]])
+        else:
+            self.journal.set([track.serialize() for track in self.tracks])
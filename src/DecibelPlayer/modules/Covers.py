@@ -20,7 +20,7 @@ import os, traceback
 
 from gettext   import gettext as _
 from .. import modules, tools
-from ..tools     import consts, prefs
+from ..tools     import consts, metrics, prefs
 from ..tools.log import logger
 
 
@@ -83,7 +83,7 @@ class Covers(modules.ThreadedModule):
                         consts.MSG_EVT_MOD_UNLOADED: self.onModUnloaded,
                    }
 
-        modules.ThreadedModule.__init__(self, handlers)
+        modules.ThreadedModule.__init__(self, handlers, dedicatedThread=True)
 
 
     def __resizeWithRatio(self, width, height, maxWidth, maxHeight):
@@ -381,6 +381,7 @@ class Covers(modules.ThreadedModule):
 
             # Make sure the files are still there
             if os.path.exists(pathThumbnail) and os.path.exists(pathFullSize):
+                metrics.incCounter('cover_cache_hits')
                 modules.postMsg(consts.MSG_CMD_SET_COVER, {'track': track, 'pathThumbnail': pathThumbnail, 'pathFullSize': pathFullSize})
                 return
 
@@ -393,6 +394,9 @@ class Covers(modules.ThreadedModule):
         if rawCover is None:
             rawCover = self.getFromCache(artist, album)
 
+            if rawCover is None: metrics.incCounter('cover_cache_misses')
+            else:                metrics.incCounter('cover_cache_hits')
+
         # If we still don't have a cover, maybe we can try to download it
         if rawCover is None:
             modules.postMsg(consts.MSG_CMD_SET_COVER, {'track': track, 'pathThumbnail': None, 'pathFullSize': None})
@@ -41,7 +41,7 @@ class CtrlPanel(modules.Module):
                         consts.MSG_EVT_NEW_TRACK:        self.onNewTrack,
                         consts.MSG_EVT_TRACK_MOVED:      self.onCurrentTrackMoved,
                         consts.MSG_EVT_APP_STARTED:      self.onAppStarted,
-                        consts.MSG_EVT_NEW_TRACKLIST:    self.onNewTracklist,
+                        consts.MSG_EVT_TRACKLIST_DELTA:  self.onTracklistDelta,
                         consts.MSG_EVT_VOLUME_CHANGED:   self.onVolumeChanged,
                         consts.MSG_EVT_TRACK_POSITION:   self.onNewTrackPosition,
                    }
@@ -162,9 +162,9 @@ class CtrlPanel(modules.Module):
         self.btnPlay.set_tooltip_text(_('Pause the current track'))
 
 
-    def onNewTracklist(self, tracks, playtime):
-        """ A new tracklist has been set """
-        self.btnPlay.set_sensitive(playtime != 0)
+    def onTracklistDelta(self, delta, stats):
+        """ The tracklist has been modified """
+        self.btnPlay.set_sensitive(stats.getCount() != 0)
 
 
     # --== GTK handlers ==--
@@ -18,9 +18,12 @@
 
 import dbus, dbus.service, gobject, traceback
 from .. import media, modules
-from ..tools import consts, log, prefs
+from ..tools import consts, log, metrics, prefs, profiler
+from ..media import tracklistDelta
+from ..media.tracklistStats import TracklistStats
 
-MOD_INFO = ('D-Bus Support', 'D-Bus Support', '', [], True, False, consts.MODCAT_NONE)
+MOD_INFO     = ('D-Bus Support', 'D-Bus Support', '', [], True, False, consts.MODCAT_NONE)
+MOD_HEADLESS = True
 
 
 # MPRIS caps constants
@@ -45,10 +48,10 @@ class DBus(modules.Module):
                         consts.MSG_EVT_NEW_TRACK:        self.onNewTrack,
                         consts.MSG_EVT_TRACK_MOVED:      self.onCurrentTrackMoved,
                         consts.MSG_EVT_APP_STARTED:      self.onAppStarted,
-                        consts.MSG_EVT_NEW_TRACKLIST:    self.onNewTracklist,
                         consts.MSG_EVT_VOLUME_CHANGED:   self.onVolumeChanged,
                         consts.MSG_EVT_TRACK_POSITION:   self.onNewTrackPosition,
                         consts.MSG_EVT_REPEAT_CHANGED:   self.onRepeatChanged,
+                        consts.MSG_EVT_TRACKLIST_DELTA:  self.onTracklistDelta,
                    }
 
         modules.Module.__init__(self, handlers)
@@ -58,7 +61,7 @@ class DBus(modules.Module):
         """ Return an integer sticking to the MPRIS caps definition """
         caps = CAPS_CAN_HAS_TRACKLIST
 
-        if len(self.tracklist) != 0:
+        if self.stats.getCount() != 0:
             caps |= CAPS_CAN_PLAY
 
         if self.currTrack is not None:
@@ -91,6 +94,7 @@ class DBus(modules.Module):
         """ Initialize this module """
         self.repeat       = False
         self.paused       = False
+        self.stats        = TracklistStats()
         self.tracklist    = []
         self.currTrack    = None
         self.canGoNext    = False
@@ -151,11 +155,12 @@ class DBus(modules.Module):
         self.busObjectPlayer.StatusChange(self.getMPRISStatus())
 
 
-    def onNewTracklist(self, tracks, playtime):
-        """ A new tracklist has been set """
-        self.tracklist = tracks
+    def onTracklistDelta(self, delta, stats):
+        """ The tracklist has been modified """
+        self.stats = stats
+        tracklistDelta.apply(self.tracklist, delta)
         self.busObjectPlayer.CapsChange(self.getMPRISCaps())
-        self.busObjectTracklist.TrackListChange(len(tracks))
+        self.busObjectTracklist.TrackListChange(stats.getCount())
 
 
     def onCurrentTrackMoved(self, hasNext, hasPrevious):
@@ -196,13 +201,41 @@ class DBusObjectRoot(dbus.service.Object):
         return (1, 0)
 
 
-    # This function is not part of the MPRIS
+    # These functions are not part of the MPRIS
 
 
     @dbus.service.method(consts.dbusInterface, in_signature='', out_signature='')
     def RaiseWindow(self):
-        """ Raises the window """
-        prefs.getWidgetsTree().get_object('win-main').present()
+        """ Raises the window, if any (there is none in headless mode) """
+        if not prefs.isHeadless():
+            prefs.getWidgetsTree().get_object('win-main').present()
+
+
+    @dbus.service.method(consts.dbusInterface, in_signature='', out_signature='a{sd}')
+    def GetMetrics(self):
+        """ Returns the current value of all metrics (e.g., tracks_played, process_rss_bytes) """
+        return metrics.getSnapshot()
+
+
+    @dbus.service.method(consts.dbusInterface, in_signature='', out_signature='b')
+    def ProfileStart(self):
+        """ Starts profiling the main loop and worker threads, returns False if profiling was already enabled """
+        return profiler.start()
+
+
+    @dbus.service.method(consts.dbusInterface, in_signature='', out_signature='s')
+    def ProfileStop(self):
+        """ Stops profiling, returns the pstats file where statistics have been saved (empty if profiling was not enabled) """
+        filename = profiler.stop()
+
+        if filename is None: return ''
+        else:                return filename
+
+
+    @dbus.service.method(consts.dbusInterface, in_signature='', out_signature='s')
+    def HeapSnapshot(self):
+        """ Saves the number of objects of each type, returns the file where they have been saved """
+        return profiler.saveHeapSnapshot()
 
 
 
@@ -231,7 +264,7 @@ class DBusObjectTracklist(dbus.service.Object):
     @dbus.service.method(consts.dbusInterface, in_signature='', out_signature='i')
     def GetLength(self):
         """ Number of elements in the TrackList """
-        return len(self.module.tracklist)
+        return self.module.stats.getCount()
 
 
     @dbus.service.method(consts.dbusInterface, in_signature='sb', out_signature='i')
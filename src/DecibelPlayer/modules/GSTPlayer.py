@@ -21,11 +21,12 @@ from __future__ import absolute_import
 from time  import time
 import gobject
 from .. import modules
-from ..tools import consts, prefs
+from ..tools import consts, metrics, prefs
 from ..media import audioplayer
 
 
 MOD_INFO           = ('GStreamer Player', 'GStreamer Player', '', [], True, False, consts.MODCAT_NONE)
+MOD_HEADLESS       = True
 MIN_PLAYBACK_DELAY = 1.5
 
 
@@ -34,8 +35,12 @@ class GSTPlayer(modules.Module):
 
     def __init__(self):
         """ Constructor """
+        # Nothing must be heard while replaying recorded messages
+        if prefs.getCmdLine()[0].replay_bus is None: audioSink = 'autoaudiosink'
+        else:                                        audioSink = 'fakesink'
+
         # The player must be created during the application startup, not when the application is ready (MSG_EVT_APP_STARTED)
-        self.player = audioplayer.AudioPlayer(self.__onTrackEnded, not prefs.getCmdLine()[0].playbin)
+        self.player = audioplayer.AudioPlayer(self.__onTrackEnded, not prefs.getCmdLine()[0].playbin, audioSink)
 
         handlers = {
                         consts.MSG_CMD_STEP:         self.onStep,
@@ -125,6 +130,8 @@ class GSTPlayer(modules.Module):
 
     def onPlay(self, uri, forced):
         """ Play the given URI """
+        metrics.incCounter('tracks_played')
+
         if forced or uri != self.nextURI:
             self.player.stop()
             self.player.setURI(uri)
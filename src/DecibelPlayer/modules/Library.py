@@ -18,14 +18,16 @@
 
 from __future__ import absolute_import
 
-import os
+import os, threading, traceback
 from gettext               import ngettext, gettext as _
-from os.path               import isdir, isfile
+from os.path               import isfile
 import gtk
-from gobject               import idle_add, TYPE_STRING, TYPE_INT, TYPE_PYOBJECT
-from .. import media, modules, tools
-from ..tools                 import consts, htmlEscape, icons, prefs, pickleLoad, pickleSave
+from gobject               import idle_add, timeout_add, TYPE_STRING, TYPE_INT, TYPE_PYOBJECT
+from .. import modules, tools
+from ..tools                 import consts, htmlEscape, icons, metrics, prefs
 from ..tools.log             import logger
+from ..media                 import library, libraryService, query
+from ..media.library         import ALB_NAME, ALB_INDEX, ALB_LENGTH, ART_NAME, ART_INDEX
 from ..media.track.fileTrack import FileTrack
 
 MOD_INFO = ('Library', _('Library'), _('Organize your music by tags'), [], False, True, consts.MODCAT_EXPLORER)
@@ -41,23 +43,6 @@ MOD_L10N = MOD_INFO[modules.MODINFO_L10N]
 ) = range(4)
 
 
-# Information associated with artists
-(
-    ART_NAME,       # Its name
-    ART_INDEX,      # Name of the directory: avoid the use of the artist name as a filename (may contain invalid characters)
-    ART_NB_ALBUMS   # How many albums
-) = range(3)
-
-
-# Information associated with albums
-(
-    ALB_NAME,       # Its name
-    ALB_INDEX,      # Name of the file: avoid the use of the artist name as a filename (may contain invalid characters)
-    ALB_NB_TRACKS,  # Number of tracks
-    ALB_LENGTH      # Complete duration (include all tracks)
-) = range(4)
-
-
 # Possible types for a node of the tree
 (
     TYPE_ARTIST,            # Artist
@@ -66,8 +51,18 @@ MOD_L10N = MOD_INFO[modules.MODINFO_L10N]
     TYPE_HEADER,            # Alphabetical header
     TYPE_FAVORITES_BANNER,  # Favorites banner (when showing only favorites)
     TYPE_GENRE_BANNER,      # Shown when filtering by genre
+    TYPE_SMART_PLAYLIST,    # Tracks matching a saved query
     TYPE_NONE               # Used for fake children
-) = range(7)
+) = range(8)
+
+
+# Sources of tracks, cheap to extract from the tree and resolved into tracks in a background thread
+(
+    SRC_TRACKS,          # A list of tracks
+    SRC_ALBUM,           # (library name, artist index, album index)
+    SRC_ARTIST,          # (library name, artist index)
+    SRC_SMART_PLAYLIST   # (library name, smart playlist name)
+) = range(4)
 
 
 # The format of a row in the treeview
@@ -76,20 +71,87 @@ MOD_L10N = MOD_INFO[modules.MODINFO_L10N]
     ROW_ALBUM_LEN, # Length of the album (invisible when not an album)
     ROW_NAME,      # Item name
     ROW_TYPE,      # The type of the item (e.g., directory, file)
-    ROW_FULLPATH,  # The full path to the item
+    ROW_FULLPATH,  # The full path to the item (path within the library for artists and albums)
     ROW_DATA       # Arbitrary data that depend on the type of the row
 ) = range(6)
 
 
 # Constants
-VERSION                           = 4                                      # Used to check compatibility
-ROOT_PATH                         = os.path.join(consts.dirCfg, 'Library') # Path where libraries are stored
 FAKE_CHILD                        = (None, None, '', TYPE_NONE, '', None)  # We use a lazy tree
 PREFS_DEFAULT_PREFIXES            = {'the ': None}                         # Prefixes are put at the end of artists' names
 PREFS_DEFAULT_LIBRARIES           = {}                                     # No libraries at first
 PREFS_DEFAULT_TREE_STATE          = {}                                     # No state at first
 PREFS_DEFAULT_GENRE_FILTERS       = {}                                     # Unfiltered libraries by default
 PREFS_DEFAULT_SHOW_ONLY_FAVORITES = False                                  # Show all files by default
+PREFS_DEFAULT_SMART_PLAYLISTS     = {}                                     # No saved queries at first
+RELOCATION_NB_SAMPLES             = 25                                     # How many files are checked before relocating a library
+RELOCATION_MIN_FOUND_RATIO        = 0.8                                    # Below this ratio of sampled files found, the user must confirm the relocation
+RESOLUTION_BATCH_SIZE             = 250                                    # Resolved tracks are sent to the tracklist by batches of this size
+PROGRESS_POLL_DELAY               = 100                                    # How often (in ms) the progress of a work done by another thread is updated
+
+
+class TrackResolver(threading.Thread):
+    """
+        Resolve a list of sources into tracks in a background thread
+        If onBatch is None, all tracks are stored in self.tracks, otherwise onBatch(tracks, isFirst) is called for each batch
+        Batches are delivered only once the previous resolver, if any, is done, so that requests are handled in order
+    """
+
+    # Held while delivering a batch, so that no batch can be delivered once cancel() has returned
+    deliveryLock = threading.Lock()
+
+
+    def __init__(self, sources, resolve, onBatch=None, previous=None):
+        """ Constructor """
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+        self.tracks    = []
+        self.resolve   = resolve
+        self.onBatch   = onBatch
+        self.sources   = sources
+        self.previous  = previous
+        self.cancelled = False
+
+
+    def cancel(self):
+        """ Stop resolving as soon as possible, pending batches are not delivered """
+        self.deliveryLock.acquire()
+        self.cancelled = True
+        self.deliveryLock.release()
+
+
+    def __deliver(self, tracks, isFirst):
+        """ Deliver a batch of resolved tracks, unless cancelled in the meantime """
+        if self.previous is not None:
+            self.previous.join()
+            self.previous = None
+
+        self.deliveryLock.acquire()
+        if not self.cancelled:
+            if self.onBatch is None: self.tracks.extend(tracks)
+            else:                    self.onBatch(tracks, isFirst)
+        self.deliveryLock.release()
+
+
+    def run(self):
+        """ Resolve the sources, the first batch is delivered as soon as it is not empty so that playback can start immediately """
+        batch   = []
+        isFirst = True
+
+        for tracks in self.resolve(self.sources):
+            if self.cancelled:
+                return
+
+            batch.extend(tracks)
+
+            if len(batch) != 0 and (isFirst or len(batch) >= RESOLUTION_BATCH_SIZE):
+                self.__deliver(batch, isFirst)
+                batch   = []
+                isFirst = False
+
+        if not self.cancelled and (isFirst or len(batch) != 0):
+            self.__deliver(batch, isFirst)
 
 
 class Library(modules.Module):
@@ -137,6 +199,7 @@ class Library(modules.Module):
 
         self.tree.setDNDSources([consts.DND_TARGETS[consts.DND_DAP_TRACKS]])
         # GTK handlers
+        self.tree.connect('drag-begin',                 self.onDragBegin)
         self.tree.connect('drag-data-get',              self.onDragDataGet)
         self.tree.connect('key-press-event',            self.onKeyPressed)
         self.tree.connect('exttreeview-row-expanded',   self.onRowExpanded)
@@ -163,24 +226,9 @@ class Library(modules.Module):
         else:                                            cell.set_property('visible', True)
 
 
-    def __createEmptyLibrary(self, name):
-        """ Create bootstrap files for a new library """
-        import shutil
-
-        # Make sure that the root directory of all libraries exists
-        if not isdir(ROOT_PATH):
-            os.mkdir(ROOT_PATH)
-        # Start from an empty library
-        libPath = os.path.join(ROOT_PATH, name)
-        if isdir(libPath):
-            shutil.rmtree(libPath)
-        os.mkdir(libPath)
-        pickleSave(os.path.join(libPath, 'files'), {})
-
-
     def refreshLibrary(self, parent, libName, path, creation=False):
         """ Refresh the given library, must be called through idle_add() """
-        import collections, shutil
+        import shutil
 
         from gui import progressDlg
 
@@ -191,157 +239,72 @@ class Library(modules.Module):
         progress = progressDlg.ProgressDlg(parent, header, _('The directory is scanned for media files. This can take some time.\nPlease wait.'))
         yield True
 
-        libPath = os.path.join(ROOT_PATH, libName)   # Location of the library
-
-        # If the version number has changed or does not exist, don't reuse any existing file and start from scratch
-        if not os.path.exists(os.path.join(libPath, 'VERSION_%u' % VERSION)):
-            self.__createEmptyLibrary(libName)
-
-        db         = {}                                                                # The dictionnary used to create the library
-        queue      = collections.deque((path,))                                        # Faster structure for appending/removing elements
-        mediaFiles = []                                                                # All media files found
-        newLibrary = {}                                                                # Reflect the current file structure of the library
-        oldLibrary = pickleLoad(os.path.join(libPath, 'files'))                        # Previous file structure of the same library
+        prefixes = prefs.get(__name__, 'prefixes', PREFS_DEFAULT_PREFIXES)
 
-        # Make sure the root directory still exists
-        if not os.path.exists(path):
-            queue.pop()
+        # Load favorites before removing the files from the disk
+        if self.currLib == libName: favorites = self.favorites
+        else:                       favorites = self.loadFavorites(libName)
 
-        while len(queue) != 0:
-            currDir      = queue.pop()
-            currDirMTime = os.stat(currDir).st_mtime
+        if isinstance(self.store, libraryService.RemoteStore):
+            # The service does the work, its progress is unknown
+            progress.setCancellable(False)
+            result = []
 
-            # Retrieve previous information on the current directory, if any
-            if currDir in oldLibrary: oldDirMTime, oldDirectories, oldFiles = oldLibrary[currDir]
-            else:                     oldDirMTime, oldDirectories, oldFiles = -1, [], {}
+            def remoteRefresh():
+                try:    result.append(self.store.refresh(libName, path, prefixes))
+                except: logger.error('[%s] Unable to refresh library "%s" through the service' % (MOD_INFO[modules.MODINFO_NAME], libName))
 
-            # If the directory has not been modified, keep old information
-            if currDirMTime == oldDirMTime:
-                files, directories = oldFiles, oldDirectories
-            else:
-                files, directories = {}, []
-                for (filename, fullPath) in tools.listDir(currDir):
-                    if isdir(fullPath):
-                        directories.append(fullPath)
-                    elif isfile(fullPath) and media.isSupported(filename):
-                        if filename in oldFiles: files[filename] = oldFiles[filename]
-                        else:                    files[filename] = [-1, FileTrack(fullPath)]
-
-            # Determine which files need to be updated
-            for filename, (oldMTime, track) in files.iteritems():
-                mTime = os.stat(track.getFilePath()).st_mtime
-                if mTime != oldMTime:
-                    files[filename] = [mTime, media.getTrackFromFile(track.getFilePath())]
-
-            newLibrary[currDir] = (currDirMTime, directories, files)
-            mediaFiles.extend([track for mTime, track in files.itervalues()])
-            queue.extend(directories)
-
-            # Update the progress dialog
-            try:
-                text = ngettext('Scanning directories (one track found)', 'Scanning directories (%(nbtracks)u tracks found)', len(mediaFiles))
-                progress.pulse(text % {'nbtracks': len(mediaFiles)})
-                yield True
-            except progressDlg.CancelledException:
-                progress.destroy()
-                if creation:
-                    shutil.rmtree(libPath)
-                yield False
+            def onTimeout():
+                """ Animate the progress dialog until the service is done, without blocking the GTK main loop """
+                if worker.isAlive():
+                    if creation: progress.pulse(_('Creating library...'))
+                    else:        progress.pulse(_('Refreshing library...'))
+                    return True
 
-        # From now on, the process should not be cancelled
-        progress.setCancellable(False)
-        if creation: progress.pulse(_('Creating library...'))
-        else:        progress.pulse(_('Refreshing library...'))
-        yield True
+                if len(result) == 0: progress.destroy()
+                else:                self.__onLibraryRefreshed(progress, libName, path, creation, favorites, result[0])
 
-        # Create the database
-        for track in mediaFiles:
-            album = track.getExtendedAlbum()
-            genre = track.getGenre().lower()
+                return False
 
-            if track.hasAlbumArtist(): artist = track.getAlbumArtist()
-            else:                      artist = track.getArtist()
+            worker = threading.Thread(target = remoteRefresh)
+            worker.start()
 
-            if artist in db:
-                allAlbums = db[artist]
+            timeout_add(PROGRESS_POLL_DELAY, onTimeout)
+        else:
+            libPath = self.store.getLibPath(libName)
+            scanner = library.Scanner(libPath, path, prefixes)
 
+            for nbTracks in scanner.scan():
+                # Update the progress dialog
                 try:
-                    albumNfo = allAlbums[album]
-                    albumNfo[0][genre] = None
-                    albumNfo[1].append(track)
-                except:
-                    allAlbums[album] = ({genre: None}, [track])
-            else:
-                db[artist] = {album: ({genre: None}, [track])}
+                    text = ngettext('Scanning directories (one track found)', 'Scanning directories (%(nbtracks)u tracks found)', nbTracks)
+                    progress.pulse(text % {'nbtracks': nbTracks})
+                    yield True
+                except progressDlg.CancelledException:
+                    progress.destroy()
+                    if creation:
+                        shutil.rmtree(libPath)
+                    yield False
+
+            # From now on, the process should not be cancelled
+            progress.setCancellable(False)
+            if creation: progress.pulse(_('Creating library...'))
+            else:        progress.pulse(_('Refreshing library...'))
+            yield True
 
-        progress.pulse()
-        yield True
+            for step in scanner.write():
+                progress.pulse()
+                yield True
 
-        # If an artist name begins with a known prefix, put it at the end (e.g., Future Sound of London (The))
-        prefixes = prefs.get(__name__, 'prefixes', PREFS_DEFAULT_PREFIXES)
-        for artist in db.keys():
-            artistLower = artist.lower()
-            for prefix in prefixes:
-                if artistLower.startswith(prefix):
-                    db[artist[len(prefix):] + ' (%s)' % artist[:len(prefix)-1]] = db[artist]
-                    del db[artist]
-
-        progress.pulse()
-        yield True
+            self.store.invalidate(libName)
+            self.__onLibraryRefreshed(progress, libName, path, creation, favorites, (scanner.nbArtists, scanner.nbAlbums, scanner.nbTracks))
 
-        # Load favorites before removing the files from the disk
-        if self.currLib == libName: favorites = self.favorites
-        else:                       favorites = self.loadFavorites(libName)
+        yield False
 
-        # Re-create the library structure on the disk
-        if isdir(libPath):
-            shutil.rmtree(libPath)
-            os.mkdir(libPath)
-
-        # Put a version number
-        tools.touch(os.path.join(libPath, 'VERSION_%u' % VERSION))
-
-        overallNbAlbums  = 0
-        overallNbTracks  = 0
-        overallNbArtists = len(db)
-
-        # The 'artists' file contains all known artists with their index, the 'files' file contains the file structure of the root path
-        allArtists = sorted([(artist, str(indexArtist), len(albums)) for indexArtist, (artist, albums) in enumerate(db.iteritems())], key = lambda a: a[0].lower())
-        pickleSave(os.path.join(libPath, 'files'),   newLibrary)
-        pickleSave(os.path.join(libPath, 'artists'), allArtists)
-
-        # Keep track of genre through nested dictionaries genres -> artists -> albums
-        allGenres = {}
-
-        for (artist, indexArtist, nbAlbums) in allArtists:
-            artistPath       = os.path.join(libPath, indexArtist)
-            overallNbAlbums += nbAlbums
-            os.mkdir(artistPath)
-
-            albums = []
-            for index, (name, (albumGenres, tracks)) in enumerate(db[artist].iteritems()):
-                length           = sum([track.getLength() for track in tracks])
-                overallNbTracks += len(tracks)
-
-                albums.append((name, str(index), len(tracks), length))
-                pickleSave(os.path.join(artistPath, str(index)), sorted(tracks, key = lambda track: track.getNumber()))
-
-                # Update the dictionary with the genres
-                for genre in albumGenres:
-                    try:
-                        allGenres[genre][artist][name] = None
-                    except:
-                        try:
-                            allGenres[genre][artist] = {name: None}
-                        except:
-                            allGenres[genre] = {artist: {name: None}}
-
-            albums.sort()
-            pickleSave(os.path.join(artistPath, 'albums'), albums)
-            progress.pulse()
-            yield True
 
-        pickleSave(os.path.join(libPath, 'genres'), allGenres)
+    def __onLibraryRefreshed(self, progress, libName, path, creation, favorites, counts):
+        """ The given library has been refreshed, counts being (nbArtists, nbAlbums, nbTracks), update everything that depends on it """
+        (overallNbArtists, overallNbAlbums, overallNbTracks) = counts
 
         self.libraries[libName] = (path, overallNbArtists, overallNbAlbums, overallNbTracks)
         self.fillLibraryList()
@@ -351,12 +314,14 @@ class Library(modules.Module):
 
         # Trim favorites and save them
         newFavorites = {}
+        allArtists   = dict([(artist[ART_NAME], artist[ART_INDEX]) for artist in self.store.getArtists(libName)])
         for (artist, albums) in favorites.iteritems():
-            if artist in db:
-                newFavorites[artist] = {}
-                for album in albums:
-                    if album in db[artist][1]:
-                        newFavorites[artist][album] = None
+            if artist in allArtists:
+                allAlbums = [album[ALB_NAME] for album in self.store.getAlbums(libName, allArtists[artist])]
+                newFavorites[artist] = dict([(album, None) for album in albums if album in allAlbums])
+
+                if len(newFavorites[artist]) == 0:
+                    del newFavorites[artist]
 
         self.saveFavorites(libName, newFavorites)
 
@@ -367,18 +332,86 @@ class Library(modules.Module):
             self.loadArtists(self.tree, self.currLib)
             self.restoreTreeState()
 
-        yield False
 
+    def checkRelocation(self, libName, oldPrefix, newPrefix):
+        """ Remap a random sample of the files of the given library, return the ratio of those that exist """
+        oldPrefix = oldPrefix.rstrip(os.sep)
+        newPrefix = newPrefix.rstrip(os.sep)
+        sample    = self.store.sampleFiles(libName, RELOCATION_NB_SAMPLES)
+
+        if len(sample) == 0:
+            return 1.0
+
+        found = [file for file in sample if isfile(library.remapPath(file, oldPrefix, newPrefix))]
+
+        return len(found) / float(len(sample))
 
-    def __getTracksFromPaths(self, tree, paths):
+
+    def relocateLibrary(self, parent, libName, oldPrefix, newPrefix):
+        """
+            Rewrite all paths stored in the given library, replacing oldPrefix by newPrefix
+            The store does the work in a background thread, so that the GTK main loop is not blocked
         """
-            Return the list of tracks extracted from:
+        from gui import progressDlg
+
+        progress = progressDlg.ProgressDlg(parent, _('Relocating library'), _('Paths stored in the library are updated.\nPlease wait.'))
+        progress.setCancellable(False)
+        result   = []
+
+        def relocate():
+            try:
+                self.store.relocate(libName, oldPrefix, newPrefix)
+                result.append(True)
+            except:
+                logger.error('[%s] Unable to relocate library "%s"\n\n%s' % (MOD_INFO[modules.MODINFO_NAME], libName, traceback.format_exc()))
+
+        def onTimeout():
+            """ Animate the progress dialog until the relocation is done """
+            if worker.isAlive():
+                progress.pulse()
+                return True
+
+            progress.destroy()
+
+            if len(result) != 0:
+                self.__onLibraryRelocated(libName, oldPrefix, newPrefix)
+
+            return False
+
+        worker = threading.Thread(target = relocate)
+        worker.start()
+
+        timeout_add(PROGRESS_POLL_DELAY, onTimeout)
+
+
+    def __onLibraryRelocated(self, libName, oldPrefix, newPrefix):
+        """ The given library has been relocated, update everything that depends on it """
+        oldPrefix = oldPrefix.rstrip(os.sep)
+        newPrefix = newPrefix.rstrip(os.sep)
+
+        (path, nbArtists, nbAlbums, nbTracks) = self.libraries[libName]
+        self.libraries[libName] = (library.remapPath(path, oldPrefix, newPrefix), nbArtists, nbAlbums, nbTracks)
+        self.fillLibraryList()
+
+        logger.info('[%s] Library "%s" relocated from %s to %s' % (MOD_INFO[modules.MODINFO_NAME], libName, oldPrefix, newPrefix))
+
+        # Tracks that are currently displayed must be reloaded
+        if self.currLib == libName:
+            self.saveTreeState()
+            self.loadArtists(self.tree, self.currLib)
+            self.restoreTreeState()
+
+
+    def __getSourcesFromPaths(self, tree, paths):
+        """
+            Return the list of sources (see SRC_* constants) extracted from:
                 * The list 'paths' if it is not None
                 * The currently selected rows if 'paths' is None
+            Nothing is loaded from the disk, so this is fast enough to be done in the GTK main loop
         """
         from sys import maxint
 
-        tracks = []
+        sources = []
 
         if paths is None:
             paths = tree.getSelectedPaths()
@@ -386,12 +419,13 @@ class Library(modules.Module):
         for currPath in paths:
             row = tree.getRow(currPath)
             if row[ROW_TYPE] == TYPE_TRACK:
-                tracks.append(row[ROW_DATA])
+                sources.append((SRC_TRACKS, [row[ROW_DATA]]))
             elif row[ROW_TYPE] == TYPE_ALBUM:
-                tracks.extend(pickleLoad(row[ROW_FULLPATH]))
+                sources.append((SRC_ALBUM, (self.currLib, ) + os.path.split(row[ROW_FULLPATH])))
+            elif row[ROW_TYPE] == TYPE_SMART_PLAYLIST:
+                sources.append((SRC_SMART_PLAYLIST, (self.currLib, row[ROW_DATA])))
             elif row[ROW_TYPE] == TYPE_ARTIST:
-                for album in pickleLoad(os.path.join(row[ROW_FULLPATH], 'albums')):
-                    tracks.extend(pickleLoad(os.path.join(row[ROW_FULLPATH], album[ALB_INDEX])))
+                sources.append((SRC_ARTIST, (self.currLib, row[ROW_FULLPATH])))
             elif row[ROW_TYPE] == TYPE_HEADER:
                 for path in xrange(currPath[0]+1, maxint):
                     if not tree.isValidPath(path):
@@ -401,21 +435,54 @@ class Library(modules.Module):
                     if row[ROW_TYPE] == TYPE_HEADER:
                         break
 
-                    for album in pickleLoad(os.path.join(row[ROW_FULLPATH], 'albums')):
-                        tracks.extend(pickleLoad(os.path.join(row[ROW_FULLPATH], album[ALB_INDEX])))
+                    sources.append((SRC_ARTIST, (self.currLib, row[ROW_FULLPATH])))
 
-        return tracks
+        return sources
+
+
+    def __resolveSources(self, sources):
+        """ Generator yielding the tracks of the given sources, one list (e.g., an album) at a time """
+        for (type, data) in sources:
+            if type == SRC_TRACKS:
+                yield data
+            elif type == SRC_ALBUM:
+                yield self.store.getTracks(data[0], data[1], data[2])
+            elif type == SRC_SMART_PLAYLIST:
+                yield self.runSmartPlaylist(data[0], data[1])
+            elif type == SRC_ARTIST:
+                for album in self.store.getAlbums(data[0], data[1]):
+                    yield self.store.getTracks(data[0], data[1], album[ALB_INDEX])
+
+
+    def __onResolvedBatch(self, tracks, isFirst, replace):
+        """ A batch of tracks has been resolved (called by a TrackResolver thread) """
+        if isFirst and replace: modules.postMsg(consts.MSG_CMD_TRACKLIST_SET, {'tracks': tracks, 'playNow': True})
+        else:                   modules.postMsg(consts.MSG_CMD_TRACKLIST_ADD, {'tracks': tracks, 'playNow': False})
 
 
     def playPaths(self, tree, paths, replace):
         """
             Replace/extend the tracklist
             If the list 'paths' is None, use the current selection
+            Tracks are resolved in a background thread and sent to the tracklist by batches
         """
-        tracks = self.__getTracksFromPaths(tree, paths)
+        # Replacing the tracklist makes pending batches of previous requests useless
+        if replace:
+            for resolver in self.resolvers:
+                resolver.cancel()
+            self.resolvers = []
 
-        if replace: modules.postMsg(consts.MSG_CMD_TRACKLIST_SET, {'tracks': tracks, 'playNow': True})
-        else:       modules.postMsg(consts.MSG_CMD_TRACKLIST_ADD, {'tracks': tracks, 'playNow': False})
+        # Otherwise, batches of this request must not be delivered before those of the previous one
+        self.resolvers = [r for r in self.resolvers if r.isAlive()]
+
+        if len(self.resolvers) == 0: previous = None
+        else:                        previous = self.resolvers[-1]
+
+        onBatch  = lambda tracks, isFirst: self.__onResolvedBatch(tracks, isFirst, replace)
+        resolver = TrackResolver(self.__getSourcesFromPaths(tree, paths), self.__resolveSources, onBatch, previous)
+
+        self.resolvers.append(resolver)
+        resolver.start()
 
 
     def pickAlbumArtist(self, tree, artistPath):
@@ -566,6 +633,28 @@ class Library(modules.Module):
         genreItem.connect('activate', lambda widget: self.filterByGenre(None))
         genresMenu.append(genreItem)
 
+        # Smart playlists
+        smartMenu = gtk.Menu()
+        smartItem = gtk.ImageMenuItem(_('Smart Playlists'))
+        smartItem.set_image(gtk.image_new_from_stock(gtk.STOCK_FIND, gtk.ICON_SIZE_MENU))
+        smartItem.set_submenu(smartMenu)
+        popup.append(smartItem)
+
+        newPlaylist = gtk.ImageMenuItem(gtk.STOCK_NEW)
+        newPlaylist.connect('activate', lambda widget: self.editSmartPlaylist())
+        smartMenu.append(newPlaylist)
+
+        if path is not None and tree.getItem(path, ROW_TYPE) == TYPE_SMART_PLAYLIST:
+            playlist = tree.getItem(path, ROW_DATA)
+
+            editPlaylist = gtk.ImageMenuItem(gtk.STOCK_EDIT)
+            editPlaylist.connect('activate', lambda widget: self.editSmartPlaylist(playlist))
+            smartMenu.append(editPlaylist)
+
+            removePlaylist = gtk.ImageMenuItem(gtk.STOCK_REMOVE)
+            removePlaylist.connect('activate', lambda widget: self.removeSmartPlaylist(playlist))
+            smartMenu.append(removePlaylist)
+
         # Separator
         popup.append(gtk.SeparatorMenuItem())
 
@@ -615,10 +704,8 @@ class Library(modules.Module):
 
     def loadArtists(self, tree, name):
         """ Load the given library """
-        libPath = os.path.join(ROOT_PATH, name)
-
         # Make sure the version number is the good one
-        if not os.path.exists(os.path.join(libPath, 'VERSION_%u' % VERSION)):
+        if not self.store.isValid(name):
             logger.error('[%s] Version number does not match, loading of library "%s" aborted' % (MOD_INFO[modules.MODINFO_NAME], name))
             error = _('This library is deprecated, please refresh it.')
             tree.replaceContent([(icons.errorMenuIcon(), None, error, TYPE_NONE, None, None)])
@@ -627,8 +714,8 @@ class Library(modules.Module):
         rows           = []
         icon           = icons.dirMenuIcon()
         prevChar       = ''
-        allArtists     = pickleLoad(os.path.join(libPath, 'artists'))
-        self.allGenres = pickleLoad(os.path.join(libPath, 'genres'))
+        allArtists     = self.store.getArtists(name)
+        self.allGenres = self.store.getGenres(name)
 
         # Filter artists by genre if needed
         if self.currGenre is not None:
@@ -642,6 +729,10 @@ class Library(modules.Module):
             allArtists = [artist for artist in allArtists if self.isArtistInFavorites(artist[ART_NAME])]
             rows.append((icons.starMenuIcon(), None, '<b>%s</b>' % _('My Favorites'), TYPE_FAVORITES_BANNER, None, None))
 
+        # Smart playlists
+        for playlist in sorted(self.getSmartPlaylists(name), key = lambda playlist: playlist.lower()):
+            rows.append((icons.findMenuIcon(), None, htmlEscape(playlist), TYPE_SMART_PLAYLIST, None, playlist))
+
         # Create the rows
         for artist in allArtists:
             if len(artist[ART_NAME]) != 0: currChar = unicode(artist[ART_NAME], errors='replace')[0].lower()
@@ -652,7 +743,7 @@ class Library(modules.Module):
                 if currChar.isdigit(): rows.append((None, None, '<b>0 - 9</b>',                 TYPE_HEADER, None, None))
                 else:                  rows.append((None, None, '<b>%s</b>' % currChar.upper(), TYPE_HEADER, None, None))
 
-            rows.append((icon, None, htmlEscape(artist[ART_NAME]), TYPE_ARTIST, os.path.join(libPath, artist[ART_INDEX]), artist[ART_NAME]))
+            rows.append((icon, None, htmlEscape(artist[ART_NAME]), TYPE_ARTIST, artist[ART_INDEX], artist[ART_NAME]))
 
         # Insert all rows, and then add a fake child to each artist
         tree.replaceContent(rows)
@@ -666,7 +757,7 @@ class Library(modules.Module):
         rows      = []
         path      = tree.getItem(node, ROW_FULLPATH)
         artist    = tree.getItem(node, ROW_DATA)
-        allAlbums = pickleLoad(os.path.join(tree.getItem(node, ROW_FULLPATH), 'albums'))
+        allAlbums = self.store.getAlbums(self.currLib, path)
 
         # Filter albums if only favorites should be shown
         if self.showOnlyFavs:
@@ -693,7 +784,7 @@ class Library(modules.Module):
 
     def loadTracks(self, tree, node, fakeChild):
         """ Initial load of all tracks of the given node, assuming it is of type TYPE_ALBUM """
-        allTracks = pickleLoad(tree.getItem(node, ROW_FULLPATH))
+        allTracks = self.store.getTracks(self.currLib, *os.path.split(tree.getItem(node, ROW_FULLPATH)))
         icon      = icons.mediaFileMenuIcon()
         rows      = [(icon, None, '%02u. %s' % (track.getNumber(), htmlEscape(track.getTitle())), TYPE_TRACK, track.getFilePath(), track) for track in allTracks]
 
@@ -701,6 +792,68 @@ class Library(modules.Module):
         tree.removeRow(fakeChild)
 
 
+    # --== Index and smart playlists ==--
+
+
+    def getSmartPlaylists(self, libName):
+        """ Return a dictionary name -> query with the smart playlists of the given library """
+        try:    return self.smartPlaylists[libName]
+        except: return {}
+
+
+    def runSmartPlaylist(self, libName, name):
+        """ Return the tracks matching the given smart playlist """
+        try:
+            if libName == self.currLib: favorites = self.favorites
+            else:                       favorites = self.loadFavorites(libName)
+
+            matches = self.store.search(libName, self.getSmartPlaylists(libName)[name], favorites)
+        except query.QueryError, err:
+            logger.error('[%s] Invalid query for smart playlist "%s": %s' % (MOD_INFO[modules.MODINFO_NAME], name, err))
+            return []
+
+        # Tracks of the index are shared, give copies to the tracklist
+        tracks = []
+        for track in matches:
+            copy = FileTrack(track.getFilePath())
+            copy.setTags(dict(track.getTags()))
+            tracks.append(copy)
+
+        return tracks
+
+
+    def editSmartPlaylist(self, name=None):
+        """ Create a new smart playlist or edit the given one """
+        from gui.smartPlaylist import SmartPlaylist
+
+        playlists = self.getSmartPlaylists(self.currLib)
+        forbidden = [playlist for playlist in playlists if playlist != name]
+        dialog    = SmartPlaylist(_('Smart Playlist'), self.tree.get_toplevel(), forbidden)
+
+        if name is None: result = dialog.run()
+        else:            result = dialog.run(name, playlists[name])
+
+        if result is not None:
+            if name is not None:
+                del playlists[name]
+
+            playlists[result[0]]              = result[1]
+            self.smartPlaylists[self.currLib] = playlists
+
+            self.saveTreeState()
+            self.loadArtists(self.tree, self.currLib)
+            self.restoreTreeState()
+
+
+    def removeSmartPlaylist(self, name):
+        """ Remove the given smart playlist """
+        del self.smartPlaylists[self.currLib][name]
+
+        self.saveTreeState()
+        self.loadArtists(self.tree, self.currLib)
+        self.restoreTreeState()
+
+
     # --== Manage tree state ==--
 
 
@@ -753,13 +906,13 @@ class Library(modules.Module):
 
     def loadFavorites(self, libName):
         """ Load favorites from the disk """
-        try:    return pickleLoad(os.path.join(ROOT_PATH, libName, 'favorites'))
+        try:    return self.store.loadFavorites(libName)
         except: return {}
 
 
     def saveFavorites(self, libName, favorites):
         """ Save favorites to the disk """
-        pickleSave(os.path.join(ROOT_PATH, libName, 'favorites'), favorites)
+        self.store.saveFavorites(libName, favorites)
 
 
     def isArtistInFavorites(self, artist):
@@ -827,9 +980,20 @@ class Library(modules.Module):
         elif keyname == 'Return': self.playPaths(tree, None, True)
 
 
+    def onDragBegin(self, tree, context):
+        """ Start resolving the dragged tracks, so that they are hopefully ready when dropped """
+        self.dndResolver = TrackResolver(self.__getSourcesFromPaths(tree, None), self.__resolveSources)
+        self.dndResolver.start()
+
+
     def onDragDataGet(self, tree, context, selection, info, time):
         """ Provide information about the data being dragged """
-        serializedTracks = '\n'.join([track.serialize() for track in self.__getTracksFromPaths(tree, None)])
+        # Data must be provided synchronously, so wait for the resolution started when the drag began
+        if self.dndResolver is None:
+            self.onDragBegin(tree, context)
+
+        self.dndResolver.join()
+        serializedTracks = '\n'.join([track.serialize() for track in self.dndResolver.tracks])
         selection.set(consts.DND_TARGETS[consts.DND_DAP_TRACKS][0], 8, serializedTracks)
 
 
@@ -850,32 +1014,43 @@ class Library(modules.Module):
 
     def onModLoaded(self):
         """ This is the real initialization function, called when the module has been loaded """
-        self.tree         = None
-        self.currLib      = None
-        self.allGenres    = {}
-        self.currGenre    = None
-        self.cfgWindow    = None
-        self.libraries    = prefs.get(__name__, 'libraries',  PREFS_DEFAULT_LIBRARIES)
-        self.favorites    = None
-        self.treeStates   = prefs.get(__name__, 'tree-states-2', PREFS_DEFAULT_TREE_STATE)
-        self.showOnlyFavs = prefs.get(__name__, 'show-only-favorites', PREFS_DEFAULT_SHOW_ONLY_FAVORITES)
+        self.tree           = None
+        self.currLib        = None
+        self.allGenres      = {}
+        self.currGenre      = None
+        self.cfgWindow      = None
+        self.libraries      = prefs.get(__name__, 'libraries',  PREFS_DEFAULT_LIBRARIES)
+        self.store          = libraryService.getStore()
+        self.favorites      = None
+        self.resolvers      = []
+        self.dndResolver    = None
+        self.treeStates     = prefs.get(__name__, 'tree-states-2', PREFS_DEFAULT_TREE_STATE)
+        self.showOnlyFavs   = prefs.get(__name__, 'show-only-favorites', PREFS_DEFAULT_SHOW_ONLY_FAVORITES)
+        self.smartPlaylists = prefs.get(__name__, 'smart-playlists', PREFS_DEFAULT_SMART_PLAYLISTS)
         # Scroll window
         self.scrolled = gtk.ScrolledWindow()
         self.scrolled.set_shadow_type(gtk.SHADOW_IN)
         self.scrolled.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
         self.scrolled.show()
 
+        metrics.setGauge('library_tracks', lambda: sum([lib[LIB_NB_TRACKS] for lib in self.libraries.itervalues()]))
         idle_add(self.addAllExplorers)
 
 
     def onModUnloaded(self):
         """ The module has been unloaded """
+        metrics.removeGauge('library_tracks')
+
+        for resolver in self.resolvers:
+            resolver.cancel()
+
         if self.currLib is not None:
             self.saveTreeState()
             self.saveFavorites(self.currLib, self.favorites)
             prefs.set(__name__, 'tree-states-2', self.treeStates)
 
         prefs.set(__name__, 'libraries',  self.libraries)
+        prefs.set(__name__, 'smart-playlists', self.smartPlaylists)
         self.removeAllExplorers()
 
 
@@ -954,18 +1129,18 @@ class Library(modules.Module):
 
     def renameLibrary(self, oldName, newName):
         """ Rename a library """
-        import shutil
-
         self.libraries[newName] = self.libraries[oldName]
         del self.libraries[oldName]
 
-        oldPath = os.path.join(ROOT_PATH, oldName)
-        newPath = os.path.join(ROOT_PATH, newName)
-        shutil.move(oldPath, newPath)
+        self.store.rename(oldName, newName)
 
-        # Rename tree states as well
+        # Rename tree states and smart playlists as well
         self.renameTreeStates(oldName, newName)
 
+        if oldName in self.smartPlaylists:
+            self.smartPlaylists[newName] = self.smartPlaylists[oldName]
+            del self.smartPlaylists[oldName]
+
         # Is it the current library?
         if self.currLib == oldName:
             self.currLib = newName
@@ -974,20 +1149,37 @@ class Library(modules.Module):
 
 
     def onRenameLibrary(self, btn):
-        """ Let the user rename a library """
+        """ Let the user rename and/or relocate a library """
+        from gui            import questionMsgBox
         from gui.selectPath import SelectPath
 
-        name         = self.cfgList.getSelectedRows()[0][0]
-        forbidden    = [libName for libName in self.libraries if libName != name]
-        pathSelector = SelectPath(MOD_L10N, self.cfgWindow, forbidden, ['/'])
+        name      = self.cfgList.getSelectedRows()[0][0]
+        forbidden = [libName for libName in self.libraries if libName != name]
+        oldPath   = self.libraries[name][LIB_PATH]
+        result    = SelectPath(MOD_L10N, self.cfgWindow, forbidden, ['/']).run(name, oldPath)
+
+        if result is None:
+            return
 
-        pathSelector.setPathSelectionEnabled(False)
-        result = pathSelector.run(name, self.libraries[name][LIB_PATH])
+        newName, newPath = result
 
-        if result is not None and result[0] != name:
-            self.renameLibrary(name, result[0])
+        if newName != name:
+            self.renameLibrary(name, newName)
             self.fillLibraryList()
 
+        # The media files have been moved (e.g., new mount point), so all stored paths must be remapped
+        if newPath.rstrip(os.sep) != oldPath.rstrip(os.sep):
+            found = self.checkRelocation(newName, oldPath, newPath)
+
+            if found < RELOCATION_MIN_FOUND_RATIO:
+                question = _('Relocate the library anyway?')
+                remark   = _('Only %(ratio)u%% of the checked files exist in the new location. You may want to refresh the library instead.') % {'ratio': found * 100}
+
+                if questionMsgBox(self.cfgWindow, question, remark) != gtk.RESPONSE_YES:
+                    return
+
+            self.relocateLibrary(self.cfgWindow, newName, oldPath, newPath)
+
 
     def fillLibraryList(self):
         """ Fill the list of libraries """
@@ -999,8 +1191,6 @@ class Library(modules.Module):
 
     def removeSelectedLibraries(self, list):
         """ Remove all selected libraries """
-        import shutil
-
         from gui import questionMsgBox
 
         if list.getSelectedRowsCount() == 1:
@@ -1018,14 +1208,14 @@ class Library(modules.Module):
                     self.currLib = None
 
                 # Remove the library from the disk
-                libPath = os.path.join(ROOT_PATH, libName)
-                if isdir(libPath):
-                    shutil.rmtree(libPath)
+                self.store.remove(libName)
                 # Remove the corresponding explorer
                 modules.postMsg(consts.MSG_CMD_EXPLORER_REMOVE, {'modName': MOD_L10N, 'expName': libName})
                 del self.libraries[libName]
-                # Remove tree states
+                # Remove tree states and smart playlists
                 self.removeTreeStates(libName)
+                if libName in self.smartPlaylists:
+                    del self.smartPlaylists[libName]
             # Clean up the listview
             list.removeSelectedRows()
 
@@ -1055,5 +1245,7 @@ class Library(modules.Module):
                            _('When you add a new library, you have to give the full path to the root directory of that library. '
                              'Then, all directories under this root path are recursively scanned for media files whose tags are read '
                              'and stored in a database.') + '\n\n' + _('Upon refreshing a library, the file structure under the root '
-                             'directory and all media files are scanned for changes, to update the database accordingly.'))
+                             'directory and all media files are scanned for changes, to update the database accordingly.') + '\n\n' + _('If your media files '
+                             'have been moved (e.g., the drive is now mounted elsewhere), use the rename button to select the new root '
+                             'directory: the library is then updated without being scanned again.'))
         helpDlg.show(self.cfgWindow)
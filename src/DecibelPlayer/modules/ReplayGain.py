@@ -23,7 +23,8 @@ from .. import modules
 from ..tools   import consts
 
 
-MOD_INFO = ('ReplayGain', _('ReplayGain'), _('Normalize volume'), [], False, False, consts.MODCAT_DECIBEL)
+MOD_INFO     = ('ReplayGain', _('ReplayGain'), _('Normalize volume'), [], False, False, consts.MODCAT_DECIBEL)
+MOD_HEADLESS = True
 
 
 class ReplayGain(modules.Module):
@@ -24,7 +24,8 @@ from .. import gui, modules
 from ..media   import track
 from ..tools   import consts, prefs
 
-MOD_INFO = ('Status File', _('Status File'), _('Generate a text file with the current status'), [], False, True, consts.MODCAT_DESKTOP)
+MOD_INFO     = ('Status File', _('Status File'), _('Generate a text file with the current status'), [], False, True, consts.MODCAT_DESKTOP)
+MOD_HEADLESS = True
 
 
 # Default preferences
@@ -31,16 +31,16 @@ class StatusIcon(modules.Module):
     def __init__(self):
         """ Constructor """
         handlers = {
-                        consts.MSG_EVT_PAUSED:         self.onPaused,
-                        consts.MSG_EVT_STOPPED:        self.onStopped,
-                        consts.MSG_EVT_UNPAUSED:       self.onUnpaused,
-                        consts.MSG_EVT_NEW_TRACK:      self.onNewTrack,
-                        consts.MSG_EVT_MOD_LOADED:     self.onModLoaded,
-                        consts.MSG_EVT_APP_STARTED:    self.onModLoaded,
-                        consts.MSG_EVT_TRACK_MOVED:    self.onTrackMoved,
-                        consts.MSG_EVT_MOD_UNLOADED:   self.onModUnloaded,
-                        consts.MSG_EVT_NEW_TRACKLIST:  self.onNewTracklist,
-                        consts.MSG_EVT_VOLUME_CHANGED: self.onVolumeChanged,
+                        consts.MSG_EVT_PAUSED:          self.onPaused,
+                        consts.MSG_EVT_STOPPED:         self.onStopped,
+                        consts.MSG_EVT_UNPAUSED:        self.onUnpaused,
+                        consts.MSG_EVT_NEW_TRACK:       self.onNewTrack,
+                        consts.MSG_EVT_MOD_LOADED:      self.onModLoaded,
+                        consts.MSG_EVT_APP_STARTED:     self.onModLoaded,
+                        consts.MSG_EVT_TRACK_MOVED:     self.onTrackMoved,
+                        consts.MSG_EVT_MOD_UNLOADED:    self.onModUnloaded,
+                        consts.MSG_EVT_TRACKLIST_DELTA: self.onTracklistDelta,
+                        consts.MSG_EVT_VOLUME_CHANGED:  self.onVolumeChanged,
                    }
 
         modules.Module.__init__(self, handlers)
@@ -163,10 +163,9 @@ class StatusIcon(modules.Module):
         self.volume = value
 
 
-    def onNewTracklist(self, tracks, playtime):
-        """ A new tracklist has been defined """
-        if len(tracks) == 0: self.emptyTracklist = True
-        else:                self.emptyTracklist = False
+    def onTracklistDelta(self, delta, stats):
+        """ The tracklist has been modified """
+        self.emptyTracklist = (stats.getCount() == 0)
 
 
     def onStopped(self):
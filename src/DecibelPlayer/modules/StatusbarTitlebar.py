@@ -21,6 +21,7 @@ from __future__ import absolute_import
 from gettext import ngettext, gettext as _
 from .. import modules, tools
 from ..tools   import consts,  prefs
+from ..media.tracklistStats import TracklistStats
 
 MOD_INFO = ('Status and Title Bars', 'Status and Title Bars', '', [], True, False, consts.MODCAT_NONE)
 
@@ -36,7 +37,7 @@ class StatusbarTitlebar(modules.Module):
                         consts.MSG_EVT_UNPAUSED:          self.onUnpaused,
                         consts.MSG_EVT_NEW_TRACK:         self.onNewTrack,
                         consts.MSG_EVT_APP_STARTED:       self.onAppStarted,
-                        consts.MSG_EVT_NEW_TRACKLIST:     self.onNewTracklist,
+                        consts.MSG_EVT_TRACKLIST_DELTA:   self.onTracklistDelta,
                         consts.MSG_EVT_TRACKLIST_NEW_SEL: self.onNewSelection,
                    }
 
@@ -53,12 +54,12 @@ class StatusbarTitlebar(modules.Module):
     def __updateStatusbar(self):
         """ Update the status bar """
         # Tracklist
-        count = len(self.tracklist)
+        count = self.stats.getCount()
         if count == 0:
             self.status1.set_label('')
         else:
             self.status1.set_label(ngettext('One track in playlist  [%(length)s]', '%(count)u tracks in playlist  [%(length)s]', count) \
-                                      % {'count': count, 'length': tools.sec2str(self.playtime)})
+                                      % {'count': count, 'length': tools.sec2str(self.stats.getLength())})
 
         # Selected tracks
         count = len(self.selTracks)
@@ -93,8 +94,7 @@ class StatusbarTitlebar(modules.Module):
 
         # Current player status
         self.paused    = False
-        self.playtime  = 0
-        self.tracklist = []
+        self.stats     = TracklistStats()
         self.selTracks = []
         self.currTrack = None
 
@@ -125,10 +125,9 @@ class StatusbarTitlebar(modules.Module):
         self.__updateTitlebar()
 
 
-    def onNewTracklist(self, tracks, playtime):
-        """ A new tracklist has been set """
-        self.playtime  = playtime
-        self.tracklist = tracks
+    def onTracklistDelta(self, delta, stats):
+        """ The tracklist has been modified """
+        self.stats = stats
         self.__updateStatusbar()
 
 
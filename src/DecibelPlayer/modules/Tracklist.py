@@ -18,16 +18,21 @@
 
 from __future__ import absolute_import
 
+import random, re
+
 from gettext import gettext as _
 from gobject import TYPE_STRING, TYPE_INT, TYPE_PYOBJECT
 import gtk
 from .. import media, modules, tools
 from ..gui import fileChooser
 from ..tools import consts, icons, prefs
-from ..gui.extListview import ExtListView
-from ..media import track
+from ..gui.extListview import ExtList, ExtListView
+from ..media import track, tracklistDelta
+from ..media.tracklistDelta import DELTA_INSERTED, DELTA_MOVED, DELTA_REMOVED, getReorderDelta
+from ..media.tracklistStats import TracklistStats
 
-MOD_INFO = ('Tracklist', 'Tracklist', '', [], True, False, consts.MODCAT_NONE)
+MOD_INFO     = ('Tracklist', 'Tracklist', '', [], True, False, consts.MODCAT_NONE)
+MOD_HEADLESS = True
 
 # Create a unique ID for each field of a row in the list
 (
@@ -45,6 +50,9 @@ MOD_INFO = ('Tracklist', 'Tracklist', '', [], True, False, consts.MODCAT_NONE)
     ROW_TRK,   # The Track object
 ) = range(12)
 
+# Type of each field of a row
+ROW_TYPES = (gtk.gdk.Pixbuf, TYPE_INT, TYPE_STRING, TYPE_STRING, TYPE_STRING, TYPE_INT, TYPE_STRING, TYPE_STRING, TYPE_INT, TYPE_STRING, TYPE_STRING, TYPE_PYOBJECT)
+
 # Create a unique ID for each column that the user can see
 (
     COL_TRCK_NUM,
@@ -59,6 +67,21 @@ MOD_INFO = ('Tracklist', 'Tracklist', '', [], True, False, consts.MODCAT_NONE)
     COL_FILENAME,
 ) = range(10)
 
+# Modifications of the tracklist that can be undone, each one stores only what it modified
+(
+    OP_INSERT,    # (OP_INSERT, position, tracks)
+    OP_REMOVE,    # (OP_REMOVE, indexes, tracks), indexes are sorted
+    OP_MOVE,      # (OP_MOVE, start, end, position), see DELTA_MOVED
+    OP_REORDER,   # (OP_REORDER, newOrder), see ExtListView.reorderRows(), used only when OP_MOVE can't describe it (e.g., sorting)
+    OP_SET,       # (OP_SET, previousTracks, newTracks)
+) = range(5)
+
+# How many modifications can be undone
+MAX_HISTORY_SIZE = 100
+
+# Tokens used to filter the tracklist are separated by spaces and punctuation
+mTokenRE = re.compile(r'[^\s/\\.,;:!?()\[\]{}"\'_-]+')
+
 PREFS_DEFAULT_REPEAT_STATUS      = False
 PREFS_DEFAULT_COLUMNS_VISIBILITY = {
                                         COL_TRCK_NUM : True,
@@ -74,6 +97,63 @@ PREFS_DEFAULT_COLUMNS_VISIBILITY = {
                                    }
 
 
+def getTokens(track):
+    """ Return the lower case tokens of the given track, used to filter the tracklist """
+    return mTokenRE.findall(' '.join((track.getTitleOrFilename(), track.getArtist(), track.getExtendedAlbum(), track.getFilePath())).lower())
+
+
+class PlayOrder:
+    """
+        A random order in which the rows of the tracklist are played, the list itself is left untouched
+        Rows are referenced by their identifier, so that the order is not affected when they are moved
+    """
+
+    def __init__(self, rowIds):
+        """ Constructor """
+        self.order     = []
+        self.positions = {}
+        self.add(rowIds)
+
+
+    def __len__(self):
+        """ Return the number of rows in the order, including those that have been removed from the list """
+        return len(self.order)
+
+
+    def add(self, rowIds):
+        """ Shuffle the given rows and append them to the order """
+        rowIds = list(rowIds)
+        random.shuffle(rowIds)
+
+        for rowId in rowIds:
+            self.positions[rowId] = len(self.order)
+            self.order.append(rowId)
+
+
+    def moveToFront(self, rowId):
+        """ Move the given row to the beginning of the order """
+        first    = self.order[0]
+        position = self.positions[rowId]
+
+        self.order[0], self.order[position]          = rowId, first
+        self.positions[rowId], self.positions[first] = 0, position
+
+
+    def discard(self, isRemoved):
+        """ Remove the rows for which isRemoved(rowId) is True """
+        self.order     = [rowId for rowId in self.order if not isRemoved(rowId)]
+        self.positions = dict([(rowId, position) for (position, rowId) in enumerate(self.order)])
+
+
+    def getFollowing(self, rowId, step, repeat):
+        """ Return the identifier of the row played before (step = -1) or after (step = 1) the given one, None if there is none """
+        position = self.positions[rowId] + step
+
+        if 0 <= position < len(self.order): return self.order[position]
+        elif repeat:                        return self.order[position % len(self.order)]
+        else:                               return None
+
+
 class Tracklist(modules.Module):
     """ This module manages the tracklist """
 
@@ -105,7 +185,8 @@ class Tracklist(modules.Module):
     def __fmtColumnColor(self, col, cll, mdl, it):
         """ When playing, tracks already played are slightly greyed out """
         style  = self.window.get_style()
-        played = self.list.hasMark() and mdl.get_path(it)[0] < self.list.getMark()
+        # The model is filtered when a filter is active, so the path must be converted to an index of the list
+        played = self.list.hasMark() and self.list.getIndexFromPath(mdl.get_path(it)) < self.list.getMark()
 
         if played: cll.set_property('foreground-gdk', style.text[gtk.STATE_INSENSITIVE])
         else:      cll.set_property('foreground-gdk', style.text[gtk.STATE_NORMAL])
@@ -117,12 +198,28 @@ class Tracklist(modules.Module):
         self.__fmtColumnColor(col, cll, mdl, it)
 
 
+    def __hasError(self, trackIdx):
+        """ Return whether the track at the given index has been flagged because of an error """
+        return self.list.getRowId(trackIdx) in self.errorRows
+
+
+    def __getFollowingTrackIdx(self, trackIdx, step):
+        """ Return the index of the track played before (step = -1) or after (step = 1) the given one, or -1 if there is none """
+        if self.playOrder is not None:
+            rowId = self.playOrder.getFollowing(self.list.getRowId(trackIdx), step, self.repeat)
+
+            if rowId is None: return -1
+            else:             return self.list.getRowIndex(rowId)
+
+        if 0 <= trackIdx + step < len(self.list): return trackIdx + step
+        elif self.repeat:                          return (trackIdx + step) % len(self.list)
+        else:                                      return -1
+
+
     def __getNextTrackIdx(self):
         """ Return the index of the next track, or -1 if there is none """
-        if self.list.hasMark():
-            if self.list.getMark() < (len(self.list) - 1): return self.list.getMark() + 1
-            elif self.btnRepeat.get_active():              return 0
-        return -1
+        if self.list.hasMark(): return self.__getFollowingTrackIdx(self.list.getMark(), 1)
+        else:                   return -1
 
 
     def __hasNextTrack(self):
@@ -132,10 +229,8 @@ class Tracklist(modules.Module):
 
     def __getPreviousTrackIdx(self):
         """ Return the index of the previous track, or -1 if there is none """
-        if self.list.hasMark():
-            if self.list.getMark() > 0:       return self.list.getMark() - 1
-            elif self.btnRepeat.get_active(): return len(self.list) - 1
-        return -1
+        if self.list.hasMark(): return self.__getFollowingTrackIdx(self.list.getMark(), -1)
+        else:                   return -1
 
 
     def __hasPreviousTrack(self):
@@ -157,13 +252,25 @@ class Tracklist(modules.Module):
             self.jumpTo(where)
 
 
+    def __updatePlaylistPos(self):
+        """
+            Update the playlist position and length of the current track
+            Only the current track is given to other modules, so other tracks are updated once they become the current one
+        """
+        if self.list.hasMark():
+            track = self.list.getItem(self.list.getMark(), ROW_TRK)
+            track.setPlaylistPos(self.list.getMark() + 1)
+            track.setPlaylistLen(len(self.list))
+
+
     def jumpTo(self, trackIdx, sendPlayMsg = True, forced = True):
         """ Jump to the track located at the given index """
-        if self.list.hasMark() and self.list.getItem(self.list.getMark(), ROW_ICO) != icons.errorMenuIcon():
+        if self.list.hasMark() and not self.__hasError(self.list.getMark()):
             self.list.setItem(self.list.getMark(), ROW_ICO, icons.nullMenuIcon())
         self.list.setMark(trackIdx)
-        self.list.scroll_to_cell(trackIdx)
+        self.list.scrollToRow(trackIdx)
         self.list.setItem(trackIdx, ROW_ICO, icons.playMenuIcon())
+        self.__updatePlaylistPos()
 
         if sendPlayMsg:
             modules.postMsg(consts.MSG_CMD_PLAY, {'uri': self.list.getItem(trackIdx, ROW_TRK).getURI(), 'forced': forced})
@@ -172,63 +279,163 @@ class Tracklist(modules.Module):
         modules.postMsg(consts.MSG_EVT_TRACK_MOVED, {'hasPrevious': self.__hasPreviousTrack(), 'hasNext': self.__hasNextTrack()})
 
 
+    def __postDelta(self, delta):
+        """ Let modules know about the given modification of the tracklist """
+        modules.postMsg(consts.MSG_EVT_TRACKLIST_DELTA, {'delta': delta, 'stats': self.stats.copy()})
+
+
+    def __record(self, operation):
+        """ Add the given modification to the history, unless it's the result of undo() or redo() """
+        if self.recording:
+            self.redoStack = []
+            self.undoStack.append(operation)
+
+            if len(self.undoStack) > MAX_HISTORY_SIZE:
+                del self.undoStack[0]
+
+
+    def __apply(self, operation, reverse):
+        """ Apply the given modification, or reverse it """
+        # Recording must be enabled again even if something goes wrong, otherwise all following modifications would be lost
+        self.recording = False
+
+        try:
+            self.__applyWithoutRecording(operation, reverse)
+        finally:
+            self.recording = True
+
+
+    def __applyWithoutRecording(self, operation, reverse):
+        """ Apply the given modification, or reverse it, the history must not be recording """
+        if operation[0] == OP_INSERT:
+            (position, tracks) = operation[1:]
+
+            if reverse: self.__removeRows(range(position, position + len(tracks)))
+            else:       self.insert(tracks, False, position)
+
+        elif operation[0] == OP_REMOVE:
+            (indexes, tracks) = operation[1:]
+
+            if not reverse:
+                self.__removeRows(indexes)
+            else:
+                # Inserting each run of consecutive tracks in ascending order puts them back where they were
+                start = 0
+                for i in xrange(1, len(indexes) + 1):
+                    if i == len(indexes) or indexes[i] != indexes[i-1] + 1:
+                        self.insert(tracks[start:i], False, indexes[start])
+                        start = i
+
+        elif operation[0] == OP_MOVE:
+            (start, end, position) = operation[1:]
+
+            if reverse: delta = (DELTA_MOVED, position, position + end - start, start)
+            else:       delta = (DELTA_MOVED, start, end, position)
+
+            newOrder = range(len(self.list))
+            tracklistDelta.apply(newOrder, delta)
+            self.list.reorderRows(newOrder)
+
+        elif operation[0] == OP_REORDER:
+            newOrder = operation[1]
+
+            if not reverse:
+                self.list.reorderRows(newOrder)
+            else:
+                previousOrder = [0] * len(newOrder)
+                for (index, previousIndex) in enumerate(newOrder):
+                    previousOrder[previousIndex] = index
+                self.list.reorderRows(previousOrder)
+
+        else:
+            (previousTracks, newTracks) = operation[1:]
+
+            if reverse: self.set(previousTracks, False, True)
+            else:       self.set(newTracks, False, True)
+
+
+    def undo(self):
+        """ Undo the last modification of the tracklist """
+        if len(self.undoStack) != 0:
+            operation = self.undoStack.pop()
+            self.__apply(operation, True)
+            self.redoStack.append(operation)
+
+
+    def redo(self):
+        """ Redo the last undone modification of the tracklist """
+        if len(self.redoStack) != 0:
+            operation = self.redoStack.pop()
+            self.__apply(operation, False)
+            self.undoStack.append(operation)
+
+
     def insert(self, tracks, playNow, position=None):
         """ Insert some tracks in the tracklist, append them if position is None """
-        rows = [[icons.nullMenuIcon(), track.getNumber(), track.getTitleOrFilename(), track.getArtist(), track.getExtendedAlbum(),
-                    track.getLength(), track.getBitrate(), track.getGenre(), track.getDate(), track.getFilename(), track.getURI(), track] for track in tracks]
+        if len(tracks) != 0:
+            if position is None: first = len(self.list)
+            else:                first = position
 
-        if len(rows) != 0:
-            self.previousTracklist = [row[ROW_TRK] for row in self.list]
+            self.__record((OP_INSERT, first, list(tracks)))
 
-            for row in rows:
-                self.playtime += row[ROW_LEN]
+            self.stats.add(tracks)
+            self.list.insertRows(tracks, position)
+            self.__postDelta((DELTA_INSERTED, first, tuple(tracks)))
 
-            self.list.insertRows(rows, position)
+            # New tracks are played after the other ones, in random order
+            if self.playOrder is not None:
+                self.playOrder.add([self.list.getRowId(idx) for idx in xrange(first, first + len(tracks))])
 
             if playNow:
-                if position is not None: self.jumpTo(position)
-                else:                    self.jumpTo(len(self.previousTracklist))
+                self.jumpTo(first)
 
 
     def set(self, tracks, playNow, keepCurrTrack = False):
         """ Replace the tracklist, clear it if tracks is None """
-        self.playtime = 0
-
-        # Save playlist only locally to this function
-        # The insert() function would overwrite it otherwise
-        previousTracklist = [row[ROW_TRK] for row in self.list]
-
-        # Should we stop playback?
-        sendStop        = False
-        keepTrackNewIdx = -1
-
-        # If we should keep the current track but it doesn't belong to the new playlist
-        if keepCurrTrack and self.list.hasMark():
-            sendStop  = True
-            currTrack = self.list.getRow(self.list.getMark())[ROW_TRK]
-
-            for idx, track in enumerate(tracks):
-                if track == currTrack:
-                    sendStop        = False
-                    keepTrackNewIdx = idx
-                    break
-        # Or if we shouldn't start playback now or the new playlist is empty
-        elif self.list.hasMark() and ((not playNow) or (tracks is None) or (len(tracks) == 0)):
-            sendStop = True
+        if tracks is None:
+            tracks = []
 
-        if sendStop:
-            modules.postMsg(consts.MSG_CMD_STOP)
+        self.__record((OP_SET, self.list.getAllData(), list(tracks)))
+
+        # The current track is looked for in the new tracklist by its URI, using the index of the list
+        if keepCurrTrack and self.list.hasMark(): currURI = self.list.getData(self.list.getMark()).getURI()
+        else:                                     currURI = None
+
+        # Clearing the list removes the mark, which is needed to know whether playback must be stopped
+        hadMark = self.list.hasMark()
+        prevLen = len(self.list)
 
         self.list.clear()
+        self.errorRows.clear()
+        self.playOrder = None
+        self.stats.clear()
+
+        if prevLen != 0:
+            self.__postDelta((DELTA_REMOVED, 0, prevLen))
+
+        self.stats.add(tracks)
+        self.list.insertRows(tracks)
+
+        if len(tracks) != 0:
+            self.__postDelta((DELTA_INSERTED, 0, tuple(tracks)))
 
-        if tracks is not None and len(tracks) != 0:
-            self.insert(tracks, playNow)
+        if currURI is not None: keptRows = self.list.findRows(currURI)
+        else:                   keptRows = []
 
-        self.previousTracklist = previousTracklist
+        # Stop if we should keep the current track but it doesn't belong to the new playlist
+        # Or if we shouldn't start playback now or the new playlist is empty
+        if currURI is not None: sendStop = len(keptRows) == 0
+        else:                   sendStop = hadMark and ((not playNow) or len(self.list) == 0)
+
+        if sendStop:
+            modules.postMsg(consts.MSG_CMD_STOP)
+
+        if playNow and len(self.list) != 0:
+            self.jumpTo(0)
 
         # Mark the current track if we kept the same one
-        if keepCurrTrack and keepTrackNewIdx != -1:
-            self.jumpTo(keepTrackNewIdx, False, False)
+        if len(keptRows) != 0:
+            self.jumpTo(keptRows[0], False, False)
 
 
     def savePlaylist(self):
@@ -236,61 +443,81 @@ class Tracklist(modules.Module):
         outFile = fileChooser.save(self.window, _('Save playlist'), 'playlist.m3u')
 
         if outFile is not None:
-            allFiles = [row[ROW_TRK].getFilePath() for row in self.list.iterAllRows()]
+            allFiles = [track.getFilePath() for track in self.list.iterAllData()]
             media.playlist.save(allFiles, outFile)
 
 
-    def remove(self, idx=None):
-        """ Remove the given track, or the selection if idx is None """
-        if idx is not None and (idx < 0 or idx >= len(self.list)):
+    def __removeRows(self, indexes):
+        """ Remove the tracks located at the given sorted indexes """
+        if len(indexes) == 0:
             return
 
-        hadMark                = self.list.hasMark()
-        self.previousTracklist = [row[ROW_TRK] for row in self.list]
+        hadMark = self.list.hasMark()
+        tracks  = [self.list.getData(idx) for idx in indexes]
 
-        if idx is not None:
-            self.playtime -= self.list.getRow(idx)[ROW_LEN]
-            self.list.removeRow((idx, ))
-        else:
-            self.playtime -= sum([row[ROW_LEN] for row in self.list.iterSelectedRows()])
-            self.list.removeSelectedRows()
+        self.__record((OP_REMOVE, indexes, tracks))
 
+        self.stats.remove(tracks, len([idx for idx in indexes if self.__hasError(idx)]))
+        self.list.removeRows(indexes)
         self.list.unselectAll()
 
+        # Runs of consecutive tracks are notified from the last one, so that the positions of the others are still valid
+        end = len(indexes)
+        for i in xrange(len(indexes) - 1, -1, -1):
+            if i == 0 or indexes[i-1] != indexes[i] - 1:
+                self.__postDelta((DELTA_REMOVED, indexes[i], indexes[end-1] + 1))
+                end = i
+
         if hadMark and not self.list.hasMark():
             modules.postMsg(consts.MSG_CMD_STOP)
 
 
+    def remove(self, idx=None):
+        """ Remove the given track, or the selection if idx is None """
+        if idx is None:                         self.__removeRows(self.list.getSelectedRowsIndexes())
+        elif idx >= 0 and idx < len(self.list): self.__removeRows([idx])
+
+
     def crop(self):
         """ Remove the unselected tracks """
-        hadMark                = self.list.hasMark()
-        self.previousTracklist = [row[ROW_TRK] for row in self.list]
+        selected = set(self.list.getSelectedRowsIndexes())
 
-        self.playtime = sum([row[ROW_LEN] for row in self.list.iterSelectedRows()])
-        self.list.cropSelectedRows()
+        self.__removeRows([idx for idx in xrange(len(self.list)) if idx not in selected])
+        self.list.selectAll()
 
-        if hadMark and not self.list.hasMark():
-            modules.postMsg(consts.MSG_CMD_STOP)
 
+    def shuffleTracklist(self):
+        """ Play the tracks in a new random order, starting with the current one, without modifying the tracklist """
+        self.playOrder = PlayOrder([self.list.getRowId(idx) for idx in xrange(len(self.list))])
 
-    def revertTracklist(self):
-        """ Back to the previous tracklist """
-        self.set(self.previousTracklist, False, True)
-        self.previousTracklist = None
+        if self.list.hasMark():
+            self.playOrder.moveToFront(self.list.getRowId(self.list.getMark()))
+            modules.postMsg(consts.MSG_EVT_TRACK_MOVED, {'hasPrevious': self.__hasPreviousTrack(), 'hasNext': self.__hasNextTrack()})
 
 
-    def shuffleTracklist(self):
-        """ Shuffle the tracks and ensure that the current track stays visible """
-        self.previousTracklist = [row[ROW_TRK] for row in self.list]
-        self.list.shuffle()
+    def unshuffleTracklist(self):
+        """ Play the tracks in the order of the tracklist again """
+        if self.playOrder is not None:
+            self.playOrder = None
+
+            if self.list.hasMark():
+                modules.postMsg(consts.MSG_EVT_TRACK_MOVED, {'hasPrevious': self.__hasPreviousTrack(), 'hasNext': self.__hasNextTrack()})
+
+
+    def __updateRepeat(self, repeat):
+        """ Set/Unset the repeat function, and let other modules know about it """
+        self.repeat = repeat
+        prefs.set(__name__, 'repeat-status', repeat)
+        modules.postMsg(consts.MSG_EVT_REPEAT_CHANGED, {'repeat': repeat})
         if self.list.hasMark():
-            self.list.scroll_to_cell(self.list.getMark())
+            modules.postMsg(consts.MSG_EVT_TRACK_MOVED, {'hasPrevious': self.__hasPreviousTrack(), 'hasNext': self.__hasNextTrack()})
 
 
     def setRepeat(self, repeat):
         """ Set/Unset the repeat function """
-        if self.btnRepeat.get_active() != repeat:
-            self.btnRepeat.clicked()
+        if self.repeat != repeat:
+            if prefs.isHeadless(): self.__updateRepeat(repeat)
+            else:                  self.btnRepeat.clicked()
 
 
     def showPopupMenu(self, list, path, button, time):
@@ -322,13 +549,19 @@ class Tracklist(modules.Module):
         if len(list) == 0: shuffle.set_sensitive(False)
         else:              shuffle.connect('activate', lambda item: modules.postMsg(consts.MSG_CMD_TRACKLIST_SHUFFLE))
 
-        # Revert
-        revert = gtk.ImageMenuItem(_('Revert Playlist'))
-        revert.set_image(gtk.image_new_from_stock(gtk.STOCK_REVERT_TO_SAVED, gtk.ICON_SIZE_MENU))
-        popup.append(revert)
+        # Undo
+        undo = gtk.ImageMenuItem(gtk.STOCK_UNDO)
+        popup.append(undo)
 
-        if self.previousTracklist is None: revert.set_sensitive(False)
-        else:                              revert.connect('activate', lambda item: self.revertTracklist())
+        if len(self.undoStack) == 0: undo.set_sensitive(False)
+        else:                        undo.connect('activate', lambda item: self.undo())
+
+        # Redo
+        redo = gtk.ImageMenuItem(gtk.STOCK_REDO)
+        popup.append(redo)
+
+        if len(self.redoStack) == 0: redo.set_sensitive(False)
+        else:                        redo.connect('activate', lambda item: self.redo())
 
         # Clear
         clear = gtk.ImageMenuItem(_('Clear Playlist'))
@@ -369,20 +602,15 @@ class Tracklist(modules.Module):
                 self.jumpTo(0)
 
 
-    # --== Message handlers ==--
-
-
-    def onAppStarted(self):
-        """ This is the real initialization function, called when the module has been loaded """
-        wTree                  = prefs.getWidgetsTree()
-        self.playtime          = 0
-        self.bufferedTrack     = None
-        self.previousTracklist = None
+    def __createView(self, getters):
+        """ Create and return the list displaying the tracklist, along with the widgets around it """
+        wTree = prefs.getWidgetsTree()
         # Retrieve widgets
-        self.window     = wTree.get_object('win-main')
-        self.btnClear   = wTree.get_object('btn-tracklistClear')
-        self.btnRepeat  = wTree.get_object('btn-tracklistRepeat')
-        self.btnShuffle = wTree.get_object('btn-tracklistShuffle')
+        self.window      = wTree.get_object('win-main')
+        self.btnClear    = wTree.get_object('btn-tracklistClear')
+        self.btnRepeat   = wTree.get_object('btn-tracklistRepeat')
+        self.btnShuffle  = wTree.get_object('btn-tracklistShuffle')
+        self.entryFilter = wTree.get_object('entry-tracklistFilter')
         self.btnClear.set_sensitive(False)
         self.btnShuffle.set_sensitive(False)
         # Create the list and its columns
@@ -409,27 +637,59 @@ class Tracklist(modules.Module):
                    (_('Path'),     [(txtLRdr, TYPE_STRING)],                           (ROW_PTH,),                                    False, visible[COL_PATH]),
                    (None,          [(None, TYPE_PYOBJECT)],                            (None,),                                       False, False))
 
-        self.list = ExtListView(columns, sortable=True, dndTargets=consts.DND_TARGETS.values(), useMarkup=False, canShowHideColumns=True)
-        self.list.get_column(1).set_cell_data_func(txtLRdr, self.__fmtColumnColor)
-        self.list.get_column(4).set_cell_data_func(txtRRdr, self.__fmtLengthColumn)
-        self.list.enableDNDReordering()
-        wTree.get_object('scrolled-tracklist').add(self.list)
+        list = ExtListView(columns, sortable=True, dndTargets=consts.DND_TARGETS.values(), useMarkup=False, canShowHideColumns=True, getters=getters, key=media.track.Track.getURI, tokens=getTokens)
+        list.get_column(1).set_cell_data_func(txtLRdr, self.__fmtColumnColor)
+        list.get_column(4).set_cell_data_func(txtRRdr, self.__fmtLengthColumn)
+        list.enableDNDReordering()
+        # Sorting the list means that tracks should be played in this order
+        for column in list.get_columns():
+            column.connect('clicked', lambda column: self.unshuffleTracklist())
+        wTree.get_object('scrolled-tracklist').add(list)
         # GTK handlers
-        self.list.connect('extlistview-dnd', self.onDND)
-        self.list.connect('key-press-event', self.onKeyboard)
-        self.list.connect('extlistview-modified', self.onListModified)
-        self.list.connect('extlistview-button-pressed', self.onButtonPressed)
-        self.list.connect('extlistview-selection-changed', self.onSelectionChanged)
-        self.list.connect('extlistview-column-visibility-changed', self.onColumnVisibilityChanged)
+        list.connect('extlistview-dnd', self.onDND)
+        list.connect('key-press-event', self.onKeyboard)
+        list.connect('extlistview-button-pressed', self.onButtonPressed)
+        list.connect('extlistview-selection-changed', self.onSelectionChanged)
+        list.connect('extlistview-column-visibility-changed', self.onColumnVisibilityChanged)
         self.btnClear.connect('clicked', lambda widget: modules.postMsg(consts.MSG_CMD_TRACKLIST_CLR))
         self.btnRepeat.connect('toggled', self.onButtonRepeat)
         self.btnShuffle.connect('clicked', lambda widget: modules.postMsg(consts.MSG_CMD_TRACKLIST_SHUFFLE))
-        # Restore preferences
-        self.btnRepeat.set_active(prefs.get(__name__, 'repeat-status', PREFS_DEFAULT_REPEAT_STATUS))
+        self.entryFilter.connect('changed', lambda entry: list.setFilter(entry.get_text()))
         # Set icons
         wTree.get_object('img-repeat').set_from_icon_name('stock_repeat', gtk.ICON_SIZE_BUTTON)
         wTree.get_object('img-shuffle').set_from_icon_name('stock_shuffle', gtk.ICON_SIZE_BUTTON)
 
+        return list
+
+
+    # --== Message handlers ==--
+
+
+    def onAppStarted(self):
+        """ This is the real initialization function, called when the module has been loaded """
+        self.stats             = TracklistStats()
+        self.repeat            = False
+        self.playOrder         = None    # The random order in which tracks are played, if any
+        self.errorRows         = set()   # Identifiers of the rows flagged because of an error
+        self.undoStack         = []      # Modifications that can be undone, the last one being the most recent
+        self.redoStack         = []      # Modifications that have been undone, the last one being the most recent
+        self.recording         = True    # False while undoing/redoing a modification, which must not be added to the history
+        self.bufferedTrack     = None
+
+        # Rows are the tracks themselves, values of the columns are computed only when needed
+        getters = (lambda track: icons.nullMenuIcon(), media.track.Track.getNumber, media.track.Track.getTitleOrFilename, media.track.Track.getArtist,
+                   media.track.Track.getExtendedAlbum, media.track.Track.getLength, media.track.Track.getBitrate, media.track.Track.getGenre,
+                   media.track.Track.getDate, media.track.Track.getFilename, media.track.Track.getURI, lambda track: track)
+
+        if prefs.isHeadless(): self.list = ExtList(ROW_TYPES, getters=getters, key=media.track.Track.getURI, tokens=getTokens)
+        else:                  self.list = self.__createView(getters)
+
+        self.list.connect('extlistview-modified', self.onListModified)
+        self.list.connect('extlistview-reordered', self.onListReordered)
+
+        # Restore preferences
+        self.setRepeat(prefs.get(__name__, 'repeat-status', PREFS_DEFAULT_REPEAT_STATUS))
+
 
     def onTrackEnded(self, withError):
         """ The current track has ended, jump to the next one if any """
@@ -437,16 +697,19 @@ class Tracklist(modules.Module):
 
         # If an error occurred with the current track, flag it as such
         if withError:
+            if not self.__hasError(currIdx):
+                self.stats.addError()
+                self.errorRows.add(self.list.getRowId(currIdx))
             self.list.setItem(currIdx, ROW_ICO, icons.errorMenuIcon())
 
         # Find the next 'playable' track (not already flagged)
-        if self.btnRepeat.get_active(): nbTracks = len(self.list)
-        else:                           nbTracks = len(self.list) - 1 - currIdx
+        for i in xrange(len(self.list)):
+            currIdx = self.__getFollowingTrackIdx(currIdx, 1)
 
-        for i in xrange(nbTracks):
-            currIdx = (currIdx + 1) % len(self.list)
+            if currIdx == -1:
+                break
 
-            if self.list.getItem(currIdx, ROW_ICO) != icons.errorMenuIcon():
+            if not self.__hasError(currIdx):
                 track = self.list.getItem(currIdx, ROW_TRK).getURI()
                 self.jumpTo(currIdx, track != self.bufferedTrack, forced = False)
                 self.bufferedTrack = None
@@ -468,7 +731,7 @@ class Tracklist(modules.Module):
         """ Playback has been stopped """
         if self.list.hasMark():
             currTrack = self.list.getMark()
-            if self.list.getItem(currTrack, ROW_ICO) != icons.errorMenuIcon():
+            if not self.__hasError(currTrack):
                 self.list.setItem(currTrack, ROW_ICO, icons.nullMenuIcon())
             self.list.clearMark()
 
@@ -498,16 +761,13 @@ class Tracklist(modules.Module):
 
     def onButtonRepeat(self, btn):
         """ The 'repeat' button has been pressed """
-        prefs.set(__name__, 'repeat-status', self.btnRepeat.get_active())
-        modules.postMsg(consts.MSG_EVT_REPEAT_CHANGED, {'repeat': self.btnRepeat.get_active()})
-        if self.list.hasMark():
-            modules.postMsg(consts.MSG_EVT_TRACK_MOVED, {'hasPrevious': self.__hasPreviousTrack(), 'hasNext': self.__hasNextTrack()})
+        self.__updateRepeat(btn.get_active())
 
 
     def onButtonPressed(self, list, event, path):
         """ Play the selected track on double click, or show a popup menu on right click """
         if event.button == 1 and event.type == gtk.gdk._2BUTTON_PRESS and path is not None:
-            self.jumpTo(path[0])
+            self.jumpTo(self.list.getIndexFromPath(path))
         elif event.button == 3:
             self.showPopupMenu(list, path, event.button, event.time)
 
@@ -516,7 +776,10 @@ class Tracklist(modules.Module):
         """ Keyboard shortcuts """
         keyname = gtk.gdk.keyval_name(event.keyval)
 
-        if keyname == 'Delete':   self.remove()
+        if event.state & gtk.gdk.CONTROL_MASK:
+            if keyname == 'z':   self.undo()
+            elif keyname == 'y': self.redo()
+        elif keyname == 'Delete': self.remove()
         elif keyname == 'Return': self.jumpTo(self.list.getFirstSelectedRowIndex())
         elif keyname == 'space':  modules.postMsg(consts.MSG_CMD_TOGGLE_PAUSE)
         elif keyname == 'Escape': modules.postMsg(consts.MSG_CMD_STOP)
@@ -526,21 +789,32 @@ class Tracklist(modules.Module):
 
     def onListModified(self, list):
         """ Some rows have been added/removed/moved """
-        self.btnClear.set_sensitive(len(list) != 0)
-        self.btnShuffle.set_sensitive(len(list) != 0)
+        if not prefs.isHeadless():
+            self.btnClear.set_sensitive(len(list) != 0)
+            self.btnShuffle.set_sensitive(len(list) != 0)
 
-        # Update playlist length and playlist position for all tracks
-        for position, row in enumerate(self.list):
-            row[ROW_TRK].setPlaylistPos(position + 1)
-            row[ROW_TRK].setPlaylistLen(len(self.list))
+        # Forget removed tracks from the random order
+        if self.playOrder is not None and len(self.playOrder) != len(list):
+            self.playOrder.discard(lambda rowId: self.list.getRowIndex(rowId) is None)
 
-        allTracks = [row[ROW_TRK] for row in self.list]
-        modules.postMsg(consts.MSG_EVT_NEW_TRACKLIST, {'tracks': allTracks, 'playtime': self.playtime})
+        self.__updatePlaylistPos()
 
         if self.list.hasMark():
             modules.postMsg(consts.MSG_EVT_TRACK_MOVED, {'hasPrevious': self.__hasPreviousTrack(), 'hasNext':  self.__hasNextTrack()})
 
 
+    def onListReordered(self, list, newOrder):
+        """ The rows have been sorted or moved """
+        delta = getReorderDelta(newOrder)
+
+        # A single block of tracks that has been moved (e.g., using DND) is recorded without the whole new order
+        if delta is not None:
+            if delta[0] == DELTA_MOVED: self.__record((OP_MOVE, ) + delta[1:])
+            else:                       self.__record((OP_REORDER, newOrder))
+
+            self.__postDelta(delta)
+
+
     def onSelectionChanged(self, list, selectedRows):
         """ The selection has changed """
         modules.postMsg(consts.MSG_EVT_TRACKLIST_NEW_SEL, {'tracks': [row[ROW_TRK] for row in selectedRows]})
@@ -586,7 +860,7 @@ class Tracklist(modules.Module):
 
         # Insert the tracks, but beware of the AFTER/BEFORE mechanism used by GTK
         if dropInfo is None:                          self.insert(tracks, False)
-        elif dropInfo[1] == gtk.TREE_VIEW_DROP_AFTER: self.insert(tracks, False, dropInfo[0][0] + 1)
-        else:                                         self.insert(tracks, False, dropInfo[0][0])
+        elif dropInfo[1] == gtk.TREE_VIEW_DROP_AFTER: self.insert(tracks, False, self.list.getIndexFromPath(dropInfo[0]) + 1)
+        else:                                         self.insert(tracks, False, self.list.getIndexFromPath(dropInfo[0]))
 
         context.finish(True, False, time)
@@ -24,7 +24,8 @@ from .. import gui, modules
 from ..tools     import consts, prefs
 from ..tools.log import logger
 
-MOD_INFO = ('Twitter', 'Twitter', _('Update the status of your Twitter account'), [], False, True, consts.MODCAT_INTERNET)
+MOD_INFO     = ('Twitter', 'Twitter', _('Update the status of your Twitter account'), [], False, True, consts.MODCAT_INTERNET)
+MOD_HEADLESS = True
 
 DEFAULT_STATUS_MSG = '♫ Listening to {album} by {artist} ♫'
 
@@ -40,7 +41,7 @@ class Twitter(modules.ThreadedModule):
                         consts.MSG_EVT_APP_STARTED: self.onModLoaded,
                    }
 
-        modules.ThreadedModule.__init__(self, handlers)
+        modules.ThreadedModule.__init__(self, handlers, dedicatedThread=True)
 
 
     def getAuthInfo(self):
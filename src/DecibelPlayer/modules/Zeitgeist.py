@@ -25,7 +25,8 @@ from .. import modules
 from ..tools     import consts
 from ..tools.log import logger
 
-MOD_INFO = ('Zeitgeist', 'Zeitgeist', _('Send track information to the Zeitgeist service'), ['zeitgeist'], False, False, consts.MODCAT_DESKTOP)
+MOD_INFO     = ('Zeitgeist', 'Zeitgeist', _('Send track information to the Zeitgeist service'), ['zeitgeist'], False, False, consts.MODCAT_DESKTOP)
+MOD_HEADLESS = True
 
 
 class Zeitgeist(modules.ThreadedModule):
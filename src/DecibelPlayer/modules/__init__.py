@@ -18,12 +18,15 @@
 
 from __future__ import absolute_import
 
-import os, sys, threading, traceback
+import os, sys, threading, time, traceback
 import gobject, gtk
+from collections import deque
 from .. import gui
 import warnings
 
-from ..tools   import consts, prefs
+from ..media   import tracklistDelta
+from ..tools   import busRecorder, busTrace, consts, metrics, pickleLoad, pickleSave, prefs, profiler
+from ..tools.workerPool import WorkerPool
 from ..tools.log import logger
 from gettext import gettext as _
 
@@ -39,6 +42,22 @@ from gettext import gettext as _
     MODINFO_CATEGORY,       # Category the module belongs to
 ) = range(7)
 
+
+# High-frequency events, only the latest value of each is kept until no other message is pending, or until another message is posted
+COSMETIC_MSGS = (consts.MSG_EVT_TRACK_POSITION, consts.MSG_EVT_VOLUME_CHANGED)
+
+# Maximum number of messages dispatched during a single iteration of the GTK main loop
+MAX_BATCH_SIZE = 50
+
+# Maximum number of threads shared by threaded modules
+MAX_POOL_SIZE = 3
+
+# Enabled modules that are not mandatory are instantiated once the window has been drawn, but before MSG_EVT_APP_STARTED is posted
+DEFERRED_LOADING_PRIORITY = gobject.PRIORITY_HIGH_IDLE + 30   # Lower than GTK redraws, higher than gobject.PRIORITY_DEFAULT_IDLE
+
+# MOD_INFO is translated, the manifest must be rebuilt when these variables change
+MANIFEST_LOCALE_VARS = ('LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG')
+
 def convert_modinfo(modinfo):
     if not isinstance(modinfo, tuple):
         return modinfo
@@ -63,6 +82,15 @@ def convert_modinfo(modinfo):
 ) = range(4)
 
 
+# Information about a module file, cached in the manifest so that the module does not have to be imported to get it
+(
+    MAN_MTIME,      # Modification time of the file
+    MAN_INFO,       # MOD_INFO, converted to a dictionary
+    MAN_HEADLESS,   # True if the module declares MOD_HEADLESS
+    MAN_DEPS_OK,    # True if the dependencies were available the last time they were checked, None if they have not been checked
+) = range(4)
+
+
 class LoadException(Exception):
     """ Raised when a module could not be loaded """
 
@@ -84,6 +112,47 @@ def __checkDeps(deps):
     return unmetDeps
 
 
+def __instantiate(module):
+    """ Instantiate and start the given module, its Python module is imported if it has not been yet """
+    if module[MOD_PMODULE] is None:
+        module[MOD_PMODULE] = __import__(module[MOD_CLASSNAME])
+
+    module[MOD_INSTANCE] = getattr(module[MOD_PMODULE], module[MOD_CLASSNAME])()
+    module[MOD_INSTANCE].start()
+
+
+def __loadDeferredModule():
+    """ Instantiate the next deferred module, this is an idle callback of the GTK main loop """
+    module = mModules[mDeferredModules.pop(0)]
+
+    try:
+        __instantiate(module)
+        logger.info('Module loaded: %s' % module[MOD_CLASSNAME])
+    except:
+        logger.error('Unable to load module %s\n\n%s' % (module[MOD_CLASSNAME], traceback.format_exc()))
+
+    return len(mDeferredModules) != 0
+
+
+def __getLocale():
+    """ Return the current locale, as far as translations are concerned """
+    return [os.environ.get(var) for var in MANIFEST_LOCALE_VARS]
+
+
+def __loadManifest():
+    """ Return the manifest, associating the name of each module file to its information (see MAN_* values) """
+    try:    (locale, manifest) = pickleLoad(consts.fileManifest)
+    except: (locale, manifest) = (None, {})
+
+    if locale == __getLocale(): return manifest
+    else:                       return {}
+
+
+def __getThreadedQueueDepth():
+    """ Return how many messages are waiting in the queues of threaded modules """
+    return sum([modData[MOD_INSTANCE].queue.qsize() for modData in mModules.values() if isinstance(modData[MOD_INSTANCE], ThreadedModule)])
+
+
 def load(name):
     """ Load the given module, may raise LoadException """
     mModulesLock.acquire()
@@ -102,13 +171,10 @@ def load(name):
 
     # Instantiate the module
     try:
-        module[MOD_INSTANCE] = getattr(module[MOD_PMODULE], module[MOD_CLASSNAME])()
-        module[MOD_INSTANCE].start()
+        __instantiate(module)
 
-        mHandlersLock.acquire()
         if module[MOD_INSTANCE] in mHandlers[consts.MSG_EVT_MOD_LOADED]:
             module[MOD_INSTANCE].postMsg(consts.MSG_EVT_MOD_LOADED)
-        mHandlersLock.release()
 
         logger.info('Module loaded: %s' % module[MOD_CLASSNAME])
         mEnabledModules.append(name)
@@ -126,11 +192,8 @@ def unload(name):
     mModulesLock.release()
 
     if instance is not None:
-        mHandlersLock.acquire()
         instance.postMsg(consts.MSG_EVT_MOD_UNLOADED)
-        for handlers in [handler for handler in mHandlers.itervalues() if instance in handler]:
-            handlers.remove(instance)
-        mHandlersLock.release()
+        unregister(instance)
 
         mEnabledModules.remove(name)
         logger.info('Module unloaded: %s' % module[MOD_CLASSNAME])
@@ -147,9 +210,24 @@ def getModules():
 
 def register(module, msgList):
     """ Register the given module for all messages in the given list/tuple """
+    global mHandlers
+
+    # The handlers are never modified, a new copy replaces them so that they can be read without locking
     mHandlersLock.acquire()
+    handlers = list(mHandlers)
     for msg in msgList:
-        mHandlers[msg].add(module)
+        if module not in handlers[msg]:
+            handlers[msg] += (module,)
+    mHandlers = tuple(handlers)
+    mHandlersLock.release()
+
+
+def unregister(module):
+    """ Unregister the given module for all messages """
+    global mHandlers
+
+    mHandlersLock.acquire()
+    mHandlers = tuple([tuple([registered for registered in handlers if registered is not module]) for handlers in mHandlers])
     mHandlersLock.release()
 
 
@@ -159,29 +237,151 @@ def showPreferences():
     gobject.idle_add(gui_preferences.show)
 
 
-def __postMsg(msg, params={}):
+def __postMsg(msg, params, posted):
     """ This is the 'real' postMsg function, which must be executed in the GTK main loop """
-    mHandlersLock.acquire()
+    # A faulty module must not prevent the other ones from receiving the message
     for module in mHandlers[msg]:
-        module.postMsg(msg, params)
-    mHandlersLock.release()
+        try:    module.handleMsg(msg, params, posted)
+        except: logger.error('[%s] Error while handling message %s\n\n%s' % (module.__class__.__name__, busTrace.getMsgName(msg), traceback.format_exc()))
 
+    if msg == consts.MSG_EVT_TRACKLIST_DELTA:
+        __postNewTracklist(params['delta'], params['stats'], posted)
+
+
+def __postNewTracklist(delta, stats, posted):
+    """
+        Compatibility with modules that still want the whole tracklist with MSG_EVT_NEW_TRACKLIST
+        The tracklist is rebuilt from the deltas, and copied only if such a module is registered
+    """
+    tracklistDelta.apply(mTracklist, delta)
+
+    if len(mHandlers[consts.MSG_EVT_NEW_TRACKLIST]) != 0:
+        __postMsg(consts.MSG_EVT_NEW_TRACKLIST, {'tracks': list(mTracklist), 'stats': stats}, posted)
+
+
+def __dispatchPendingMsgs():
+    """ Dispatch a batch of pending messages, this is an idle callback of the GTK main loop """
+    global mDispatchScheduled
+
+    mPendingLock.acquire()
+    batch = [mPendingMsgs.popleft() for i in xrange(min(len(mPendingMsgs), MAX_BATCH_SIZE))]
+
+    if len(mPendingMsgs) == 0:
+        batch.extend(__popCosmeticMsgs())
+
+    # The next batch is scheduled right now, so that it can be dispatched if a handler runs a nested main loop (e.g., a dialog box)
+    mDispatchScheduled = (len(mPendingMsgs) != 0 or len(mPendingCosmeticMsgs) != 0)
+    if mDispatchScheduled:
+        gobject.idle_add(__dispatchPendingMsgs)
+    mPendingLock.release()
+
+    # A faulty handler must not prevent the other messages from being dispatched
+    started = time.time()
+    for (msg, params, posted) in batch:
+        try:    __postMsg(msg, params, posted)
+        except: logger.error('Error while dispatching message %u\n\n%s' % (msg, traceback.format_exc()))
+
+    metrics.addToHistogram('bus_batch_seconds', time.time() - started)
+
+    return False
+
+
+def __popCosmeticMsgs():
+    """ Remove pending cosmetic messages and return them in the order they were posted, mPendingLock must be held """
+    cosmeticMsgs = sorted([(msg, params, posted) for (msg, (params, posted)) in mPendingCosmeticMsgs.iteritems()], key = lambda item: item[2])
+    mPendingCosmeticMsgs.clear()
+
+    return cosmeticMsgs
+
+
+def __queueMsg(msg, params):
+    """ Queue the given message, it will be dispatched by the GTK main loop """
+    global mDispatchScheduled
 
-def postMsg(msg, params={}):
-    """ Post a message to the queue of modules that registered for this type of message """
     # We need to ensure that posting messages will be done by the GTK main loop
     # Otherwise, the code of threaded modules could be executed in the caller's thread, which could cause problems when calling GTK functions
-    gobject.idle_add(__postMsg, msg, params)
+    # Pending messages are dispatched in batches, by a single idle callback
+    mPendingLock.acquire()
+
+    # Cosmetic messages must not be dispatched after a message posted after them (e.g., the position of the previous track after MSG_EVT_NEW_TRACK)
+    if msg in COSMETIC_MSGS:
+        mPendingCosmeticMsgs[msg] = (params, time.time())
+    else:
+        if len(mPendingCosmeticMsgs) != 0:
+            mPendingMsgs.extend(__popCosmeticMsgs())
+
+        mPendingMsgs.append((msg, params, time.time()))
+
+    if not mDispatchScheduled:
+        mDispatchScheduled = True
+        gobject.idle_add(__dispatchPendingMsgs)
+
+    mPendingLock.release()
+
+
+def postMsg(msg, params={}):
+    """ Post a message to the queue of modules that registered for this type of message """
+    if busRecorder.isRecording():
+        busRecorder.add(msg, params)
+
+    # While replaying, the recording already contains the messages posted by modules, so that replays are deterministic
+    if not mReplaying:
+        __queueMsg(msg, params)
+
+
+def __replayMsgs(records, speed, started):
+    """ Post the recorded messages that are due, this is a callback of the GTK main loop """
+    elapsed  = time.time() - started
+    nbPosted = 0
+
+    while len(records) != 0 and nbPosted < MAX_BATCH_SIZE and (speed == 0 or records[0][busRecorder.REC_OFFSET] / speed <= elapsed):
+        record    = records.popleft()
+        nbPosted += 1
+
+        if record[busRecorder.REC_REPLAYABLE]:
+            __queueMsg(record[busRecorder.REC_MSG], record[busRecorder.REC_PARAMS])
+
+    # Quit once all messages have been dispatched
+    if len(records) == 0:
+        if len(mPendingMsgs) == 0 and not mDispatchScheduled:
+            logger.info('Replay done in %.2f seconds' % (time.time() - started))
+            postQuitMsg()
+        else:
+            gobject.timeout_add(100, __replayMsgs, records, speed, started)
+    elif speed == 0 or nbPosted == MAX_BATCH_SIZE:
+        gobject.idle_add(__replayMsgs, records, speed, started)
+    else:
+        gobject.timeout_add(int(1000 * max(0, records[0][busRecorder.REC_OFFSET] / speed - (time.time() - started))), __replayMsgs, records, speed, started)
+
+    return False
+
+
+def replay(filename, speed):
+    """
+        Post the messages recorded in the given file, speed being the acceleration factor (0 to post them as fast as possible)
+        Other messages are dropped from now on, and the application quits once the replay is over
+    """
+    global mReplaying
+
+    # Modules have already been started by the live MSG_EVT_APP_STARTED
+    records    = deque([record for record in busRecorder.load(filename) if record[busRecorder.REC_MSG] != consts.MSG_EVT_APP_STARTED])
+    mReplaying = True
+
+    logger.info('Replaying %u messages from %s' % (len(records), filename))
+    __replayMsgs(records, speed, time.time())
+
+    return False
 
 
 def __postQuitMsg():
     """ This is the 'real' postQuitMsg function, which must be executed in the GTK main loop """
-    __postMsg(consts.MSG_EVT_APP_QUIT)
+    __postMsg(consts.MSG_EVT_APP_QUIT, {}, time.time())
     for modData in mModules.itervalues():
         if modData[MOD_INSTANCE] is not None:
             modData[MOD_INSTANCE].join()
     # Don't exit the application right now, let modules do their job before
-    gobject.idle_add(gtk.main_quit)
+    if prefs.isHeadless(): gobject.idle_add(prefs.getHeadlessLoop().quit)
+    else:                  gobject.idle_add(gtk.main_quit)
 
 
 def postQuitMsg():
@@ -281,7 +481,7 @@ class ModuleBase:
     def configure(self, parent):
         pass
 
-    def handleMsg(self, msg, params):
+    def handleMsg(self, msg, params, posted):
         pass
 
     def restartRequired(self):
@@ -301,27 +501,83 @@ class Module(ModuleBase):
         register(self, handlers.keys())
 
     def postMsg(self, msg, params={}):
-        gobject.idle_add(self.__dispatch, msg, params)
+        gobject.idle_add(self.__dispatch, msg, params, time.time())
 
-    def __dispatch(self, msg, params):
-        self.handlers[msg](**params)
+    def handleMsg(self, msg, params, posted):
+        """ Messages of the modules bus are already dispatched by the GTK main loop, there's no need to defer the call """
+        self.__dispatch(msg, params, posted)
 
+    def __dispatch(self, msg, params, posted):
+        if not busTrace.isEnabled():
+            self.handlers[msg](**params)
+        else:
+            started = time.time()
+            self.handlers[msg](**params)
+            busTrace.addDispatch(msg, self.__class__.__name__, posted, started, time.time())
 
 
-class ThreadedModule(threading.Thread, ModuleBase):
-    """ This is the base class for threaded modules """
 
-    def __init__(self, handlers):
+class GtkFuture:
+    """ The result of a function submitted to the GTK main loop by a threaded module """
+
+    def __init__(self):
         """ Constructor """
+        self.done    = threading.Event()
+        self.result  = None
+        self.excInfo = None
+
+    def setResult(self, result):
+        """ The function has returned the given result """
+        self.result = result
+        self.done.set()
+
+    def setException(self, excInfo):
+        """ The function has raised an exception, excInfo is given by sys.exc_info() """
+        self.excInfo = excInfo
+        self.done.set()
+
+    def isDone(self):
+        """ Return whether the function has been executed """
+        return self.done.isSet()
+
+    def wait(self, timeout=None):
+        """ Wait until the function has been executed, return False if the timeout (in seconds) expired before that """
+        self.done.wait(timeout)
+        return self.done.isSet()
+
+    def getResult(self):
+        """ Wait until the function has been executed and return its result, or raise its exception """
+        self.done.wait()
+
+        if self.excInfo is not None:
+            raise self.excInfo[0], self.excInfo[1], self.excInfo[2]
+
+        return self.result
+
+
+
+class ThreadedModule(ModuleBase):
+    """
+        This is the base class for threaded modules
+        Messages are handled one at a time and in order, either by the shared pool of threads or by a dedicated thread
+    """
+
+    def __init__(self, handlers, dedicatedThread=False):
+        """ Constructor, a dedicated thread should be used by modules that may be busy for a long time (e.g., network I/O) """
         import Queue
 
         # Attributes
         self.queue        = Queue.Queue(0)            # List of queued messages
-        self.gtkResult    = None                      # Value returned by the function executed in the GTK loop
-        self.gtkSemaphore = threading.Semaphore(0)    # Used to execute some code in the GTK loop
+        self.thread       = None                      # The dedicated thread, if any
+        self.stopped      = threading.Event()         # Set once MSG_EVT_APP_QUIT or MSG_EVT_MOD_UNLOADED has been handled
+        self.gtkCalls     = deque()                   # Functions submitted to the GTK main loop, with their arguments and future
+        self.scheduled    = False                     # True if the handling of the next message has been submitted to the pool
+        self.gtkLock      = threading.Lock()          # Protects the GTK calls from concurrent access
+        self.scheduleLock = threading.Lock()          # Protects the scheduled attribute from concurrent access
 
         # Initialization
-        threading.Thread.__init__(self)
+        if dedicatedThread:
+            self.thread = threading.Thread(target=self.__run, name=self.__class__.__name__)
 
         # Add QUIT and UNLOADED messages if needed
         # These messages are required to exit the thread's loop
@@ -331,16 +587,40 @@ class ThreadedModule(threading.Thread, ModuleBase):
         self.handlers = handlers
         register(self, handlers.keys())
 
-    def __gtkExecute(self, func):
-        """ Private function, must be executed in the GTK main loop """
-        self.gtkResult = func()
-        self.gtkSemaphore.release()
+    def __gtkExecuteCalls(self):
+        """ Private function, must be executed in the GTK main loop: execute a batch of submitted functions, return True if others are pending """
+        self.gtkLock.acquire()
+        batch = [self.gtkCalls.popleft() for i in xrange(min(len(self.gtkCalls), MAX_BATCH_SIZE))]
+        self.gtkLock.release()
+
+        for (func, args, future) in batch:
+            try:    future.setResult(func(*args))
+            except: future.setException(sys.exc_info())
+
+        self.gtkLock.acquire()
+        pending = (len(self.gtkCalls) != 0)
+        self.gtkLock.release()
+
+        return pending
+
+    def gtkSubmit(self, func, *args):
+        """
+            Schedule func(*args) to be called in the GTK main loop, and return a GtkFuture without waiting for it
+            Functions submitted by a module are called in the order they have been submitted
+        """
+        future = GtkFuture()
+
+        self.gtkLock.acquire()
+        self.gtkCalls.append((func, args, future))
+        if len(self.gtkCalls) == 1:
+            gobject.idle_add(self.__gtkExecuteCalls)
+        self.gtkLock.release()
+
+        return future
 
     def gtkExecute(self, func):
         """ Execute func in the GTK main loop, and block the execution of the thread until done """
-        gobject.idle_add(self.__gtkExecute, func)
-        self.gtkSemaphore.acquire()
-        return self.gtkResult
+        return self.gtkSubmit(func).getResult()
 
     def threadExecute(self, func, *args):
         """
@@ -351,19 +631,69 @@ class ThreadedModule(threading.Thread, ModuleBase):
 
     def postMsg(self, msg, params={}):
         """ Enqueue a message in this threads's message queue """
-        self.queue.put((msg, params))
+        self.__enqueue(msg, params, time.time())
+
+    def handleMsg(self, msg, params, posted):
+        """ Messages of the modules bus are handled by the thread """
+        self.__enqueue(msg, params, posted)
 
-    def run(self):
-        """ Wait for messages and handle them """
-        msg = None
-        while msg != consts.MSG_EVT_APP_QUIT and msg != consts.MSG_EVT_MOD_UNLOADED:
-            (msg, params) = self.queue.get(True)
+    def __enqueue(self, msg, params, posted):
+        """ Enqueue a message, and make sure that the pool will handle it if there's no dedicated thread """
+        self.queue.put((msg, params, posted))
 
+        if self.thread is None:
+            self.scheduleLock.acquire()
+            if not self.scheduled:
+                self.scheduled = True
+                mWorkerPool.submit(self.__handleNextMsg)
+            self.scheduleLock.release()
+
+    def __handleMsg(self, msg, params, posted):
+        """ Handle the given message """
+        started = time.time()
+
+        # The module must be stopped even if its handler fails, otherwise join() would never return
+        try:
             if msg == consts.MSG_CMD_THREAD_EXECUTE:
                 (func, args) = params
                 func(*args)
             else:
                 self.handlers[msg](**params)
+        finally:
+            if msg == consts.MSG_EVT_APP_QUIT or msg == consts.MSG_EVT_MOD_UNLOADED:
+                self.stopped.set()
+
+        if busTrace.isEnabled():
+            busTrace.addQueueDepth(self.__class__.__name__, self.queue.qsize())
+            busTrace.addDispatch(msg, self.__class__.__name__, posted, started, time.time())
+
+    def __handleNextMsg(self):
+        """ Executed by the pool: handle the next message, and submit the following one if any """
+        try:
+            if not self.stopped.isSet():
+                self.__handleMsg(*self.queue.get(False))
+        finally:
+            # Messages received once the module has been stopped are ignored, as they would be by a dedicated thread
+            self.scheduleLock.acquire()
+            if self.queue.empty() or self.stopped.isSet(): self.scheduled = False
+            else:                                          mWorkerPool.submit(self.__handleNextMsg)
+            self.scheduleLock.release()
+
+    def __run(self):
+        """ Main loop of the dedicated thread: wait for messages and handle them """
+        while not self.stopped.isSet():
+            try:    profiler.runcall(self.__handleMsg, *self.queue.get(True))
+            except: logger.error('[%s] Unhandled exception in a handler\n\n%s' % (self.__class__.__name__, traceback.format_exc()))
+
+    def start(self):
+        """ Start the dedicated thread, if any """
+        if self.thread is not None:
+            self.thread.start()
+
+    def join(self):
+        """ Wait until MSG_EVT_APP_QUIT or MSG_EVT_MOD_UNLOADED has been handled """
+        if self.thread is not None: self.thread.join()
+        else:                       self.stopped.wait()
 
 
 # --== Entry point ==--
@@ -372,35 +702,81 @@ logger.debug("Scanning modules..")
 
 mModDir         = os.path.dirname(__file__)                                    # Where modules are located
 mModules        = {}                                                           # All known modules associated to an 'active' boolean
-mHandlers       = dict([(msg, set()) for msg in xrange(consts.MSG_END_VALUE)]) # For each message, store the set of registered modules
+mHandlers       = tuple([() for msg in xrange(consts.MSG_END_VALUE)])          # For each message, the tuple of registered modules (replaced, never modified)
 mModulesLock    = threading.Lock()                                             # Protects the modules list from concurrent access
-mHandlersLock   = threading.Lock()                                             # Protects the handlers list from concurrent access
+mHandlersLock   = threading.Lock()                                             # Protects the handlers list from concurrent modifications
+mWorkerPool     = WorkerPool('Modules', MAX_POOL_SIZE)                         # Threads shared by threaded modules that don't have a dedicated one
 mEnabledModules = prefs.get(__name__, 'enabled_modules', [])                   # List of modules currently enabled
+mTracklist      = []                                                           # The tracklist, rebuilt from MSG_EVT_TRACKLIST_DELTA for MSG_EVT_NEW_TRACKLIST
+
+mPendingMsgs         = deque()            # Messages waiting to be dispatched, in the order they were posted
+mPendingCosmeticMsgs = {}                 # Cosmetic messages waiting to be dispatched, associated to their latest parameters and posting time
+mPendingLock         = threading.Lock()   # Protects pending messages from concurrent access
+mDispatchScheduled   = False              # True if pending messages will be dispatched by the GTK main loop
+mReplaying           = False              # True while replaying recorded messages, other messages are then dropped
+
+mManifest        = {}                 # Information about each module file, see MAN_* values
+mPrevManifest    = __loadManifest()   # The manifest saved by the previous run of the application
+mDeferredModules = []                 # Enabled modules that are not mandatory, waiting to be instantiated
 
 
 # Find modules, instantiate those that are mandatory or that have been previously enabled by the user
+# A module is imported only if it must be instantiated, or if its file has been modified since it has been added to the manifest
 sys.path.append(mModDir)
 for file in [os.path.splitext(file)[0] for file in os.listdir(mModDir) if file.endswith('.py') and file != '__init__.py']:
     try:
-        pModule = __import__(file)
-        modInfo = getattr(pModule, 'MOD_INFO')
-        modInfo = convert_modinfo(modInfo)
+        pModule = None
+        mtime   = os.path.getmtime(os.path.join(mModDir, file + '.py'))
+
+        if file in mPrevManifest and mPrevManifest[file][MAN_MTIME] == mtime:
+            entry = list(mPrevManifest[file])
+        else:
+            pModule = __import__(file)
+            entry   = [mtime, convert_modinfo(getattr(pModule, 'MOD_INFO')), getattr(pModule, 'MOD_HEADLESS', False), None]
+
+        modInfo         = entry[MAN_INFO]
+        mManifest[file] = entry
 
-        # Should it be instanciated?
+        # Should it be instanciated? In headless mode, only modules declaring MOD_HEADLESS (i.e., without any GUI) can be
+        # Modules using Internet services are never instantiated when replaying messages, replayed tracks must not be published
         instance = None
         if modInfo['mandatory'] or modInfo['name'] in mEnabledModules:
-            if len(__checkDeps(modInfo[MODINFO_DEPS])) == 0:
-                instance = getattr(pModule, file)()
-                instance.start()
-                logger.info('Module loaded: %s' % file)
-            else:
+            # Missing dependencies are checked again, they may have been installed since the last check
+            if prefs.isHeadless() and not entry[MAN_HEADLESS]:
+                logger.info('Module skipped in headless mode: %s' % file)
+            elif modInfo['category'] == consts.MODCAT_INTERNET and prefs.getCmdLine()[0].replay_bus is not None:
+                logger.info('Module skipped when replaying messages: %s' % file)
+            elif not entry[MAN_DEPS_OK] and len(__checkDeps(modInfo['deps'])) != 0:
+                entry[MAN_DEPS_OK] = False
                 logger.error('Unable to load module %s because of missing dependencies' % file)
+            else:
+                entry[MAN_DEPS_OK] = True
+
+                if not modInfo['mandatory']:
+                    mDeferredModules.append(modInfo['name'])
+                else:
+                    if pModule is None:
+                        pModule = __import__(file)
+
+                    instance = getattr(pModule, file)()
+                    instance.start()
+                    logger.info('Module loaded: %s' % file)
 
         # Add it to the dictionary
-        mModules[modInfo[MODINFO_NAME]] = [pModule, file, instance, modInfo]
+        mModules[modInfo['name']] = [pModule, file, instance, modInfo]
     except:
         logger.error('Unable to load module %s\n\n%s' % (file, traceback.format_exc()))
 
+if mManifest != mPrevManifest:
+    try:    pickleSave(consts.fileManifest, (__getLocale(), mManifest))
+    except: logger.error('Unable to save the manifest of modules\n\n%s' % traceback.format_exc())
+
+if len(mDeferredModules) != 0:
+    gobject.idle_add(__loadDeferredModule, priority=DEFERRED_LOADING_PRIORITY)
+
+metrics.setGauge('bus_pending_messages',     lambda: len(mPendingMsgs) + len(mPendingCosmeticMsgs))
+metrics.setGauge('bus_threaded_queue_depth', __getThreadedQueueDepth)
+
 # Remove enabled modules that are no longer available
 mEnabledModules[:] = [module for module in mEnabledModules if module in mModules]
 prefs.set(__name__, 'enabled_modules', mEnabledModules)
@@ -19,14 +19,11 @@
 
 from __future__ import absolute_import
 
-import gettext, locale, optparse, sys
+import gettext, locale, optparse, os, sys
 
 import dbus
 import gtk, gobject
 
-from .gui   import mainWindow
-from .tools import consts, loadGladeFile, log, prefs
-
 def main():
 
     # Command line
@@ -35,9 +32,34 @@ def main():
     optparser.add_option('--multiple-instances', action='store_true', default=False, help='start a new instance even if one is already running')
     optparser.add_option('--no-glossy-cover', action='store_true', default=False, help='disable the gloss effect applied to covers')
     optparser.add_option('--volume-button', action='store_true', default=False, help='always show the volume button')
+    optparser.add_option('--trace-bus', action='store_true', default=False, help='trace the messages sent to modules, send SIGUSR1 to save the trace (and to toggle tracing)')
+    optparser.add_option('--headless', action='store_true', default=False, help='run without any GUI nor display, the player is then controlled through D-Bus')
+    optparser.add_option('--record-bus', metavar='FILE', help='record the messages sent to modules to the given file')
+    optparser.add_option('--replay-bus', metavar='FILE', help='replay the messages recorded to the given file without any GUI, then quit')
+    optparser.add_option('--replay-speed', metavar='SPEED', type='float', default=1.0, help='acceleration factor of the replay, 0 to replay messages as fast as possible')
+    optparser.add_option('--config-dir', metavar='DIR', help='use the given configuration directory (a temporary one when replaying messages)')
 
     (optOptions, optArgs) = optparser.parse_args()
 
+    # Replaying recorded messages is done without any GUI, even if another instance is running
+    # The configuration of the user must not be modified by a replay, which is done in a throwaway directory by default
+    if optOptions.replay_bus is not None:
+        optOptions.headless           = True
+        optOptions.multiple_instances = True
+
+        if optOptions.config_dir is None:
+            import atexit, shutil, tempfile
+
+            optOptions.config_dir = tempfile.mkdtemp(prefix='decibel-replay-')
+            atexit.register(shutil.rmtree, optOptions.config_dir, True)
+
+    # The configuration directory is determined when importing consts, so this must be done before any import of our modules
+    if optOptions.config_dir is not None:
+        os.environ['DECIBEL_CONFIG_DIR'] = os.path.abspath(optOptions.config_dir)
+
+    from .gui   import mainWindow
+    from .tools import busRecorder, busTrace, consts, loadGladeFile, log, metrics, prefs
+
 
     # Check whether DAP is already running?
     if not optOptions.multiple_instances:
@@ -70,6 +92,12 @@ def main():
     log.logger.info('Started')
     prefs.setCmdLine((optOptions, optArgs))
 
+    if optOptions.trace_bus:
+        busTrace.enable()
+
+    if optOptions.record_bus is not None:
+        busRecorder.start(optOptions.record_bus)
+
 
     # Localization
     locale.setlocale(locale.LC_ALL, '')
@@ -79,49 +107,56 @@ def main():
 
     # PyGTK initialization
     gobject.threads_init()
-    gtk.window_set_default_icon_list(
-        gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon16),
-        gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon24),
-        gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon32),
-        gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon48),
-        gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon64),
-        gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon128))
 
+    if optOptions.headless:
+        # No window at all, modules with a GUI are not loaded and the main loop is a plain GObject one
+        window = None
+        prefs.setHeadlessLoop(gobject.MainLoop())
+    else:
+        gtk.window_set_default_icon_list(
+            gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon16),
+            gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon24),
+            gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon32),
+            gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon48),
+            gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon64),
+            gtk.gdk.pixbuf_new_from_file(consts.fileImgIcon128))
+
+        # Create the GUI
+        wtree  = loadGladeFile('MainWindow.ui')
+        window = wtree.get_object('win-main')
+
+        prefs.setWidgetsTree(wtree)
+
+        # RGBA support
+        try:
+            colormap = window.get_screen().get_rgba_colormap()
+            if colormap:
+                gtk.widget_set_default_colormap(colormap)
+        except:
+            log.logger.info('No RGBA support (requires PyGTK 2.10+)')
 
-    # Create the GUI
-    wtree  = loadGladeFile('MainWindow.ui')
-    window = wtree.get_object('win-main')
-
-    prefs.setWidgetsTree(wtree)
-
-    # RGBA support
-    try:
-        colormap = window.get_screen().get_rgba_colormap()
-        if colormap:
-            gtk.widget_set_default_colormap(colormap)
-    except:
-        log.logger.info('No RGBA support (requires PyGTK 2.10+)')
-
-    # This object takes care of the window (mainly event handlers)
-    mainWindow.MainWindow(wtree, window)
+        # This object takes care of the window (mainly event handlers)
+        mainWindow.MainWindow(wtree, window)
 
 
     def delayedStartup():
         """
             Perform all the initialization stuff that is not mandatory to display the window
-            This function should be called within the GTK main loop, once the window has been displayed
+            This function should be called within the GTK main loop, once the window has been displayed (if any)
         """
         import atexit, dbus.mainloop.glib, signal
         from . import modules
 
         def atExit():
             """ Final function, called just before exiting the Python interpreter """
+            busRecorder.stop()
             prefs.save()
             log.logger.info('Stopped')
 
         def onInterrupt(window):
             """ Handler for interrupt signals e.g., Ctrl-C """
-            window.hide()
+            if window is not None:
+                window.hide()
             modules.postQuitMsg()
 
         # D-Bus
@@ -131,19 +166,28 @@ def main():
         atexit.register(atExit)
         signal.signal(signal.SIGINT,  lambda sig, frame: onInterrupt(window))
         signal.signal(signal.SIGTERM, lambda sig, frame: onInterrupt(window))
+        signal.signal(signal.SIGUSR1, lambda sig, frame: gobject.idle_add(busTrace.toggle))
+
+        # Metrics are saved periodically, so that the health of the player can be monitored
+        gobject.timeout_add_seconds(metrics.SAVE_PERIOD, metrics.save)
 
         # Now we can start all modules
         gobject.idle_add(modules.postMsg, consts.MSG_EVT_APP_STARTED)
 
+        if optOptions.replay_bus is not None:
+            gobject.idle_add(modules.replay, optOptions.replay_bus, optOptions.replay_speed)
+
         # Immediately show the preferences the first time the application is started
-        if prefs.get(__name__, 'first-time', True):
+        if not prefs.isHeadless() and prefs.get(__name__, 'first-time', True):
             prefs.set(__name__, 'first-time', False)
             gobject.idle_add(modules.showPreferences)
 
 
     # Let's go
     gobject.idle_add(delayedStartup)
-    gtk.main()
+
+    if prefs.isHeadless(): prefs.getHeadlessLoop().run()
+    else:                  gtk.main()
 
 if __name__ == '__main__':
     main()
@@ -29,21 +29,29 @@ import dbus, os, sys
     CLEAR,
     SHUFFLE,
     VOLUME,
-) = range(10)
+    METRICS,
+    PROFILE_START,
+    PROFILE_STOP,
+    HEAP_SNAPSHOT,
+) = range(14)
 
 (CMD_ARGS, CMD_HELP, CMD_NAME) = range(3)
 
 commands = {
-                'play':    ( '',                 'Start playing the current track',             PLAY    ),
-                'pause':   ( '',                 'Pause or continue playing the current track', PAUSE   ),
-                'next':    ( '',                 'Jump to the next track',                      NEXT    ),
-                'prev':    ( '',                 'Jump to the previous track',                  PREVIOUS),
-                'stop':    ( '',                 'Stop playback',                               STOP    ),
-                'pl-set':  ( 'file1 file2...',   'Set the playlist to the given files',         SET     ),
-                'pl-add':  ( 'file1 file2...',   'Append the given files to the playlist',      ADD     ),
-                'pl-clr':  ( '',                 'Clear the playlist',                          CLEAR   ),
-                'shuffle': ( '',                 'Shuffle the playlist',                        SHUFFLE ),
-                'volume':  ( 'value (0 -- 100)', 'Set the volume',                              VOLUME  ),
+                'play':          ( '',                 'Start playing the current track',              PLAY         ),
+                'pause':         ( '',                 'Pause or continue playing the current track',  PAUSE        ),
+                'next':          ( '',                 'Jump to the next track',                       NEXT         ),
+                'prev':          ( '',                 'Jump to the previous track',                   PREVIOUS     ),
+                'stop':          ( '',                 'Stop playback',                                STOP         ),
+                'pl-set':        ( 'file1 file2...',   'Set the playlist to the given files',          SET          ),
+                'pl-add':        ( 'file1 file2...',   'Append the given files to the playlist',       ADD          ),
+                'pl-clr':        ( '',                 'Clear the playlist',                           CLEAR        ),
+                'shuffle':       ( '',                 'Shuffle the playlist',                         SHUFFLE      ),
+                'volume':        ( 'value (0 -- 100)', 'Set the volume',                               VOLUME       ),
+                'metrics':       ( '',                 'Print the current value of all metrics',       METRICS      ),
+                'profile-start': ( '',                 'Start profiling the running instance',         PROFILE_START),
+                'profile-stop':  ( '',                 'Stop profiling and save the statistics',       PROFILE_STOP ),
+                'heap-snapshot': ( '',                 'Save the number of objects of each type',      HEAP_SNAPSHOT),
            }
 
 # Check the command line
@@ -59,10 +67,10 @@ if len(sys.argv) > 1:
 
 if not cmdLineOk:
     print 'Usage: %s command [arg1 arg2...]\n' % os.path.basename(sys.argv[0])
-    print 'Command  | Arguments        | Description'
-    print '-------------------------------------------------------------------------'
+    print 'Command       | Arguments        | Description'
+    print '------------------------------------------------------------------------------'
     for cmd, data in sorted(commands.iteritems()):
-        print '%s| %s| %s' % (cmd.ljust(9), data[CMD_ARGS].ljust(17), data[CMD_HELP])
+        print '%s| %s| %s' % (cmd.ljust(14), data[CMD_ARGS].ljust(17), data[CMD_HELP])
     sys.exit(1)
 
 # Make sure that paths are absolute
@@ -78,6 +86,7 @@ if 'org.mpris.dap' not in activeServices:
     sys.exit(2)
 
 cmd       = commands[cmdName][CMD_NAME]
+root      = dbus.Interface(session.get_object('org.mpris.dap', '/'),          'org.freedesktop.MediaPlayer')
 player    = dbus.Interface(session.get_object('org.mpris.dap', '/Player'),    'org.freedesktop.MediaPlayer')
 tracklist = dbus.Interface(session.get_object('org.mpris.dap', '/TrackList'), 'org.freedesktop.MediaPlayer')
 
@@ -91,3 +100,16 @@ elif cmd == CLEAR:    tracklist.Clear()
 elif cmd == VOLUME:   player.VolumeSet(int(sys.argv[2]))
 elif cmd == SHUFFLE:  tracklist.SetRandom(True)
 elif cmd == PREVIOUS: player.Prev()
+elif cmd == METRICS:
+    metrics = root.GetMetrics()
+    for name in sorted(metrics):
+        print '%s %s' % (name, repr(float(metrics[name])))
+elif cmd == PROFILE_START:
+    if not root.ProfileStart():
+        print 'Profiling is already enabled'
+elif cmd == PROFILE_STOP:
+    filename = root.ProfileStop()
+    if filename == '': print 'Profiling is not enabled'
+    else:              print 'Statistics saved to %s' % filename
+elif cmd == HEAP_SNAPSHOT:
+    print 'Snapshot saved to %s' % root.HeapSnapshot()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# Recording of the messages posted to modules, so that they can be replayed later on (see modules.replay())
+#
+# The file is a gzip-compressed stream of pickled records, the first one being a header (version, start time)
+# Messages are recorded by name, so that a recording can still be replayed once new messages have been added
+# Parameters that cannot be pickled (e.g., GTK objects) are replaced by a summary, and such messages cannot be replayed
+
+from __future__ import absolute_import
+
+import cPickle, gzip, threading, time
+
+from . import consts
+from .log import logger
+
+
+# Version of the file format
+VERSION = 1
+
+
+# A record
+(
+    REC_OFFSET,       # When the message was posted, in seconds since the beginning of the recording
+    REC_MSG,          # The message, its name in the file
+    REC_PARAMS,       # Parameters of the message, or their summary if it is not replayable
+    REC_REPLAYABLE,   # False if the parameters could not be recorded
+) = range(4)
+
+
+mFile     = None
+mLock     = threading.Lock()   # Messages may be posted by any thread
+mStarted  = None
+mMsgNames = dict([(value, name) for (name, value) in vars(consts).iteritems() if name.startswith('MSG_')])
+
+
+def isRecording():
+    """ Return whether messages are being recorded """
+    return mFile is not None
+
+
+def start(filename):
+    """ Start recording messages to the given file, it is overwritten if it exists """
+    global mFile, mStarted
+
+    mLock.acquire()
+    mFile    = gzip.open(filename, 'wb')
+    mStarted = time.time()
+    cPickle.dump((VERSION, mStarted), mFile, cPickle.HIGHEST_PROTOCOL)
+    mLock.release()
+
+    logger.info('Recording messages to %s' % filename)
+
+
+def stop():
+    """ Stop recording messages, the file is closed """
+    global mFile
+
+    mLock.acquire()
+    if mFile is not None:
+        mFile.close()
+        mFile = None
+    mLock.release()
+
+
+def add(msg, params):
+    """ The given message has been posted """
+    offset = time.time() - mStarted
+
+    try:
+        record = cPickle.dumps((offset, mMsgNames[msg], params, True), cPickle.HIGHEST_PROTOCOL)
+    except:
+        summary = dict([(key, repr(value)) for (key, value) in params.iteritems()])
+        record  = cPickle.dumps((offset, mMsgNames[msg], summary, False), cPickle.HIGHEST_PROTOCOL)
+
+    mLock.acquire()
+    if mFile is not None:
+        mFile.write(record)
+    mLock.release()
+
+
+def load(filename):
+    """ Return the records of the given file, with their actual message, messages that no longer exist are dropped """
+    input   = gzip.open(filename, 'rb')
+    version = VERSION
+    records = []
+
+    try:
+        (version, started) = cPickle.load(input)
+
+        while version == VERSION:
+            record = list(cPickle.load(input))
+            record[REC_MSG] = getattr(consts, record[REC_MSG], None)
+
+            if record[REC_MSG] is not None:
+                records.append(tuple(record))
+    except EOFError:
+        pass
+    except:
+        # The application may have been killed while recording, keep what can be read
+        logger.error('Recording %s is truncated or invalid, %u records loaded' % (filename, len(records)))
+
+    input.close()
+
+    if version != VERSION:
+        logger.error('Recording %s has an unsupported version (%u)' % (filename, version))
+
+    return records
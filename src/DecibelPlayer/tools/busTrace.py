@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# Tracing of the messages dispatched to modules
+#
+# Once enabled, each call of a handler is recorded with the message, the module, the time spent waiting in a queue, and the execution time
+# The depth of the queue of threaded modules is recorded as well
+#
+# Records can be exported as Chrome trace events (to be loaded by chrome://tracing or Perfetto),
+# and summarized as a latency histogram per handler
+
+from __future__ import absolute_import
+
+import json, threading, time
+
+from collections import deque
+from . import consts
+from .log import logger
+
+
+# Oldest records are dropped once there are too many of them
+MAX_RECORDS = 200000
+
+# Upper bounds (in milliseconds) of the buckets of the latency histogram, the last bucket is unbounded
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# A record
+(
+    REC_MSG,       # The message
+    REC_MODULE,    # Name of the module that handled the message, or whose queue depth is given
+    REC_THREAD,    # Name of the thread that handled the message
+    REC_POSTED,    # When the message was posted, None for a queue depth
+    REC_STARTED,   # When the handler was called
+    REC_ENDED,     # When the handler returned, or the depth of the queue
+) = range(6)
+
+
+mEnabled = False
+mRecords = deque(maxlen=MAX_RECORDS)   # Appending to a deque is thread-safe, no need for a lock
+mMsgNames = dict([(value, name) for (name, value) in vars(consts).iteritems() if name.startswith('MSG_')])
+
+
+def isEnabled():
+    """ Return whether tracing is enabled """
+    return mEnabled
+
+
+def enable():
+    """ Start recording, previous records are discarded """
+    global mEnabled
+
+    mRecords.clear()
+    mEnabled = True
+
+
+def disable():
+    """ Stop recording, records are kept until tracing is enabled again """
+    global mEnabled
+
+    mEnabled = False
+
+
+def addDispatch(msg, module, posted, started, ended):
+    """ The handler of the given module has been called for the given message """
+    if mEnabled:
+        mRecords.append((msg, module, threading.currentThread().getName(), posted, started, ended))
+
+
+def addQueueDepth(module, depth):
+    """ The queue of the given threaded module contains depth messages """
+    if mEnabled:
+        mRecords.append((None, module, threading.currentThread().getName(), None, time.time(), depth))
+
+
+def getMsgName(msg):
+    """ Return the name of the given message (e.g., MSG_CMD_PLAY) """
+    return mMsgNames.get(msg, str(msg))
+
+
+# --== Export ==--
+
+
+def getTraceEvents():
+    """ Return the records as a list of Chrome trace events """
+    events  = []
+    records = list(mRecords)
+    threads = {}
+
+    if len(records) == 0:
+        return events
+
+    origin = min([record[REC_STARTED] for record in records])
+
+    for record in records:
+        tid = threads.setdefault(record[REC_THREAD], len(threads) + 1)
+        ts  = (record[REC_STARTED] - origin) * 1000000
+
+        if record[REC_POSTED] is None:
+            events.append({'name': 'Queue depth', 'ph': 'C', 'pid': 1, 'tid': tid, 'ts': ts, 'args': {record[REC_MODULE]: record[REC_ENDED]}})
+        else:
+            events.append({'name': '%s.%s' % (record[REC_MODULE], getMsgName(record[REC_MSG])),
+                           'cat':  record[REC_MODULE],
+                           'ph':   'X',
+                           'pid':  1,
+                           'tid':  tid,
+                           'ts':   ts,
+                           'dur':  (record[REC_ENDED] - record[REC_STARTED]) * 1000000,
+                           'args': {'wait (ms)': (record[REC_STARTED] - record[REC_POSTED]) * 1000}})
+
+    for (name, tid) in threads.iteritems():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}})
+
+    return events
+
+
+def saveTrace(filename):
+    """ Save the records to the given file, using the Chrome trace event format """
+    output = open(filename, 'w')
+    json.dump({'traceEvents': getTraceEvents(), 'displayTimeUnit': 'ms'}, output)
+    output.close()
+
+
+def getHistograms():
+    """
+        Return a dictionary associating each handler (module, message name) to a tuple (waitHistogram, execHistogram)
+        Each histogram gives the number of calls in each bucket of HISTOGRAM_BUCKETS, plus one for longer calls
+    """
+    histograms = {}
+
+    for record in list(mRecords):
+        if record[REC_POSTED] is not None:
+            handler = (record[REC_MODULE], getMsgName(record[REC_MSG]))
+
+            if handler not in histograms:
+                histograms[handler] = ([0] * (len(HISTOGRAM_BUCKETS) + 1), [0] * (len(HISTOGRAM_BUCKETS) + 1))
+
+            for (histogram, duration) in zip(histograms[handler], (record[REC_STARTED] - record[REC_POSTED], record[REC_ENDED] - record[REC_STARTED])):
+                bucket = 0
+                while bucket < len(HISTOGRAM_BUCKETS) and duration * 1000 > HISTOGRAM_BUCKETS[bucket]:
+                    bucket += 1
+                histogram[bucket] += 1
+
+    return histograms
+
+
+def saveHistograms(filename):
+    """ Save the latency histograms to the given file, handlers being sorted by decreasing number of slow calls """
+    histograms = getHistograms()
+    header     = ['<=%ums' % bound for bound in HISTOGRAM_BUCKETS] + ['>%ums' % HISTOGRAM_BUCKETS[-1]]
+    output     = open(filename, 'w')
+
+    output.write('%-60s %-5s %s\n' % ('Handler', '', ' '.join(['%8s' % title for title in header])))
+
+    for (handler, (waitHistogram, execHistogram)) in sorted(histograms.iteritems(), key = lambda item: item[1][1][::-1], reverse = True):
+        output.write('%-60s %-5s %s\n' % ('%s.%s' % handler, 'exec', ' '.join(['%8u' % count for count in execHistogram])))
+        output.write('%-60s %-5s %s\n' % ('',                'wait', ' '.join(['%8u' % count for count in waitHistogram])))
+
+    output.close()
+
+
+def toggle():
+    """ Enable tracing, or disable it and save the records """
+    if not mEnabled:
+        enable()
+        logger.info('Bus tracing enabled')
+    else:
+        disable()
+        saveTrace(consts.fileBusTrace)
+        saveHistograms(consts.fileBusLatency)
+        logger.info('Bus tracing disabled, saved to %s and %s' % (consts.fileBusTrace, consts.fileBusLatency))
@@ -47,7 +47,7 @@ dirBaseSrc = os.path.join(os.path.dirname(__file__), '..', '..')
 dirRes = os.path.join(dirBaseSrc, '..', 'res')
 dirDoc = os.path.join(dirBaseSrc, '..', 'doc')
 dirPix = os.path.join(dirBaseSrc, '..', 'pix')
-dirCfg = os.path.join(dirBaseCfg, appNameShort)
+dirCfg = os.environ.get('DECIBEL_CONFIG_DIR', os.path.join(dirBaseCfg, appNameShort))
 dirLog = os.path.join(dirCfg, 'Logs')
 
 dirLocale = os.path.join(dirBaseSrc, '..', 'locale')
@@ -83,9 +83,13 @@ fileImgCatInternet = os.path.join(dirPix, 'category-internet.png')
 
 
 # --- Files
-fileLog     = os.path.join(dirLog, 'log')
-filePrefs   = os.path.join(dirCfg, 'prefs.txt')
-fileLicense = os.path.join(dirDoc, 'LICENCE')
+fileLog        = os.path.join(dirLog, 'log')
+filePrefs      = os.path.join(dirCfg, 'prefs.txt')
+fileLicense    = os.path.join(dirDoc, 'LICENCE')
+fileBusTrace   = os.path.join(dirLog, 'bus-trace.json')
+fileBusLatency = os.path.join(dirLog, 'bus-latency.txt')
+fileManifest   = os.path.join(dirCfg, 'modules.txt')
+fileMetrics    = os.path.join(dirCfg, 'metrics.txt')
 
 
 # --- DBus constants
@@ -203,7 +207,8 @@ DND_TARGETS = {
 
     # Tracklist
     MSG_EVT_TRACK_MOVED,          # The position of the current track has changed    Parameters: 'hasPrevious', 'hasNext'
-    MSG_EVT_NEW_TRACKLIST,        # A new tracklist has been set                     Parameters: 'tracks', 'playtime'
+    MSG_EVT_NEW_TRACKLIST,        # Whole tracklist, see MSG_EVT_TRACKLIST_DELTA     Parameters: 'tracks', 'stats'
+    MSG_EVT_TRACKLIST_DELTA,      # The tracklist has been modified                  Parameters: 'delta', 'stats'
     MSG_EVT_REPEAT_CHANGED,       # The repeat function has been enabled/disabled    Parameters: 'repeat'
     MSG_EVT_TRACKLIST_NEW_SEL,    # The tracklist has a new set of selected tracks   Parameters: 'tracks'
 
@@ -220,4 +225,4 @@ DND_TARGETS = {
 
     # End value
     MSG_END_VALUE
-) = range(45)
+) = range(46)
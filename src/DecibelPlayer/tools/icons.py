@@ -19,11 +19,12 @@
 from __future__ import absolute_import
 
 import gtk
-from ..tools import consts
+from ..tools import consts, prefs
 
 
 __lbl               = None
 __dirMenuIcon       = None
+__findMenuIcon      = None
 __starMenuIcon      = None
 __infoMenuIcon      = None
 __prefsBtnIcon      = None
@@ -44,9 +45,12 @@ __catInternetIcon = None
 
 
 def __render(stock, size):
-    """ Return the given stock icon rendered at the given size """
+    """ Return the given stock icon rendered at the given size, a transparent one in headless mode (no theme without a display) """
     global __lbl
 
+    if prefs.isHeadless():
+        return nullMenuIcon()
+
     if __lbl is None:
         __lbl = gtk.Label()
 
@@ -63,6 +67,16 @@ def dirMenuIcon():
     return __dirMenuIcon
 
 
+def findMenuIcon():
+    """ Find """
+    global __findMenuIcon
+
+    if __findMenuIcon is None:
+        __findMenuIcon = __render(gtk.STOCK_FIND, gtk.ICON_SIZE_MENU)
+
+    return __findMenuIcon
+
+
 def dirToolbarIcon():
     """ Directories """
     global __dirToolbarIcon
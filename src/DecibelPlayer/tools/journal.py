@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+
+# Journal of the modifications made to a list (e.g., the tracklist), to save it without rewriting it entirely each time
+#
+# The file is a sequence of pickled records, the first one being a snapshot of the whole list
+# Each modification appends a splice (some items replacing a slice of the list) to the file
+# Once the splices are about as large as the list itself, the file is compacted into a single snapshot
+
+import cPickle, os
+
+
+# Records of the journal
+(
+    REC_SNAPSHOT,   # (REC_SNAPSHOT, items)
+    REC_SPLICE,     # (REC_SPLICE, start, end, items), items replace the slice [start:end] of the list
+) = range(2)
+
+
+# The file is never compacted while splices are smaller than this (in number of items)
+MIN_COMPACTION_SIZE = 1000
+
+
+class ListJournal:
+
+    def __init__(self, filename):
+        """ Constructor """
+        self.items       = []
+        self.filename    = filename
+        self.spliceSizes = 0   # Number of items (plus one per splice) appended to the file since the last snapshot
+
+
+    def __append(self, record):
+        """ Append the given record to the file """
+        output = open(self.filename, 'ab')
+        cPickle.dump(record, output, cPickle.HIGHEST_PROTOCOL)
+        output.close()
+
+
+    def exists(self):
+        """ Return whether the file of the journal exists """
+        return os.path.exists(self.filename)
+
+
+    def load(self):
+        """ Replay the journal and return the list it describes, may raise an exception if there's no valid snapshot """
+        items = None
+        input = open(self.filename, 'rb')
+        size  = os.path.getsize(self.filename)
+
+        while True:
+            position = input.tell()
+
+            try:
+                record = cPickle.load(input)
+            except:
+                # Either the end of the file, or a record that has not been entirely written (e.g., crash)
+                complete = (position == size)
+                break
+
+            if record[0] == REC_SNAPSHOT:
+                items            = record[1]
+                self.spliceSizes = 0
+            else:
+                items[record[1]:record[2]] = record[3]
+                self.spliceSizes          += len(record[3]) + 1
+
+        input.close()
+
+        if items is None:
+            raise Exception('No snapshot found in %s' % self.filename)
+
+        self.items = items
+
+        # Following records would be ignored after an incomplete one
+        if not complete:
+            self.compact()
+
+        return list(self.items)
+
+
+    def compact(self):
+        """ Replace the content of the file by a snapshot of the list """
+        output = open(self.filename + '.tmp', 'wb')
+        cPickle.dump((REC_SNAPSHOT, self.items), output, cPickle.HIGHEST_PROTOCOL)
+        output.close()
+        os.rename(self.filename + '.tmp', self.filename)
+
+        self.spliceSizes = 0
+
+
+    def set(self, items):
+        """ Replace the whole list """
+        self.items = list(items)
+        self.compact()
+
+
+    def splice(self, start, end, items):
+        """ Replace the slice [start:end] of the list by the given items """
+        self.items[start:end] = items
+
+        self.spliceSizes += len(items) + 1
+
+        if self.spliceSizes > max(len(self.items), MIN_COMPACTION_SIZE): self.compact()
+        else:                                                              self.__append((REC_SPLICE, start, end, items))
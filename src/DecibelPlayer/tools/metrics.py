@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# Registry of metrics describing the health of the application
+#
+# Counters only increase (e.g., tracks played), gauges give a current value (e.g., the depth of a queue),
+# and histograms count values falling into buckets (e.g., durations)
+# A gauge may be given a function instead of a value, it is then called whenever metrics are read
+#
+# Metrics are exposed through D-Bus (see the DBus module), and periodically saved to a file with one 'name value' per line
+
+from __future__ import absolute_import
+
+import os, threading, time
+
+from . import consts
+from .log import logger
+
+
+# How often (in seconds) metrics are saved
+SAVE_PERIOD = 60
+
+# Default upper bounds of the buckets of a histogram (e.g., durations in seconds), the last bucket is unbounded
+DEFAULT_BUCKETS = (0.001, 0.01, 0.1, 1, 10)
+
+
+mLock       = threading.Lock()   # Metrics may be updated by any thread
+mStarted    = time.time()
+mCounters   = {}
+mGauges     = {}                 # Values or functions giving them
+mHistograms = {}                 # Tuples (buckets, counts, [sum of values])
+
+
+def incCounter(name, value=1):
+    """ Increment the given counter, it is created if needed """
+    mLock.acquire()
+    mCounters[name] = mCounters.get(name, 0) + value
+    mLock.release()
+
+
+def setGauge(name, value):
+    """ Set the value of the given gauge, value may be a function giving it (called in the GTK main loop) """
+    mLock.acquire()
+    mGauges[name] = value
+    mLock.release()
+
+
+def removeGauge(name):
+    """ Remove the given gauge (e.g., when the module providing it is unloaded) """
+    mLock.acquire()
+    if name in mGauges:
+        del mGauges[name]
+    mLock.release()
+
+
+def addToHistogram(name, value, buckets=DEFAULT_BUCKETS):
+    """ Add the given value to the given histogram, buckets are used only when creating it """
+    mLock.acquire()
+
+    if name not in mHistograms:
+        mHistograms[name] = (buckets, [0] * (len(buckets) + 1), [0])
+
+    (buckets, counts, total) = mHistograms[name]
+
+    bucket = 0
+    while bucket < len(buckets) and value > buckets[bucket]:
+        bucket += 1
+
+    counts[bucket] += 1
+    total[0]       += value
+
+    mLock.release()
+
+
+def __getRSS():
+    """ Return the resident set size of the process in bytes, None if it is unknown """
+    try:
+        input = open('/proc/self/statm')
+        pages = int(input.read().split()[1])
+        input.close()
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except:
+        return None
+
+
+def getSnapshot():
+    """
+        Return a dictionary associating the name of each metric to its current value
+        A histogram gives the cumulated counts of its buckets (name_le_bound), as well as name_count and name_sum
+    """
+    mLock.acquire()
+    snapshot   = dict(mCounters)
+    gauges     = mGauges.items()
+    histograms = [(name, buckets, list(counts), total[0]) for (name, (buckets, counts, total)) in mHistograms.iteritems()]
+    mLock.release()
+
+    # Gauge functions are called without holding the lock, they may update other metrics
+    for (name, value) in gauges:
+        if callable(value):
+            try:    value = value()
+            except: value = None
+
+        if value is not None:
+            snapshot[name] = value
+
+    for (name, buckets, counts, total) in histograms:
+        cumulated = 0
+        for (bound, count) in zip(list(buckets) + ['inf'], counts):
+            cumulated += count
+            snapshot['%s_le_%s' % (name, bound)] = cumulated
+
+        snapshot[name + '_count'] = cumulated
+        snapshot[name + '_sum']   = total
+
+    rss = __getRSS()
+    if rss is not None:
+        snapshot['process_rss_bytes'] = rss
+
+    snapshot['process_uptime_seconds'] = time.time() - mStarted
+
+    return dict([(name, float(value)) for (name, value) in snapshot.iteritems()])
+
+
+def save(filename=consts.fileMetrics):
+    """ Save the current value of all metrics to the given file, which is replaced at once so that it is never read while incomplete """
+    snapshot = getSnapshot()
+
+    try:
+        output = open(filename + '.tmp', 'w')
+        output.writelines(['%s %s\n' % (name, repr(snapshot[name])) for name in sorted(snapshot)])
+        output.close()
+        os.rename(filename + '.tmp', filename)
+    except:
+        logger.error('Unable to save metrics to %s' % filename)
+
+    # This is also a timeout callback of the GTK main loop, which must be called again
+    return True
@@ -63,3 +63,9 @@ def getCmdLine():        return __appGlobals['cmdLine']
 # Main widgets' tree created by Glade
 def setWidgetsTree(tree): __appGlobals['wTree'] = tree
 def getWidgetsTree():     return __appGlobals['wTree']
+
+
+# Main loop of the headless mode (no GUI at all), None when the GUI is used
+def setHeadlessLoop(loop): __appGlobals['headlessLoop'] = loop
+def getHeadlessLoop():     return __appGlobals.get('headlessLoop', None)
+def isHeadless():          return getHeadlessLoop() is not None
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# On-demand profiling of the running application
+#
+# The GTK main loop is profiled as long as profiling is enabled, while worker threads (those of the pool and the dedicated
+# ones of threaded modules) are profiled only while executing a task, each of them with its own profiler
+# Statistics of all threads are merged and saved as a pstats file, to be analyzed with the pstats module or any compatible viewer
+#
+# Snapshots of the heap give the number of objects of each type tracked by the garbage collector, along with the variation
+# since the previous snapshot, which helps in finding leaks
+
+from __future__ import absolute_import
+
+import cProfile, gc, os, pstats, threading, time
+
+from . import consts
+from .log import logger
+
+
+mLock           = threading.Lock()   # Protects profilers from concurrent access
+mSession        = 0                  # Incremented each time profiling is enabled, so that late profilers of worker threads are discarded
+mMainProfiler   = None               # Profiler of the GTK main loop, None if profiling is disabled
+mThreadProfiles = {}                 # Profilers of worker threads that are not executing a task, associated to their thread
+mPrevHeapCounts = {}                 # Counts of the previous snapshot of the heap
+
+
+def isProfiling():
+    """ Return whether profiling is enabled """
+    return mMainProfiler is not None
+
+
+def __getFilename(prefix, extension):
+    """ Return a new file name in the configuration directory, based on the current date """
+    return os.path.join(consts.dirCfg, '%s-%s.%s' % (prefix, time.strftime('%Y%m%d-%H%M%S'), extension))
+
+
+def start():
+    """ Start profiling, must be called by the GTK main loop, return False if profiling was already enabled """
+    global mMainProfiler, mSession, mThreadProfiles
+
+    if mMainProfiler is not None:
+        return False
+
+    mLock.acquire()
+    mSession        += 1
+    mThreadProfiles  = {}
+    mMainProfiler    = cProfile.Profile()
+    mLock.release()
+
+    mMainProfiler.enable()
+    logger.info('Profiling enabled')
+
+    return True
+
+
+def stop():
+    """ Stop profiling, must be called by the GTK main loop, return the file where statistics have been saved, None if profiling was disabled """
+    global mMainProfiler, mThreadProfiles
+
+    if mMainProfiler is None:
+        return None
+
+    mMainProfiler.disable()
+
+    # Worker threads that are still executing a task have their profiler discarded when done, since the session changes
+    mLock.acquire()
+    profilers       = [mMainProfiler] + mThreadProfiles.values()
+    mMainProfiler   = None
+    mThreadProfiles = {}
+    mLock.release()
+
+    filename = __getFilename('profile', 'pstats')
+    stats    = pstats.Stats(profilers[0])
+
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+
+    stats.dump_stats(filename)
+    logger.info('Profiling disabled, saved to %s' % filename)
+
+    return filename
+
+
+def runcall(func, *args):
+    """ Call func(*args) in a worker thread, profiling it if profiling is enabled """
+    if mMainProfiler is None:
+        return func(*args)
+
+    thread = threading.currentThread()
+
+    # The profiler of the thread is removed while in use, so that stop() never reads it
+    mLock.acquire()
+    session  = mSession
+    profiler = mThreadProfiles.pop(thread, None)
+    mLock.release()
+
+    if profiler is None:
+        profiler = cProfile.Profile()
+
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        mLock.acquire()
+        if session == mSession and mMainProfiler is not None:
+            mThreadProfiles[thread] = profiler
+        mLock.release()
+
+
+def saveHeapSnapshot():
+    """ Save the number of objects of each type to a file, which is returned """
+    global mPrevHeapCounts
+
+    counts = {}
+    for obj in gc.get_objects():
+        objType = type(obj)
+        name    = '%s.%s' % (objType.__module__, objType.__name__)
+        counts[name] = counts.get(name, 0) + 1
+
+    filename = __getFilename('heap', 'txt')
+    output   = open(filename, 'w')
+
+    output.write('%-70s %10s %10s\n' % ('Type', 'Count', 'Delta'))
+    for (name, count) in sorted(counts.iteritems(), key = lambda item: item[1], reverse = True):
+        output.write('%-70s %10u %+10d\n' % (name, count, count - mPrevHeapCounts.get(name, 0)))
+
+    output.close()
+
+    mPrevHeapCounts = counts
+    logger.info('Heap snapshot saved to %s' % filename)
+
+    return filename
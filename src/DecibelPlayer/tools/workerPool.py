@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Author: Ingelrest François (Francois.Ingelrest@gmail.com)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+# A bounded pool of worker threads executing tasks (i.e., functions) in the order they are submitted
+#
+# Threads are started only when needed, and are never stopped: they are daemon threads, which won't prevent the application from exiting
+
+from __future__ import absolute_import
+
+import Queue, threading, traceback
+
+from . import profiler
+from .log import logger
+
+
+class WorkerPool:
+
+    def __init__(self, name, maxWorkers):
+        """ Constructor """
+        self.name          = name
+        self.lock          = threading.Lock()   # Protects the number of workers from concurrent access
+        self.tasks         = Queue.Queue(0)
+        self.nbWorkers     = 0
+        self.maxWorkers    = maxWorkers
+        self.nbIdleWorkers = 0
+
+
+    def __work(self):
+        """ Main loop of each worker """
+        while True:
+            (func, args) = self.tasks.get(True)
+
+            self.lock.acquire()
+            self.nbIdleWorkers -= 1
+            self.lock.release()
+
+            try:    profiler.runcall(func, *args)
+            except: logger.error('[%s] Unhandled exception in a task\n\n%s' % (self.name, traceback.format_exc()))
+
+            self.lock.acquire()
+            self.nbIdleWorkers += 1
+            self.lock.release()
+
+
+    def submit(self, func, *args):
+        """ Schedule func(*args) to be called by one of the workers """
+        self.lock.acquire()
+
+        # Start a new worker if idle ones are not enough to handle pending tasks
+        if self.tasks.qsize() >= self.nbIdleWorkers and self.nbWorkers < self.maxWorkers:
+            self.nbWorkers     += 1
+            self.nbIdleWorkers += 1
+            worker = threading.Thread(target=self.__work, name='%s-%u' % (self.name, self.nbWorkers))
+            worker.setDaemon(True)
+            worker.start()
+
+        self.tasks.put((func, args))
+        self.lock.release()
@@ -26,6 +26,7 @@ setup(
     entry_points = {
         'console_scripts': [
             'decibel = DecibelPlayer.player:main',
+            'decibel-library = DecibelPlayer.libraryd:main',
             ],
         },
     #package_data = {